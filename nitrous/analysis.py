@@ -0,0 +1,411 @@
+"""Static analysis of function declarations.
+
+Works on the syntax tree of function source before translation, so that
+results can be used both by the compiler and by Python side of function
+calls (eg. argument conversion).
+
+"""
+from __future__ import absolute_import
+import ast
+import weakref
+
+
+# Results for top-level queries; declarations are immutable once created.
+_written_args = weakref.WeakKeyDictionary()
+_captured_args = weakref.WeakKeyDictionary()
+_memory_effects = weakref.WeakKeyDictionary()
+
+# Memory effects, from least to most restrictive.
+_EFFECTS = ("none", "read", "write")
+
+
+def written_args(decl):
+    """Returns set of *decl* argument names whose contents may be modified.
+
+    An argument is considered written if compiled code can store through it,
+    either directly (item or attribute assignment), through local aliases
+    (eg. subslices) or by passing it on to other functions which write into
+    it. Passing a reference to a function whose body isn't known, such as C
+    functions or emitters, as well as returning it, is treated as a write.
+
+    """
+    try:
+        return _written_args[decl]
+    except KeyError:
+        return _written_args.setdefault(decl, _written(decl, []))
+
+
+def _written(decl, stack):
+    from .function import FunctionDecl
+
+    unknown = set(a for a in decl.args if _is_reference(decl.argtypes[a], 0))
+
+    if decl.pyfunc is None:
+        # Nothing is known about external functions.
+        return unknown
+
+    if decl in stack:
+        # Recursive calls don't write anything on their own.
+        return set()
+
+    try:
+        tree = _parse(decl)
+    except (IOError, TypeError):
+        # Source isn't available, eg. function defined interactively.
+        return unknown
+
+    aliases = _aliases(decl, tree)
+    written = set()
+
+    def mark(node):
+        for arg in _roots(decl, aliases, node, reference_only=True):
+            written.add(arg)
+
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Subscript, ast.Attribute)) and isinstance(node.ctx, ast.Store):
+            written.update(_roots(decl, aliases, node.value))
+
+        elif isinstance(node, ast.Return) and node.value is not None:
+            mark(node.value)
+
+        elif isinstance(node, ast.Call):
+            callee = _resolve(decl, node.func)
+
+            if isinstance(callee, FunctionDecl) and callee.pyfunc is not None:
+                callee_written = _written(callee, stack + [decl])
+                for param, value in zip(callee.args, node.args):
+                    if param in callee_written:
+                        mark(value)
+            else:
+                for value in node.args:
+                    mark(value)
+
+    return written
+
+
+def captured_args(decl):
+    """Returns set of *decl* reference arguments which may outlive the call.
+
+    An argument is captured if reference to its memory (or a local alias
+    of it) is returned, stored into memory or passed on to a function which
+    captures it. Same as with :func:`written_args`, anything passed to
+    functions whose body isn't known is considered captured.
+
+    """
+    try:
+        return _captured_args[decl]
+    except KeyError:
+        return _captured_args.setdefault(decl, _captured(decl, []))
+
+
+def _captured(decl, stack):
+    from .function import FunctionDecl
+
+    unknown = set(a for a in decl.args if _is_reference(decl.argtypes[a], 0))
+
+    if decl.pyfunc is None:
+        return unknown
+
+    if decl in stack:
+        return set()
+
+    try:
+        tree = _parse(decl)
+    except (IOError, TypeError):
+        return unknown
+
+    aliases = _aliases(decl, tree)
+    captured = set()
+
+    def mark(node):
+        captured.update(_roots(decl, aliases, node, reference_only=True))
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign):
+            if any(isinstance(t, (ast.Subscript, ast.Attribute)) for t in node.targets):
+                mark(node.value)
+
+        elif isinstance(node, ast.Return) and node.value is not None:
+            mark(node.value)
+
+        elif isinstance(node, ast.Call):
+            callee = _resolve(decl, node.func)
+
+            if isinstance(callee, FunctionDecl) and callee.pyfunc is not None:
+                callee_captured = _captured(callee, stack + [decl])
+                for param, value in zip(callee.args, node.args):
+                    if param in callee_captured:
+                        mark(value)
+            elif not _is_pure(decl, node.func):
+                for value in node.args:
+                    mark(value)
+
+    return captured
+
+
+def memory_effects(decl):
+    """Returns how *decl* accesses memory other than its own stack.
+
+    Result is ``"none"`` if function only depends on values of its
+    arguments, ``"read"`` if it also reads memory they refer to, and
+    ``"write"`` otherwise. Functions which print, return aggregates (stored
+    into memory provided by the caller) or call anything other than compiled
+    functions, type casts and :mod:`nitrous.lib.math` are considered to write.
+
+    """
+    try:
+        return _memory_effects[decl]
+    except KeyError:
+        return _memory_effects.setdefault(decl, _effects(decl, []))
+
+
+def _effects(decl, stack):
+    from .function import FunctionDecl
+    from .types import String
+
+    if decl.pyfunc is None or decl.aggregate_result or written_args(decl):
+        return "write"
+
+    if decl in stack:
+        return "none"
+
+    try:
+        tree = _parse(decl)
+    except (IOError, TypeError):
+        return "write"
+
+    if not _understood(tree):
+        # Written arguments may have been missed.
+        return "write"
+
+    if any(_is_reference(decl.argtypes[a], 0) or decl.argtypes[a] is String for a in decl.args):
+        effect = "read"
+    else:
+        effect = "none"
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Print):
+            return "write"
+
+        elif isinstance(node, ast.Call):
+            callee = _resolve(decl, node.func)
+
+            if isinstance(callee, FunctionDecl):
+                callee_effect = _effects(callee, stack + [decl])
+            elif _is_pure(decl, node.func):
+                continue
+            else:
+                callee_effect = "write"
+
+            effect = max(effect, callee_effect, key=_EFFECTS.index)
+            if effect == "write":
+                break
+
+    return effect
+
+
+def _understood(tree):
+    """Returns True if the analysis tracks references through all assignments in *tree*.
+
+    Assignments into names, items and attributes (or tuples of them) of
+    values which are either references derived from a name, or plain values
+    (constants, arithmetic and calls), are tracked precisely; the rest is
+    only handled conservatively.
+
+    """
+    def target_ok(t):
+        if isinstance(t, (ast.Tuple, ast.List)):
+            return all(target_ok(e) for e in t.elts)
+        return isinstance(t, ast.Name) or _chain_root(t) is not None
+
+    def value_ok(v):
+        if isinstance(v, (ast.Tuple, ast.List)):
+            return all(value_ok(e) for e in v.elts)
+        return isinstance(v, _VALUE_NODES + (ast.Call,)) or _chain_root(v) is not None
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign):
+            if not (all(target_ok(t) for t in node.targets) and value_ok(node.value)):
+                return False
+        elif isinstance(node, ast.AugAssign):
+            if not (target_ok(node.target) and value_ok(node.value)):
+                return False
+        elif isinstance(node, ast.For):
+            if not target_ok(node.target):
+                return False
+
+    return True
+
+
+def _chain_root(node):
+    """Returns name at the root of subscript and attribute chain *node*, or None."""
+    while isinstance(node, (ast.Subscript, ast.Attribute)):
+        node = node.value
+    return node if isinstance(node, ast.Name) else None
+
+
+def _is_pure(decl, node):
+    """Returns True if *node* refers to a callable known not to access memory."""
+    from .lib import range_, cast
+    from .lib import math
+
+    if isinstance(node, ast.Call):
+        # Template instance, eg. sqrt(Double)(x)
+        return _is_pure(decl, node.func)
+
+    callee = _resolve(decl, node)
+    if callee is range_ or callee is cast:
+        return True
+    if getattr(callee, "__module__", None) == math.__name__:
+        return True
+
+    # Types are called to cast values or create local aggregates.
+    return hasattr(callee, "tag") and hasattr(callee, "llvm_type")
+
+
+def _parse(decl):
+    """Returns syntax tree of the function definition."""
+    from inspect import getsourcelines
+    from textwrap import dedent
+
+    lines, _ = getsourcelines(decl.pyfunc)
+    return ast.parse(dedent("".join(lines))).body[0]
+
+
+def _aliases(decl, tree):
+    """Returns mapping of local names to arguments whose memory they refer to."""
+    aliases = {}
+
+    def bind(target, value):
+        """Adds roots of *value* to names in *target*; returns True if any were new."""
+        if isinstance(target, (ast.Tuple, ast.List)):
+            if isinstance(value, (ast.Tuple, ast.List)) and len(value.elts) == len(target.elts):
+                return any([bind(t, v) for t, v in zip(target.elts, value.elts)])
+            # Unpacking anything else; each name may refer to any part of it.
+            return any([bind(t, value) for t in target.elts])
+
+        if not isinstance(target, ast.Name) or target.id in decl.args:
+            return False
+
+        roots = _roots(decl, aliases, value, reference_only=True)
+        known = aliases.setdefault(target.id, set())
+        if roots <= known:
+            return False
+        known.update(roots)
+        return True
+
+    changed = True
+    while changed:
+        changed = False
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Assign):
+                for target in node.targets:
+                    changed |= bind(target, node.value)
+            elif isinstance(node, ast.AugAssign):
+                changed |= bind(node.target, node.value)
+            elif isinstance(node, ast.For):
+                changed |= bind(node.target, node.iter)
+
+    return aliases
+
+
+# Expressions which never result in references.
+_VALUE_NODES = (ast.Num, ast.Str, ast.BinOp, ast.UnaryOp, ast.Compare, ast.BoolOp)
+
+
+def _roots(decl, aliases, node, reference_only=False):
+    """Returns arguments which expression *node* is derived from.
+
+    Expression is usually a chain of subscripts and attributes over a name.
+    With *reference_only* set, values loaded from argument memory (as opposed
+    to references into it) are not considered to be derived from it.
+    Anything else is derived from all arguments its parts are derived from.
+
+    """
+    if isinstance(node, _VALUE_NODES):
+        # Constants and arithmetic results are plain values.
+        return set()
+    elif isinstance(node, ast.IfExp):
+        return (_roots(decl, aliases, node.body, reference_only) |
+                _roots(decl, aliases, node.orelse, reference_only))
+    elif isinstance(node, ast.Call):
+        if _returns_value(decl, node.func):
+            return set()
+        # Result might be derived from any of the arguments, eg. a subslice.
+        return set().union(*[_roots(decl, aliases, a, reference_only) for a in node.args])
+    elif isinstance(node, (ast.Tuple, ast.List)):
+        return set().union(*[_roots(decl, aliases, e, reference_only) for e in node.elts])
+
+    expr = node
+    depth = 0
+    while True:
+        if isinstance(node, ast.Subscript):
+            # Only indices reduce dimensions, ranges keep them.
+            index = node.slice
+            if isinstance(index, ast.Index):
+                depth += len(index.value.elts) if isinstance(index.value, ast.Tuple) else 1
+            elif isinstance(index, ast.ExtSlice):
+                depth += sum(isinstance(d, ast.Index) for d in index.dims)
+            node = node.value
+        elif isinstance(node, ast.Attribute):
+            # Aggregate fields (eg. slice data and shape) are
+            # references into the memory of their parent.
+            node = node.value
+        else:
+            break
+
+    if not isinstance(node, ast.Name):
+        if node is not expr:
+            # Items of something other than a name, eg. ``(x if c else y)[i]``;
+            # depth relative to the arguments isn't known.
+            return _roots(decl, aliases, node)
+        # Expression the analysis doesn't understand.
+        names = [n for n in ast.walk(node) if isinstance(n, ast.Name)]
+        return set().union(*[_roots(decl, aliases, n) for n in names])
+
+    if node.id in decl.args:
+        if reference_only and not _is_reference(decl.argtypes[node.id], depth):
+            return set()
+        return set([node.id])
+
+    # Depth of aliases relative to the arguments isn't tracked,
+    # so anything derived from them is assumed to be a reference.
+    return set(aliases.get(node.id, ()))
+
+
+def _returns_value(decl, node):
+    """Returns True if calling *node* results in a plain value rather than a reference."""
+    from .function import FunctionDecl
+    from .lib import cast
+    from .types import Scalar
+
+    callee = _resolve(decl, node)
+    if isinstance(callee, FunctionDecl):
+        return callee.restype is None or isinstance(callee.restype, Scalar)
+
+    # Casts may turn references into pointers.
+    return callee is not cast and _is_pure(decl, node)
+
+
+def _is_reference(t, depth):
+    """Returns True if indexing value of type *t* *depth* times yields a reference."""
+    from .types import Pointer, Reference
+
+    if isinstance(t, Reference):
+        shape = getattr(t.value_type, "shape", ())
+        return depth < max(len(shape), 1)
+
+    shape = getattr(t, "shape", None)
+    if shape is not None:
+        return depth < len(shape)
+
+    return isinstance(t, Pointer) and depth == 0
+
+
+def _resolve(decl, node):
+    """Returns object which *node* refers to in function globals, if any."""
+    if isinstance(node, ast.Name):
+        return decl.globals.get(node.id)
+    elif isinstance(node, ast.Attribute):
+        return getattr(_resolve(decl, node.value), node.attr, None)
+    return None
@@ -0,0 +1,165 @@
+"""Batched function calls.
+
+:meth:`Function.call_many <nitrous.function.Function.call_many>` applies a
+compiled function to every row of its argument columns. The loop over rows
+runs in native code: on first use, a small driver is compiled which loads
+arguments from column buffers, calls the function through its address and
+stores results into the output buffer, so the whole batch costs a single
+ctypes call.
+
+Only functions with scalar arguments and result can be called in batches.
+Columns are one-dimensional NumPy arrays, ``array.array`` or ctypes arrays
+with elements of corresponding argument types.
+
+"""
+from __future__ import absolute_import
+import ctypes
+
+from . import llvm
+from .types import Scalar, Pointer, String, Index, const_index
+
+
+def supported(decl):
+    """Returns True if function *decl* can be called in batches."""
+    types = [decl.argtypes[arg] for arg in decl.args]
+    if decl.restype is not None:
+        types.append(decl.restype)
+    return all(isinstance(t, Scalar) and t is not String for t in types)
+
+
+def emit_driver(module, decl, address):
+    """Adds loop calling function *decl* compiled at *address* to *module*.
+
+    The driver accepts pointer to each argument column, pointer to result
+    column (unless function returns nothing) and number of rows.
+
+    """
+    argtypes = [decl.argtypes[arg] for arg in decl.args]
+    columns = argtypes + ([decl.restype] if decl.restype is not None else [])
+
+    params = [Pointer(t).llvm_type for t in columns] + [Index.llvm_type]
+    ty = llvm.FunctionType(llvm.VoidType(), (llvm.TypeRef * len(params))(*params),
+                           len(params), False)
+    f = llvm.AddFunction(module, decl.__name__ + "__many", ty)
+
+    # Callee is referenced by its address; it lives in a different module.
+    restype = decl.restype.llvm_type if decl.restype is not None else llvm.VoidType()
+    callee_params = (llvm.TypeRef * len(argtypes))(*(t.llvm_type for t in argtypes))
+    callee_type = llvm.FunctionType(restype, callee_params, len(argtypes), False)
+
+    builder = llvm.CreateBuilder()
+    llvm.PositionBuilderAtEnd(builder, llvm.AppendBasicBlock(f, "entry"))
+
+    callee = llvm.BuildCast(builder, llvm.IntToPtr,
+                            llvm.ConstInt(Index.llvm_type, address, False),
+                            llvm.PointerType(callee_type, 0), "callee")
+    n = llvm.GetParam(f, len(columns))
+    i_ptr = llvm.BuildAlloca(builder, Index.llvm_type, "i.ptr")
+    llvm.BuildStore(builder, const_index(0), i_ptr)
+
+    cond_block = llvm.AppendBasicBlock(f, "loop.cond")
+    body_block = llvm.AppendBasicBlock(f, "loop.body")
+    exit_block = llvm.AppendBasicBlock(f, "loop.exit")
+    llvm.BuildBr(builder, cond_block)
+
+    llvm.PositionBuilderAtEnd(builder, cond_block)
+    i = llvm.BuildLoad(builder, i_ptr, "i")
+    llvm.BuildCondBr(builder, llvm.BuildICmp(builder, llvm.IntSLT, i, n, ""),
+                     body_block, exit_block)
+
+    llvm.PositionBuilderAtEnd(builder, body_block)
+
+    def gep(k):
+        return llvm.BuildGEP(builder, llvm.GetParam(f, k), ctypes.byref(i), 1, "")
+
+    args = [llvm.BuildLoad(builder, gep(k), "") for k in range(len(argtypes))]
+    result = llvm.BuildCall(builder, callee, (llvm.ValueRef * len(args))(*args), len(args), "")
+    if decl.restype is not None:
+        llvm.BuildStore(builder, result, gep(len(argtypes)))
+
+    llvm.BuildStore(builder, llvm.BuildAdd(builder, i, const_index(1), ""), i_ptr)
+    llvm.BuildBr(builder, cond_block)
+
+    llvm.PositionBuilderAtEnd(builder, exit_block)
+    llvm.BuildRetVoid(builder)
+
+    llvm.DisposeBuilder(builder)
+    return f
+
+
+class Driver(object):
+    """Compiled loop calling *func* at *address* for each row of argument columns."""
+
+    def __init__(self, func, address):
+        from functools import partial
+        from .cache import build_lock
+        from .module import Module, OptimizationProfile, _optimize, _create_engine, _target_cpu
+
+        decl = func.decl
+        if not supported(decl):
+            raise TypeError("{0}() arguments and result must be scalars".format(func.__name__))
+
+        #: Address of the function being called.
+        self.address = address
+        self.__name__ = func.__name__
+        self.argtypes = [decl.argtypes[arg] for arg in decl.args]
+        self.restype = decl.restype
+
+        columns = self.argtypes + ([self.restype] if self.restype is not None else [])
+        # Argument columns are only read; just the output one is written.
+        self.converters = [Pointer(t).converter(writable=False) for t in self.argtypes]
+        if self.restype is not None:
+            self.converters.append(Pointer(self.restype).converter(writable=True))
+
+        profile = OptimizationProfile()
+
+        # LLVM context is shared with module builds.
+        with build_lock(None, None):
+            module = llvm.ModuleCreateWithName("__n2o_batch_" + func.__name__)
+            driver = emit_driver(module, decl, address)
+            if llvm.VerifyFunction(driver, llvm.PrintMessageAction):
+                raise RuntimeError("Could not compile batch driver for {0}()".format(func.__name__))
+
+            _optimize(module, None, profile)
+            engine = _create_engine(module, profile, _target_cpu("host", None))
+            # Disposes of the engine and the module it owns along with the driver.
+            self.__module = Module(module, [partial(llvm.DisposeExecutionEngine, engine)])
+
+            c_argtypes = [Pointer(t).c_type for t in columns] + [Index.c_type]
+            proto = ctypes.CFUNCTYPE(None, *c_argtypes)
+            self.cfunc = proto(llvm.GetPointerToGlobal(engine, driver))
+
+    def __call__(self, columns, out=None):
+        if len(columns) != len(self.argtypes):
+            raise TypeError("{0}() takes exactly {1} columns ({2} given)"
+                            .format(self.__name__, len(self.argtypes), len(columns)))
+
+        if columns:
+            n = len(columns[0])
+        elif out is not None:
+            n = len(out)
+        else:
+            raise TypeError("Number of calls to {0}() is unknown; pass the out column"
+                            .format(self.__name__))
+
+        if any(len(c) != n for c in columns):
+            raise ValueError("Columns must have the same length")
+
+        if self.restype is not None:
+            if out is None:
+                out = _empty(self.restype, n)
+            elif len(out) < n:
+                raise ValueError("Output column is shorter than argument columns")
+            columns = columns + (out,)
+
+        self.cfunc(*([c(v) for c, v in zip(self.converters, columns)] + [n]))
+        return out
+
+
+def _empty(t, n):
+    """Returns uninitialized column of *n* values of scalar type *t*."""
+    try:
+        import numpy as np
+    except ImportError:
+        return (t.c_type * n)()
+    return np.empty(n, dtype=t.c_type)
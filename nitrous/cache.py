@@ -0,0 +1,341 @@
+"""Persistent content-addressed cache of compiled modules.
+
+Each module build is identified by a key derived from everything that can
+affect the generated code: function sources and signatures, options, all
+transitively referenced functions and constants, linked library sources, LLVM
+version and target triple, and nitrous itself. Built artifacts are stored in the cache directory
+under that key and loaded directly on subsequent builds.
+
+The cache directory is given explicitly to the module builder or through
+``NITROUS_CACHE_DIR`` environment variable; caching is disabled otherwise.
+
+Builds are coordinated through per-key lock files in the cache directory,
+so that each unique module is compiled only once per machine no matter how
+many processes request it simultaneously.
+
+"""
+from __future__ import absolute_import
+import ast
+import hashlib
+import os
+import threading
+import types
+
+from contextlib import contextmanager
+from . import llvm
+
+
+#: Environment variable holding the default cache directory.
+CACHE_DIR_VAR = "NITROUS_CACHE_DIR"
+
+# LLVM global context is shared by all builds and is not thread-safe,
+# so only one thread in the process can be building a module at any time.
+_build_lock = threading.RLock()
+
+
+def get_dir(cache_dir=None):
+    """Returns cache directory to use or None if caching is disabled.
+
+    Explicit *cache_dir* takes precedence over the environment setting.
+    Directory is created if it doesn't exist yet.
+
+    """
+    cache_dir = cache_dir or os.environ.get(CACHE_DIR_VAR)
+    if not cache_dir:
+        return None
+
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # Could have been created concurrently.
+            if not os.path.isdir(cache_dir):
+                raise
+
+    return cache_dir
+
+
+def lookup(cache_dir, key, suffix):
+    """Returns path to a cached artifact or None if it's not available."""
+    path = os.path.join(cache_dir, key + suffix)
+    return path if os.path.exists(path) else None
+
+
+def store(cache_dir, key, suffix, src_path):
+    """Copies built artifact at *src_path* into the cache; returns its new path.
+
+    Artifact is first copied into a temporary file in the same directory and
+    then renamed, so concurrent readers never observe partially written files.
+
+    """
+    import shutil
+    import tempfile
+
+    path = os.path.join(cache_dir, key + suffix)
+
+    fd, tmp_path = tempfile.mkstemp(prefix=key, suffix=".tmp", dir=cache_dir)
+    try:
+        with os.fdopen(fd, "wb") as dst, open(src_path, "rb") as src:
+            shutil.copyfileobj(src, dst)
+        os.rename(tmp_path, path)
+    except:
+        os.unlink(tmp_path)
+        raise
+
+    return path
+
+
+@contextmanager
+def build_lock(cache_dir, key):
+    """Holds exclusive right to build module identified by *key*.
+
+    Blocks until all other threads in this process have finished their builds
+    and, if *cache_dir* is set, until any other process building the same module
+    releases the lock file associated with *key*. Once the lock is acquired, the
+    caller is expected to check the cache again before building.
+
+    """
+    import fcntl
+
+    with _build_lock:
+        if not cache_dir:
+            yield
+        else:
+            # Lock files are left behind; removing them would race
+            # with processes which have already opened the same file.
+            with open(os.path.join(cache_dir, key + ".lock"), "a") as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def module_key(decls, libs=(), options=()):
+    """Returns a hex digest uniquely identifying module built from *decls*.
+
+    *libs* are either library names or :class:`~nitrous.module.CppLibrary`
+    instances linked into the module; *options* is a sequence of additional
+    ``(name, value)`` builder settings which affect the output.
+
+    """
+    h = hashlib.sha1()
+
+    _update(h, "llvm", llvm.GetVersion__().value)
+    _update(h, "triple", llvm.GetDefaultTargetTriple__().value)
+    # Translation and data layouts (eg. of slice descriptors) change
+    # between nitrous versions; modules built by others can't be reused.
+    _update(h, "nitrous", _package_digest())
+
+    for name, value in options:
+        _update(h, "option", name)
+        _fingerprint(h, value, set())
+
+    if dict(options).get("trampolines"):
+        # Trampolines are compiled against the Python C API.
+        _update(h, "python", _python_abi())
+
+    for lib in libs:
+        if isinstance(lib, basestring):
+            _update(h, "lib", lib)
+        else:
+            _update(h, "cpplib", repr(lib.compile_args))
+            for source in lib.sources:
+                with open(source, "rb") as f:
+                    _update(h, "source", f.read())
+
+    seen = set()
+    for decl in decls:
+        _fingerprint(h, decl, seen)
+
+    return h.hexdigest()
+
+
+_package_digests = []
+
+
+def _package_digest():
+    """Returns digest of nitrous sources and LLVM bindings; computed once per process."""
+    if not _package_digests:
+        h = hashlib.sha1()
+        root = os.path.dirname(os.path.abspath(__file__))
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith((".py", ".so")):
+                    path = os.path.join(dirpath, filename)
+                    with open(path, "rb") as f:
+                        _update(h, os.path.relpath(path, root), f.read())
+        _package_digests.append(h.hexdigest())
+
+    return _package_digests[0]
+
+
+def _python_abi():
+    """Returns string identifying Python C API and ABI of the running interpreter."""
+    import sys
+
+    return "{0}.{1} api={2} maxsize={3} maxunicode={4}".format(
+        sys.version_info[0], sys.version_info[1], sys.api_version, sys.maxsize, sys.maxunicode)
+
+
+def _update(h, *values):
+    """Adds a record of *values* to hash *h*."""
+    for v in values:
+        if isinstance(v, unicode):
+            v = v.encode("utf-8")
+        # Prefix every value with its length to make records unambiguous.
+        h.update("{0}:".format(len(v)))
+        h.update(v)
+
+
+def _fingerprint(h, value, seen):
+    """Adds a record of an arbitrary value which affects module output."""
+    from .function import FunctionDecl
+    from .module import OptimizationProfile
+
+    if isinstance(value, FunctionDecl):
+        _fingerprint_decl(h, value, seen)
+
+    elif isinstance(value, OptimizationProfile):
+        _update(h, "profile", repr(value))
+
+    elif value is None or isinstance(value, (bool, int, long, float, basestring)):
+        _update(h, type(value).__name__, repr(value))
+
+    elif isinstance(value, (tuple, list)):
+        _update(h, type(value).__name__, str(len(value)))
+        for v in value:
+            _fingerprint(h, v, seen)
+
+    elif isinstance(value, dict):
+        _update(h, "dict", str(len(value)))
+        for k in sorted(value):
+            _update(h, repr(k))
+            _fingerprint(h, value[k], seen)
+
+    elif isinstance(value, types.ModuleType):
+        _update(h, "module", value.__name__)
+
+    elif isinstance(value, types.FunctionType):
+        _fingerprint_pyfunc(h, value, seen)
+
+    elif hasattr(value, "tag") and hasattr(value, "llvm_type"):
+        # Nitrous data types are uniquely identified by their tag.
+        _update(h, "type", value.tag)
+
+    else:
+        # Anything else (eg. emitters) is recorded by its type only.
+        cls = type(value)
+        _update(h, "object", cls.__module__, cls.__name__)
+
+
+def _fingerprint_decl(h, decl, seen):
+    """Adds a record of function declaration and everything it references."""
+    from .function import _qualified_name
+
+    # Functions are referenced by name, but their contents are recorded
+    # only the first time to avoid infinite loops on recursive calls.
+    _update(h, "decl", _qualified_name("", decl))
+    if id(decl) in seen:
+        return
+    seen.add(id(decl))
+
+    _fingerprint(h, decl.restype, seen)
+    _fingerprint(h, [decl.argtypes[arg] for arg in decl.args], seen)
+    _fingerprint(h, decl.options, seen)
+    _fingerprint(h, decl.emitter, seen)
+
+    if decl.pyfunc is None:
+        # External functions don't have anything else to them.
+        return
+
+    source = _source(decl.pyfunc)
+    _update(h, "source", source)
+
+    # Record all global symbols which function refers to; these are
+    # compile-time constants, types and other functions.
+    for name in sorted(_referenced_names(source)):
+        if name in decl.globals:
+            _update(h, "global", name)
+            _fingerprint(h, decl.globals[name], seen)
+
+    # Modules are recorded by name only, so also record whatever is
+    # looked up through them (or any other global), eg. ``mylib.kernel``.
+    for path in sorted(_referenced_attributes(source)):
+        if path[0] in decl.globals:
+            value = _resolve_attribute(decl.globals[path[0]], path[1:])
+            if value is not _UNRESOLVED:
+                _update(h, "attribute", ".".join(path))
+                _fingerprint(h, value, seen)
+
+
+def _fingerprint_pyfunc(h, func, seen):
+    """Adds a record of a regular Python function (eg. an emitter factory)."""
+    _update(h, "pyfunc", func.__module__ or "", func.__name__)
+    if id(func) in seen:
+        return
+    seen.add(id(func))
+
+    _fingerprint_code(h, func.func_code)
+
+    # Templates capture their parameters (eg. data types) in closure.
+    for cell in func.func_closure or ():
+        _fingerprint(h, cell.cell_contents, seen)
+
+
+def _fingerprint_code(h, code):
+    """Adds a record of Python code object."""
+    _update(h, "code", code.co_code, repr(code.co_names))
+    for c in code.co_consts:
+        if isinstance(c, types.CodeType):
+            _fingerprint_code(h, c)
+        else:
+            _update(h, repr(c))
+
+
+def _source(pyfunc):
+    """Returns dedented function source; same as what is used for translation."""
+    from inspect import getsourcelines
+    from textwrap import dedent
+
+    lines, _ = getsourcelines(pyfunc)
+    return dedent("".join(lines))
+
+
+def _referenced_names(source):
+    """Returns set of names loaded anywhere in function *source*."""
+    return set(node.id for node in ast.walk(ast.parse(source))
+               if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load))
+
+
+def _referenced_attributes(source):
+    """Returns set of attribute paths rooted at names in function *source*.
+
+    Each path is a tuple of names, eg. ``("nitrous", "lib", "math", "sqrt")``
+    for ``nitrous.lib.math.sqrt``.
+
+    """
+    paths = set()
+    for node in ast.walk(ast.parse(source)):
+        path = []
+        while isinstance(node, ast.Attribute):
+            path.append(node.attr)
+            node = node.value
+        if path and isinstance(node, ast.Name):
+            path.append(node.id)
+            paths.add(tuple(reversed(path)))
+    return paths
+
+
+_UNRESOLVED = object()
+
+
+def _resolve_attribute(value, attrs):
+    """Returns result of looking up *attrs* chain on *value*, or ``_UNRESOLVED``."""
+    for attr in attrs:
+        try:
+            value = getattr(value, attr)
+        except Exception:
+            return _UNRESOLVED
+    return value
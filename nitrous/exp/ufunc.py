@@ -0,0 +1,197 @@
+"""NumPy universal functions from scalar kernels.
+
+:func:`vectorize` compiles a scalar Python function for each of the given
+type signatures, along with an inner loop that applies it element-wise,
+and registers the loops as a genuine :class:`numpy.ufunc`. NumPy then takes
+care of broadcasting, type resolution, ``out=`` arguments, ``reduce``,
+``accumulate`` and so on, while each inner loop calls the compiled kernel
+directly, so that it can be inlined and vectorized.
+
+"""
+import ctypes
+
+from nitrous import llvm
+from nitrous.types import Scalar, String, Pointer, Byte, Index, const_index
+
+
+__all__ = ["vectorize"]
+
+
+# Identity values understood by PyUFunc_FromFuncAndData.
+_IDENTITIES = {0: 0, 1: 1, None: -1}
+
+# Ufuncs don't reference their loops, types and names;
+# these have to stay alive along with the compiled module.
+_registry = []
+
+
+def vectorize(types, identity=None, **kwargs):
+    """Decorates scalar function to become a NumPy ufunc.
+
+    *types* is a sequence of loop signatures; each is either a scalar type,
+    used for all arguments and the result, or a tuple of result type followed
+    by argument types. *identity* is 0, 1 or None and is used by reductions
+    over empty arrays. Remaining *kwargs* are passed to the module builder.
+
+    Functions referenced by the kernel are resolved the same way as for
+    :func:`~nitrous.function.function`.
+
+    """
+    def wrapper(pyfunc):
+        from nitrous.function import function, FunctionDecl
+        from nitrous.module import so_module
+        import inspect
+        import numpy as np
+
+        if identity not in _IDENTITIES:
+            raise ValueError("Identity must be 0, 1 or None")
+
+        args = inspect.getargspec(pyfunc).args
+
+        parent_frame = inspect.currentframe().f_back
+        frame_globals = parent_frame.f_globals
+        frame_locals = parent_frame.f_locals
+        del parent_frame
+
+        kernels = []
+        loops = []
+        signatures = set()
+
+        for sig in types:
+            if isinstance(sig, tuple):
+                restype, argtypes = sig[0], sig[1:]
+            else:
+                restype, argtypes = sig, (sig,) * len(args)
+
+            if len(argtypes) != len(args):
+                raise TypeError("Signature {0} doesn't match {1}() arguments"
+                                .format(sig, pyfunc.__name__))
+            if not all(isinstance(t, Scalar) and t is not String for t in (restype,) + argtypes):
+                raise TypeError("Ufunc loops support only numeric scalar types")
+            if argtypes in signatures:
+                raise ValueError("Duplicate loop for argument types {0}".format(argtypes))
+            signatures.add(argtypes)
+
+            kernel = function(restype, **dict(zip(args, argtypes)))(pyfunc)
+            # Symbols picked up from this frame aren't meant for the kernel;
+            # keep only the built-ins and resolve the rest from its own scope.
+            kernel.globals = dict((k, kernel.globals[k]) for k in ("range", "True", "False"))
+            kernel.globals.update(pyfunc.func_globals)
+            kernel.globals.update(frame_globals)
+            kernel.globals.update(frame_locals)
+
+            loop = FunctionDecl(None, _LOOP_ARGTYPES, _LOOP_ARGS, None)
+            loop.__name__ = "__n2o_ufunc_{0}_{1}".format(
+                pyfunc.__name__, "".join(t.tag for t in (restype,) + argtypes))
+            loop.emitter = _loop_emitter(kernel)
+
+            kernels.append(kernel)
+            loops.append(loop)
+
+        m = so_module(kernels + loops, **kwargs)
+
+        n = len(loops)
+        funcs = (ctypes.c_void_p * n)(*(ctypes.cast(getattr(m, loop.__name__).cfunc,
+                                                    ctypes.c_void_p).value
+                                        for loop in loops))
+        data = (ctypes.c_void_p * n)()
+        type_nums = "".join(chr(np.dtype(t.c_type).num)
+                            for kernel in kernels
+                            for t in [kernel.argtypes[a] for a in args] + [kernel.restype])
+        name = pyfunc.__name__
+        doc = pyfunc.__doc__ or ""
+
+        ufunc = _from_func_and_data()(funcs, data, type_nums, n, len(args), 1,
+                                      _IDENTITIES[identity], name, doc, 0)
+
+        _registry.append((m, funcs, data, type_nums, name, doc))
+        return ufunc
+
+    return wrapper
+
+
+# Signature of PyUFuncGenericFunction: (char **args, npy_intp *dimensions,
+# npy_intp *steps, void *data).
+_LOOP_ARGS = ["args", "dimensions", "steps", "data"]
+_LOOP_ARGTYPES = {"args": Pointer(Pointer(Byte)),
+                  "dimensions": Pointer(Index),
+                  "steps": Pointer(Index),
+                  "data": Pointer(Byte)}
+
+
+def _loop_emitter(kernel):
+    """Returns emitter of inner loop calling *kernel* for each element."""
+
+    def emit(builder, func):
+        from nitrous.function import _get_or_create_function
+
+        f = func.llvm_func
+        callee, _ = _get_or_create_function(llvm.GetGlobalParent(f), kernel)
+        llvm.PositionBuilderAtEnd(builder, llvm.AppendBasicBlock(f, "entry"))
+
+        def load(p, k, name):
+            return llvm.BuildLoad(builder, llvm.BuildGEP(builder, p, ctypes.byref(const_index(k)),
+                                                         1, ""), name)
+
+        columns = [kernel.argtypes[a] for a in kernel.args] + [kernel.restype]
+        n = load(llvm.GetParam(f, 1), 0, "n")
+        ptrs = [load(llvm.GetParam(f, 0), k, "p") for k in range(len(columns))]
+        steps = [load(llvm.GetParam(f, 2), k, "step") for k in range(len(columns))]
+
+        i_ptr = llvm.BuildAlloca(builder, Index.llvm_type, "i.ptr")
+        llvm.BuildStore(builder, const_index(0), i_ptr)
+
+        cond_block = llvm.AppendBasicBlock(f, "loop.cond")
+        body_block = llvm.AppendBasicBlock(f, "loop.body")
+        exit_block = llvm.AppendBasicBlock(f, "loop.exit")
+        llvm.BuildBr(builder, cond_block)
+
+        llvm.PositionBuilderAtEnd(builder, cond_block)
+        i = llvm.BuildLoad(builder, i_ptr, "i")
+        llvm.BuildCondBr(builder, llvm.BuildICmp(builder, llvm.IntSLT, i, n, ""),
+                         body_block, exit_block)
+
+        llvm.PositionBuilderAtEnd(builder, body_block)
+
+        def element(k):
+            # Steps are in bytes and may differ between columns.
+            offset = llvm.BuildMul(builder, i, steps[k], "")
+            p = llvm.BuildGEP(builder, ptrs[k], ctypes.byref(offset), 1, "")
+            return llvm.BuildPointerCast(builder, p, Pointer(columns[k]).llvm_type, "")
+
+        values = [llvm.BuildLoad(builder, element(k), "") for k in range(len(columns) - 1)]
+        result = llvm.BuildCall(builder, callee, (llvm.ValueRef * len(values))(*values),
+                                len(values), "")
+        llvm.BuildStore(builder, result, element(len(columns) - 1))
+
+        llvm.BuildStore(builder, llvm.BuildAdd(builder, i, const_index(1), ""), i_ptr)
+        llvm.BuildBr(builder, cond_block)
+
+        llvm.PositionBuilderAtEnd(builder, exit_block)
+        llvm.BuildRetVoid(builder)
+
+    return emit
+
+
+def _from_func_and_data():
+    """Returns PyUFunc_FromFuncAndData from NumPy ufunc C API table."""
+    from numpy.core import umath
+
+    api = umath._UFUNC_API
+    if type(api).__name__ == "PyCapsule":
+        get_pointer = ctypes.pythonapi.PyCapsule_GetPointer
+        get_pointer.argtypes = [ctypes.py_object, ctypes.c_char_p]
+        get_pointer.restype = ctypes.c_void_p
+        table = get_pointer(api, None)
+    else:
+        get_pointer = ctypes.pythonapi.PyCObject_AsVoidPtr
+        get_pointer.argtypes = [ctypes.py_object]
+        get_pointer.restype = ctypes.c_void_p
+        table = get_pointer(api)
+
+    # Entry 0 is PyUFunc_Type, followed by PyUFunc_FromFuncAndData.
+    proto = ctypes.PYFUNCTYPE(ctypes.py_object,
+                              ctypes.POINTER(ctypes.c_void_p), ctypes.POINTER(ctypes.c_void_p),
+                              ctypes.c_char_p, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                              ctypes.c_int, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int)
+    return proto(ctypes.cast(table, ctypes.POINTER(ctypes.c_void_p))[1])
@@ -4,7 +4,9 @@ from nitrous.lib import ValueEmitter
 from nitrous.types.array import Slice
 
 
-__all__ = ["Vector", "get_element", "set_element", "load", "store"]
+__all__ = ["Vector", "get_element", "set_element", "load", "store",
+           "broadcast", "select", "shuffle", "permute",
+           "reduce_add", "reduce_min", "reduce_max"]
 
 
 class Vector(object):
@@ -14,6 +16,12 @@ class Vector(object):
     parallel using a single instruction (SIMD). A vector type requires a size *n*
     (number of elements) and an underlying *element_type*.
 
+    Arithmetic operates element-wise, with scalar operands of the element type
+    broadcast to all elements. Comparisons result in a mask vector of ``Bool``
+    elements, which can be combined with ``&``, ``|`` and ``^`` and used with
+    :func:`select`. Vectors of the same size are converted to other element
+    types with :func:`~nitrous.lib.cast`.
+
     """
 
     def __init__(self, element_type, n):
@@ -97,21 +105,123 @@ def set_element(T):
     return set_element_
 
 
+def broadcast(T):
+    """``broadcast(T)(e) -> v``
+
+    Creates a vector with *e* value in every element.
+
+    """
+
+    def broadcast_(e):
+
+        def emit(builder):
+            from nitrous.lib import cast
+
+            cast_e, _ = cast(e, T.element_type).emit(builder)
+            return llvm.build_splat(builder, cast_e, T.n, "v.splat"), T
+
+        return ValueEmitter(emit)
+
+    return broadcast_
+
+
 def fill(T):
     """``fill(T)(e) -> v``
 
-    Creates a vector with *e* value in every element.
+    Same as :func:`broadcast`.
 
     """
+    return broadcast(T)
 
-    @function(T, e=T.element_type)
-    def fill_(e):
-        v = T()
-        for i in range(T.n):
-            v = set_element(T)(v, i, e)
-        return v
 
-    return fill_
+def select(T):
+    """``select(T)(mask, a, b) -> v``
+
+    Creates a vector with elements of *a* where *mask* is set and elements
+    of *b* elsewhere. Either *a* or *b* can also be a scalar.
+
+    """
+
+    def select_(mask, a, b):
+
+        def emit(builder):
+            a_, b_ = (_splat(builder, T, x) for x in (a, b))
+            m = llvm.BuildCast(builder, llvm.Trunc, mask,
+                               llvm.VectorType(llvm.IntType(1), T.n), "mask")
+            return llvm.BuildSelect(builder, m, a_, b_, "v.select"), T
+
+        return ValueEmitter(emit)
+
+    return select_
+
+
+def shuffle(T, indices):
+    """``shuffle(T, indices)(a, b) -> v``
+
+    Creates a vector of elements at *indices* of *a* followed by *b*,
+    ie. index ``T.n`` refers to the first element of *b*. Indices have
+    to be known at compile time; result has as many elements as there
+    are *indices*.
+
+    """
+    _check_indices(indices, 2 * T.n)
+    R = Vector(T.element_type, len(indices))
+
+    def shuffle_(a, b):
+
+        def emit(builder):
+            return llvm.build_shuffle(builder, a, b, indices, "v.shuffle"), R
+
+        return ValueEmitter(emit)
+
+    return shuffle_
+
+
+def permute(T, indices):
+    """``permute(T, indices)(v) -> w``
+
+    Same as :func:`shuffle`, with elements taken from a single vector *v*.
+
+    """
+    _check_indices(indices, T.n)
+    R = Vector(T.element_type, len(indices))
+
+    def permute_(v):
+
+        def emit(builder):
+            return llvm.build_shuffle(builder, v, None, indices, "v.permute"), R
+
+        return ValueEmitter(emit)
+
+    return permute_
+
+
+def reduce_add(T):
+    """``reduce_add(T)(v) -> e``
+
+    Sum of vector *v* elements. Elements are added pairwise, so the
+    result can differ from sequential summation due to rounding.
+
+    """
+    return _reduction(T, _emit_add)
+
+
+def reduce_min(T):
+    """``reduce_min(T)(v) -> e``
+
+    Smallest of vector *v* elements.
+
+    """
+    return _reduction(T, _emit_min)
+
+
+def reduce_max(T):
+    """``reduce_max(T)(v) -> e``
+
+    Largest of vector *v* elements.
+
+    """
+    return _reduction(T, _emit_max)
 
 
 def load(T):
@@ -147,6 +257,79 @@ def store(T):
     return store_
 
 
+def _reduction(T, combine):
+    """Returns emitter template combining vector elements with *combine*."""
+
+    def reduce_(v):
+
+        def emit(builder):
+            # Halves are combined until the vector can't be split evenly,
+            # then remaining elements are combined one by one.
+            w, n = v, T.n
+            while n % 2 == 0 and n > 1:
+                n //= 2
+                lo = llvm.build_shuffle(builder, w, None, range(n), "v.lo")
+                hi = llvm.build_shuffle(builder, w, None, range(n, 2 * n), "v.hi")
+                w = combine(builder, lo, hi)
+
+            def element(k):
+                k = llvm.ConstInt(llvm.IntType(32), k, False)
+                return llvm.BuildExtractElement(builder, w, k, "v.get")
+
+            e = element(0)
+            for k in range(1, n):
+                e = combine(builder, e, element(k))
+
+            return e, T.element_type
+
+        return ValueEmitter(emit)
+
+    return reduce_
+
+
+def _emit_add(builder, a, b):
+    if _is_integer(a):
+        return llvm.BuildAdd(builder, a, b, "v.add")
+    return llvm.BuildFAdd(builder, a, b, "v.add")
+
+
+def _emit_min(builder, a, b):
+    return _emit_pick(builder, a, b, llvm.IntSLT, llvm.RealOLT)
+
+
+def _emit_max(builder, a, b):
+    return _emit_pick(builder, a, b, llvm.IntSGT, llvm.RealOGT)
+
+
+def _emit_pick(builder, a, b, int_predicate, real_predicate):
+    """Picks *a* where it compares to *b* by given predicate, *b* otherwise."""
+    if _is_integer(a):
+        cond = llvm.BuildICmp(builder, int_predicate, a, b, "")
+    else:
+        cond = llvm.BuildFCmp(builder, real_predicate, a, b, "")
+    return llvm.BuildSelect(builder, cond, a, b, "v.pick")
+
+
+def _is_integer(v):
+    ty = llvm.TypeOf(v)
+    if llvm.GetTypeKind(ty) == llvm.VectorTypeKind:
+        ty = llvm.GetElementType(ty)
+    return llvm.GetTypeKind(ty) == llvm.IntegerTypeKind
+
+
+def _splat(builder, T, v):
+    """Returns *v* broadcast to vector type *T* if it's a scalar."""
+    if llvm.GetTypeKind(llvm.TypeOf(v)) == llvm.VectorTypeKind:
+        return v
+    v, _ = broadcast(T)(v).emit(builder)
+    return v
+
+
+def _check_indices(indices, n):
+    if any(not 0 <= i < n for i in indices):
+        raise ValueError("Vector element indices must be between 0 and {0}".format(n - 1))
+
+
 def _index(builder, i):
     """Prepare 32-bit integer index for vector element access"""
     return llvm.BuildCast(builder, llvm.Trunc, i, llvm.IntType(32), "cast.i32")
@@ -23,6 +23,16 @@ _FLOATING_COMPARE_INST = llvm.BuildFCmp, {
     ast.NotEq: llvm.RealUNE,
 }
 
+# Comparisons of values known not to be NaN.
+_FLOATING_ORDERED_COMPARE_INST = llvm.BuildFCmp, {
+    ast.Eq: llvm.RealOEQ,
+    ast.Gt: llvm.RealOGT,
+    ast.GtE: llvm.RealOGE,
+    ast.Lt: llvm.RealOLT,
+    ast.LtE: llvm.RealOLE,
+    ast.NotEq: llvm.RealONE,
+}
+
 _INTEGER_BINARY_INST = {
     ast.Add: llvm.BuildAdd,
     ast.Sub: llvm.BuildSub,
@@ -56,6 +66,23 @@ _INTEGRAL_UNARY_INST = {
 
 _RESULT_ARG = "__result"
 
+#: Floating point relaxations which can be enabled with ``fastmath`` option.
+FASTMATH_FLAGS = ("reassoc", "nnan", "ninf", "arcp", "contract", "ftz")
+
+# Target option flags corresponding to the above.
+_FASTMATH_BITS = {
+    "reassoc": llvm.FastMathReassoc,
+    "nnan": llvm.FastMathNoNaNs,
+    "ninf": llvm.FastMathNoInfs,
+    "arcp": llvm.FastMathReciprocal,
+    "contract": llvm.FastMathContract,
+    "ftz": llvm.FastMathFlushToZero,
+}
+
+#: Policies for overlapping argument memory accepted by ``alias`` option.
+ALIAS_POLICIES = ("assume", "check", "none")
+
+
 class FunctionDecl(object):
     """Result of annotating a function with ``function()`` decorator.
 
@@ -73,9 +100,14 @@ class FunctionDecl(object):
         self.pyfunc = pyfunc
 
         # Options
-        self.options = {'cdiv': False, 'inline': False}
+        self.options = {'cdiv': False, 'inline': False, 'profile': None, 'result_pool': 0,
+                        'fastmath': (), 'alias': "assume"}
         self.globals = {}
 
+        # Callable emitting function body directly as IR, given
+        # the builder and :class:`Function`; used instead of *pyfunc*.
+        self.emitter = None
+
         # Gets populated by functools.wraps
         self.__name__ = None
 
@@ -97,19 +129,46 @@ class Function(object):
 
     """
 
-    def __init__(self, decl, llvm_func):
+    def __init__(self, decl, llvm_func, symbol=None):
+        from .analysis import written_args
+        from .types import converter
+
         self.decl = decl
         self.llvm_func = llvm_func
+        # Exported symbol name; can be given explicitly when the
+        # function is loaded from a prebuilt shared object.
+        self.symbol = symbol or (llvm.GetValueName(llvm_func) if llvm_func else None)
         # Copy globals, since these depend on individual function environment.
         self.globals = decl.globals.copy()
         self.__name__ = decl.__name__
 
-        self.converters = [
-            t.convert if hasattr(t, "convert") else lambda a: a
-            for t in [self.decl.argtypes[arg] for arg in self.decl.args]
-        ]
+        # Marshalling plan: per-argument converters, None for values
+        # passed to ctypes as is, are resolved once here rather than on
+        # every call; same for the aggregate result reference.
+        # Memory of arguments which are never written can be read-only.
+        written = written_args(self.decl)
+        self.converters = [converter(self.decl.argtypes[arg], arg in written)
+                           for arg in self.decl.args]
+        self.__passthrough = not any(self.converters)
+        self.__result_converter = (converter(self.decl.restype)
+                                   if self.decl.aggregate_result else None)
+
+        # Aggregate result types can replace returned value with a Python
+        # object, eg. Slice turns descriptors into NumPy arrays.
+        self.__wrap_result = (getattr(self.decl.restype.value_type, "wrap_result", None)
+                              if self.__result_converter is not None else None)
+
+        # Aggregate results can be taken round-robin from a pool of
+        # preallocated buffers, along with their converted references.
+        self.__result_pool = None
+        pool_size = self.decl.options.get("result_pool")
+        if self.__result_converter is not None and pool_size:
+            from itertools import cycle
+            results = [self.decl.restype.value_type.c_type() for _ in range(pool_size)]
+            self.__result_pool = cycle([(r, self.__result_converter(r)) for r in results])
 
         self.cfunc = None
+        self.__driver = None
 
     @property
     def _c_restype(self):
@@ -125,7 +184,7 @@ class Function(object):
 
     def wrap_so(self, so):
         """Populates ctypes function object from a loaded SO file."""
-        self.cfunc = getattr(so, llvm.GetValueName(self.llvm_func))
+        self.cfunc = getattr(so, self.symbol)
         self.cfunc.argtypes = self._c_argtypes
         self.cfunc.restype = self._c_restype
 
@@ -134,15 +193,70 @@ class Function(object):
         proto = ctypes.CFUNCTYPE(self._c_restype, *self._c_argtypes)
         self.cfunc = proto(llvm.GetPointerToGlobal(engine, self.llvm_func))
 
-    def __call__(self, *args):
-        c_args = [c(a) for c, a in zip(self.converters, args)]
-        if self.decl.aggregate_result:
-            result = self.decl.restype.value_type.c_type()
-            self.cfunc(*([self.decl.restype.convert(result)] + c_args))
+    def __call__(self, *args, **kwargs):
+        """Calls the compiled function.
+
+        Functions returning aggregates accept *out* keyword argument: a ctypes
+        object of the result type or a NumPy array of matching size, which the
+        result is written into and returned. It must not overlap any of the
+        arguments. Otherwise, result is either a new object or, if function
+        has ``result_pool`` option set, the next buffer from its pool.
+
+        Slice results are returned as NumPy arrays which take ownership of
+        data allocated by compiled code (see :mod:`nitrous.lib.memory`), or
+        keep the arguments alive otherwise, unless *out* descriptor is given.
+
+        """
+        out = kwargs.pop("out", None)
+        if kwargs:
+            raise TypeError("Unexpected keyword arguments: {0}".format(", ".join(kwargs)))
+
+        if self.__passthrough:
+            c_args = args
+        else:
+            c_args = [a if c is None else c(a) for c, a in zip(self.converters, args)]
+
+        if self.__result_converter is not None:
+            if out is not None:
+                result, ref = out, self.__result_converter(out)
+            elif self.__result_pool is not None:
+                result, ref = next(self.__result_pool)
+            else:
+                result = self.decl.restype.value_type.c_type()
+                ref = self.__result_converter(result)
+
+            self.cfunc(ref, *c_args)
+            if self.__wrap_result is not None and out is None:
+                return self.__wrap_result(result, tuple(args) + tuple(c_args))
             return result
+
+        elif out is not None:
+            raise TypeError("{0}() doesn't return an aggregate value".format(self.__name__))
+
         else:
             return self.cfunc(*c_args)
 
+    def call_many(self, *columns, **kwargs):
+        """Calls function for each row of argument *columns* in a native loop.
+
+        Results are stored into *out* column, which is allocated if not given,
+        and returned. See :mod:`nitrous.batch` for details.
+
+        """
+        from . import batch
+
+        out = kwargs.pop("out", None)
+        if kwargs:
+            raise TypeError("Unexpected keyword arguments: {0}".format(", ".join(kwargs)))
+
+        # Driver is compiled against the current function code and
+        # has to be rebuilt if the code gets replaced.
+        address = ctypes.cast(self.cfunc, ctypes.c_void_p).value
+        if self.__driver is None or self.__driver.address != address:
+            self.__driver = batch.Driver(self, address)
+
+        return self.__driver(columns, out)
+
 
 def function(restype=None, **kwargs):
     """Decorate an existing function with signature type annotations.
@@ -194,19 +308,82 @@ def function(restype=None, **kwargs):
     return wrapper
 
 
-def options(cdiv=False, inline=False):
+def options(cdiv=False, inline=False, profile=None, result_pool=0, fastmath=False,
+            alias="assume"):
     """Set behavioural options which affect the generated code.
 
     :param cdiv: Set ``True`` to match C behaviour when performing integer division.
     :param inline: Set ``True`` to always inline the function.
+    :param profile: :class:`~nitrous.module.OptimizationProfile` to compile the
+        function with, overriding the one given to module builder.
+    :param result_pool: Number of preallocated buffers to cycle through when
+        returning aggregate values to Python. Each buffer is overwritten by
+        a later call, so results have to be copied if they're kept around.
+    :param fastmath: Floating point relaxations allowed in the function; either
+        ``True`` for all of them or a sequence of names from :data:`FASTMATH_FLAGS`:
+
+        * ``"reassoc"`` -- reassociate operations;
+        * ``"nnan"``, ``"ninf"`` -- assume no values are NaN or infinite;
+        * ``"arcp"`` -- use reciprocal approximations instead of division;
+        * ``"contract"`` -- fuse multiply and add into FMA;
+        * ``"ftz"`` -- flush denormal results and operands to zero.
+
+        LLVM controls ``"reassoc"`` and ``"arcp"`` with a single code generation
+        option, so they can only be given together.
+    :param alias: How memory of pointer, slice and array arguments may overlap:
+
+        * ``"assume"`` -- arguments never overlap; calls which pass overlapping
+          memory have undefined behaviour;
+        * ``"check"`` -- arguments written by the function are tested for overlap
+          on entry, running code optimized for separate memory when they don't;
+        * ``"none"`` -- arguments may overlap, nothing is assumed about them.
 
     """
+    fastmath = _fastmath_flags(fastmath)
+    if alias not in ALIAS_POLICIES:
+        raise ValueError("Unknown alias policy '{0}', expected one of: {1}"
+                         .format(alias, ", ".join(ALIAS_POLICIES)))
+
     def wrapper(decl):
-        decl.options.update(cdiv=cdiv, inline=inline)
+        decl.options.update(cdiv=cdiv, inline=inline, profile=profile, result_pool=result_pool,
+                            fastmath=fastmath, alias=alias)
         return decl
     return wrapper
 
 
+def _fastmath_flags(value):
+    """Returns sorted tuple of fast math flags given to :func:`options`."""
+    if value is True:
+        return tuple(sorted(FASTMATH_FLAGS))
+    if not value:
+        return ()
+    if isinstance(value, basestring):
+        value = (value,)
+
+    flags = set(value)
+    unknown = flags.difference(FASTMATH_FLAGS)
+    if unknown:
+        raise ValueError("Unknown fastmath flags: {0}".format(", ".join(sorted(unknown))))
+
+    if len(flags.intersection(("reassoc", "arcp"))) == 1:
+        raise ValueError("Fastmath flags 'reassoc' and 'arcp' must be given together")
+
+    return tuple(sorted(flags))
+
+
+def _fastmath_bits(decls):
+    """Returns target fast math flags (``llvm.FastMath*``) for module built from *decls*.
+
+    Target options apply to the whole module, so only relaxations
+    allowed by every function in it are enabled.
+
+    """
+    flags = set(FASTMATH_FLAGS)
+    for decl in decls:
+        flags.intersection_update(decl.options.get("fastmath", ()))
+    return reduce(lambda bits, f: bits | _FASTMATH_BITS[f], flags, 0)
+
+
 def c_function(name, restype, argtypes):
     """Declares a external C function.
 
@@ -279,6 +456,10 @@ class FunctionBuilder(ast.NodeVisitor):
         # Stack of information for current loop and its parent ones.
         self.loop_info = []
 
+        # Storage which the next visited call should write its aggregate
+        # result into; set while translating returned expression.
+        self.return_slot = None
+
         # Push nodes on the stack as we're traversing down the tree,
         # pop them back when we're done. This is useful for error reporting
         # since not all nodes (eg. Slice) have the lineno attribute. In this
@@ -491,7 +672,19 @@ class FunctionBuilder(ast.NodeVisitor):
             raise NotImplementedError("Unsupported subscript context {0}".format(node.ctx))
 
     def visit_Slice(self, node):
-        raise NotImplementedError("Slices are not supported")
+        """Pushes range of indices, which makes subscript produce a view."""
+        from .types.array import IndexRange
+
+        if node.step is not None and not (isinstance(node.step, ast.Name) and node.step.id == "None"):
+            raise NotImplementedError("Slice steps are not supported")
+
+        start = self.r_visit(node.lower) if node.lower is not None else None
+        stop = self.r_visit(node.upper) if node.upper is not None else None
+        self.push((IndexRange(start, stop),))
+
+    def visit_ExtSlice(self, node):
+        # Dimensions push tuples of indices and ranges; join them.
+        self.push(sum((self.r_visit(d) for d in node.dims), ()))
 
     def visit_Delete(self, node):
         raise NotImplementedError("`del`etions are not supported")
@@ -519,10 +712,14 @@ class FunctionBuilder(ast.NodeVisitor):
             llvm.BuildRetVoid(self.builder)
 
         elif self.decl.aggregate_result:
-            # Copy return value into provided storage.
-            v = self.r_visit(node.value)
             result = self.load(_RESULT_ARG)
-            llvm.BuildStore(self.builder, llvm.BuildLoad(self.builder, v, "v"), result)
+            # Returned call results are written directly into provided
+            # storage; anything else has to be copied there.
+            self.return_slot = result
+            v = self.r_visit(node.value)
+            self.return_slot = None
+            if llvm.address_of(v) != llvm.address_of(result):
+                llvm.BuildStore(self.builder, llvm.BuildLoad(self.builder, v, "v"), result)
             llvm.BuildRet(self.builder, result)
 
         else:
@@ -535,7 +732,7 @@ class FunctionBuilder(ast.NodeVisitor):
     def visit_UnaryOp(self, node):
         rhs = self.r_visit(node.operand)
 
-        kind = llvm.GetTypeKind(llvm.TypeOf(rhs))
+        kind = _scalar_kind(llvm.TypeOf(rhs))
         op_type = type(node.op)
 
         if op_type == ast.Not:
@@ -552,20 +749,49 @@ class FunctionBuilder(ast.NodeVisitor):
         self.push(v, self.typeof(rhs))
 
     def visit_BinOp(self, node):
+        if self._contractible(node):
+            self._emit_contraction(node)
+            return
+
         lhs = self.r_visit(node.left)
         rhs = self.r_visit(node.right)
-        op = node.op
+        lhs, rhs = self._splat_operands(lhs, rhs)
+
+        v = self._emit_binary_op(node.op, lhs, rhs)
+        # Assuming binary operations return values of the same type as operands.
+        self.push(v, self.typeof(lhs))
+
+    def _splat_operands(self, *values):
+        """Broadcasts scalar *values* mixed with vectors of the same element type.
+
+        Returns the values, with scalars replaced by vectors if there are any.
 
+        """
+        kinds = [llvm.GetTypeKind(llvm.TypeOf(v)) for v in values]
+        if llvm.VectorTypeKind not in kinds:
+            return values
+
+        vector = values[kinds.index(llvm.VectorTypeKind)]
+        ty = llvm.TypeOf(vector)
+        T = self.typeof(vector)
+
+        def splat(v):
+            if not llvm.types_equal(llvm.TypeOf(v), llvm.GetElementType(ty)):
+                # Leave mismatched operands to be reported as such.
+                return v
+            v = llvm.build_splat(self.builder, v, llvm.GetVectorSize(ty), "splat")
+            self.types[llvm.address_of(v)] = T
+            return v
+
+        return tuple(v if k == llvm.VectorTypeKind else splat(v) for v, k in zip(values, kinds))
+
+    def _emit_binary_op(self, op, lhs, rhs):
         ty = llvm.TypeOf(lhs)
         if not llvm.types_equal(ty, llvm.TypeOf(rhs)):
             raise TypeError("Conflicting operand types for {0}: {1} and {2}"
                             .format(op, self.typeof(lhs), self.typeof(rhs)))
 
-        # Vectors use same ops as their element types.
-        if llvm.GetTypeKind(ty) == llvm.VectorTypeKind:
-            ty = llvm.GetElementType(ty)
-
-        kind = llvm.GetTypeKind(ty)
+        kind = _scalar_kind(ty)
 
         if kind == llvm.IntegerTypeKind:
             div = llvm.BuildSDiv if self.opts["cdiv"] else llvm.build_py_idiv
@@ -576,9 +802,48 @@ class FunctionBuilder(ast.NodeVisitor):
             raise TypeError("Unsupported operand types for {0}: {1} and {2}"
                             .format(op, self.typeof(lhs), self.typeof(rhs)))
 
-        v = inst(self.builder, lhs, rhs, type(op).__name__.lower())
-        # Assuming binary operations return values of the same type as operands.
-        self.push(v, self.typeof(lhs))
+        return inst(self.builder, lhs, rhs, type(op).__name__.lower())
+
+    def _contractible(self, node):
+        """Returns True if *node* adds to or subtracts from a product which can be fused."""
+        return ("contract" in self.opts["fastmath"] and
+                isinstance(node.op, (ast.Add, ast.Sub)) and
+                any(isinstance(n, ast.BinOp) and isinstance(n.op, ast.Mult)
+                    for n in (node.left, node.right)))
+
+    def _emit_contraction(self, node):
+        """Emits ``a * b +/- c`` (or ``c +/- a * b``) as a fused multiply-add."""
+        product_left = isinstance(node.left, ast.BinOp) and isinstance(node.left.op, ast.Mult)
+        product = node.left if product_left else node.right
+
+        # Operands are evaluated in the same order as they would be otherwise.
+        if product_left:
+            a, b = self.r_visit(product.left), self.r_visit(product.right)
+            c = self.r_visit(node.right)
+        else:
+            c = self.r_visit(node.left)
+            a, b = self.r_visit(product.left), self.r_visit(product.right)
+
+        a, b, c = self._splat_operands(a, b, c)
+        ty = llvm.TypeOf(a)
+        if (_scalar_kind(ty) not in (llvm.FloatTypeKind, llvm.DoubleTypeKind) or
+                not all(llvm.types_equal(ty, llvm.TypeOf(v)) for v in (b, c))):
+            # Nothing to fuse; integers and mismatched operands take the usual route.
+            ab = self._emit_binary_op(product.op, a, b)
+            lhs, rhs = (ab, c) if product_left else (c, ab)
+            self.push(self._emit_binary_op(node.op, lhs, rhs), self.typeof(a))
+            return
+
+        if isinstance(node.op, ast.Sub):
+            # a * b - c = fma(a, b, -c); c - a * b = fma(-a, b, c)
+            if product_left:
+                c = llvm.BuildFNeg(self.builder, c, "neg")
+            else:
+                a = llvm.BuildFNeg(self.builder, a, "neg")
+
+        fmuladd = llvm.get_intrinsic(self.builder, "fmuladd", (llvm.TypeRef * 1)(ty))
+        v = llvm.BuildCall(self.builder, fmuladd, (llvm.ValueRef * 3)(a, b, c), 3, "fma")
+        self.push(v, self.typeof(a))
 
     def visit_BoolOp(self, node):
         from .types import Bool
@@ -598,6 +863,7 @@ class FunctionBuilder(ast.NodeVisitor):
 
         lhs = self.r_visit(node.left)
         rhs = self.r_visit(node.comparators[0])
+        lhs, rhs = self._splat_operands(lhs, rhs)
         op = node.ops[0]
 
         ty = llvm.TypeOf(lhs)
@@ -605,21 +871,29 @@ class FunctionBuilder(ast.NodeVisitor):
             raise TypeError("Conflicting operand types for {0}: {1} and {2}"
                             .format(op, self.typeof(lhs), self.typeof(rhs)))
 
-        # Vectors use same ops as their element types.
-        if llvm.GetTypeKind(ty) == llvm.VectorTypeKind:
-            ty = llvm.GetElementType(ty)
-
-        kind = llvm.GetTypeKind(ty)
+        kind = _scalar_kind(ty)
         if kind in (llvm.IntegerTypeKind, llvm.PointerTypeKind):
             inst, ops = _INTEGER_COMPARE_INST
         elif kind in (llvm.FloatTypeKind, llvm.DoubleTypeKind):
-            inst, ops = _FLOATING_COMPARE_INST
+            # Ordered comparisons are cheaper, but differ for NaN operands.
+            if "nnan" in self.opts["fastmath"]:
+                inst, ops = _FLOATING_ORDERED_COMPARE_INST
+            else:
+                inst, ops = _FLOATING_COMPARE_INST
         else:
             raise TypeError("Cannot compare {0} with {1}"
                             .format(self.typeof(lhs), self.typeof(rhs)))
 
         v = inst(self.builder, ops[type(op)], lhs, rhs, "cmp")
-        self.push(_extend_bool(self.builder, v), Bool)
+
+        if llvm.GetTypeKind(ty) == llvm.VectorTypeKind:
+            # Vectors are compared element-wise, resulting in a mask of booleans.
+            from .exp.vector import Vector
+
+            mask = Vector(Bool, llvm.GetVectorSize(ty))
+            self.push(llvm.BuildCast(self.builder, llvm.ZExt, v, mask.llvm_type, "mask"), mask)
+        else:
+            self.push(_extend_bool(self.builder, v), Bool)
 
     def visit_IfExp(self, node):
         test_expr = self._truncate_bool(self.r_visit(node.test))
@@ -848,6 +1122,9 @@ class FunctionBuilder(ast.NodeVisitor):
         llvm.BuildBr(self.builder, exit_bb)
 
     def visit_Call(self, node):
+        # Return slot only applies to the outermost call.
+        slot, self.return_slot = self.return_slot, None
+
         func = self.r_visit(node.func)
         args = [self.r_visit(a) for a in node.args]
         result_type = None
@@ -861,8 +1138,12 @@ class FunctionBuilder(ast.NodeVisitor):
                 llvm.BuildCall(self.builder, llvm_func, args_type(*args), len(args), "")
 
             elif func.aggregate_result:
-                # Allocate empt aggregate value and pass it as first argument.
-                result, _ = func.restype.value_type().emit(self.builder)
+                # Pass storage for the aggregate value as first argument; either
+                # the one returned from current function, or a new empty value.
+                if slot is not None and func.restype.value_type.tag == self.decl.restype.value_type.tag:
+                    result = slot
+                else:
+                    result, _ = func.restype.value_type().emit(self.builder)
                 args = [result] + args
                 args_type = llvm.ValueRef * len(args)
                 llvm.BuildCall(self.builder, llvm_func, args_type(*args), len(args), "")
@@ -1011,25 +1292,66 @@ class UnpackAugAssign(ast.NodeTransformer):
         return copy_location(assign, node)
 
 
-def emit_body(builder, func):
+def emit_body(builder, func, stats=None, exported=True):
     """Emits function body IR.
 
     Expects function already is declared and referenced as func.llvm_func.
+    Time spent parsing and emitting is recorded in build *stats*, if given.
+    Functions which aren't *exported* are only called from compiled code.
 
     """
-    from .exceptions import TranslationError
     from inspect import getsourcelines
     from textwrap import dedent
+    from time import time
+
+    t0 = time()
 
     # ast.parse returns us a module, first function there is what we're parsing.
     lines, _ = getsourcelines(func.decl.pyfunc)
     func_source = dedent("".join(lines))
     func_body = ast.parse(func_source).body[0].body
 
-    # Emit function body IR
+    t1 = time()
+
+    # Slice descriptors are unpacked, floating point mode is set and
+    # arguments are checked for overlap by entry thunk; body goes to
+    # a separate function (or two) in that case.
+    unpacked = _unpacked_args(func.decl)
+    ftz = _flushes_to_zero(func.decl)
+    checks = [] if func.decl.options["inline"] else _alias_checks(func.decl)
+    if not (exported or ftz or checks):
+        # Body behind the thunk can't be inlined; helpers are better off
+        # inlined into their callers, which have descriptors unpacked already.
+        unpacked = []
+    if unpacked or ftz or checks:
+        bodies = _emit_entry_thunk(func, unpacked, ftz, checks)
+    else:
+        bodies = [func.llvm_func]
+
+    new_funcs = []
+    for llvm_func in bodies:
+        new_funcs.extend(_emit_function_body(builder, func, llvm_func, unpacked,
+                                             func_body, func_source))
+
+    if stats is not None:
+        stats.record("parse", t1 - t0, func.symbol)
+        stats.record("emit", time() - t1, func.symbol)
+
+    return new_funcs
+
+
+def _emit_function_body(builder, func, llvm_func, unpacked, func_body, func_source):
+    """Translates *func_body* statements into *llvm_func*; returns newly referenced functions.
+
+    *llvm_func* is either *func* itself, or its body function
+    taking data pointers of *unpacked* slices (see :func:`_emit_entry_thunk`).
+
+    """
+    from .exceptions import TranslationError
+
     b = FunctionBuilder(builder, func.decl, func.decl.options)
 
-    entry_bb = llvm.AppendBasicBlock(func.llvm_func, "entry")
+    entry_bb = llvm.AppendBasicBlock(llvm_func, "entry")
     llvm.PositionBuilderAtEnd(builder, entry_bb)
 
     # Populate global symbols
@@ -1043,16 +1365,32 @@ def emit_body(builder, func):
     if func.decl.aggregate_result:
         # Storage for aggregate return values is passed from caller
         # through special zeroth argument.
-        param = llvm.GetParam(func.llvm_func, 0)
+        param = llvm.GetParam(llvm_func, 0)
         llvm.SetValueName(param, _RESULT_ARG)
         b.store(_RESULT_ARG, param, func.decl.restype)
         arg_start = 1
 
     for i, name in enumerate(func.decl.args, arg_start):
-        param = llvm.GetParam(func.llvm_func, i)
+        param = llvm.GetParam(llvm_func, i)
         llvm.SetValueName(param, name)
         b.store(name, param, func.decl.argtypes[name])
 
+    # Unpacked slices get a local copy of their descriptor, with data
+    # pointer from the extra parameter. Copy doesn't escape unless passed
+    # on to other functions, so the optimizer turns its fields into
+    # registers which stay valid regardless of stores to slice data.
+    data_start = arg_start + len(func.decl.args)
+    for i, name in enumerate(unpacked, data_start):
+        T = func.decl.argtypes[name].value_type
+        data = llvm.GetParam(llvm_func, i)
+        llvm.SetValueName(data, name + ".data")
+
+        param = llvm.GetParam(llvm_func, arg_start + func.decl.args.index(name))
+        local = entry_alloca(builder, T.llvm_type, name)
+        llvm.BuildStore(builder, llvm.BuildLoad(builder, param, ""), local)
+        T._struct.emit_setattr(builder, local, "data", data)
+        b.store(name, local, func.decl.argtypes[name])
+
     try:
         for node in func_body:
             node = UnpackAugAssign().visit(node)
@@ -1064,7 +1402,7 @@ def emit_body(builder, func):
     last_block = llvm.GetInsertBlock(builder)
     if not llvm.IsATerminatorInst(llvm.GetLastInstruction(last_block)):
         # Last return out of a void function can be implicit.
-        restype = llvm.function_return_type(func.llvm_func)
+        restype = llvm.function_return_type(llvm_func)
         if llvm.GetTypeKind(restype) == llvm.VoidTypeKind:
             llvm.BuildRetVoid(builder)
         else:
@@ -1075,6 +1413,215 @@ def emit_body(builder, func):
     return b.new_funcs
 
 
+def _unpacked_args(decl):
+    """Returns names of slice arguments whose descriptors are unpacked on entry.
+
+    Functions which are always inlined keep their descriptors as they are.
+
+    """
+    from .types import Reference
+    from .types.array import Slice
+
+    if decl.options["inline"]:
+        return []
+
+    return [name for name in decl.args
+            if isinstance(decl.argtypes[name], Reference) and
+            isinstance(decl.argtypes[name].value_type, Slice)]
+
+
+def _flushes_to_zero(decl):
+    """Returns True if *decl* runs with denormals flushed to zero.
+
+    Functions which are always inlined run in the mode of their caller.
+
+    """
+    return "ftz" in decl.options["fastmath"] and not decl.options["inline"]
+
+
+def _alias_checks(decl):
+    """Returns pairs of *decl* arguments to be tested for overlap on entry.
+
+    Only functions with ``alias="check"`` option are tested, and only pairs
+    where at least one argument is written into; memory which is just read
+    may overlap freely.
+
+    """
+    from .analysis import written_args
+
+    if decl.options["alias"] != "check":
+        return []
+
+    names = [name for name in decl.args
+             if llvm.GetTypeKind(decl.argtypes[name].llvm_type) == llvm.PointerTypeKind]
+    written = written_args(decl)
+
+    return [(a, b) for k, a in enumerate(names) for b in names[k + 1:]
+            if a in written or b in written]
+
+
+def _assumes_noalias(decl):
+    """Returns True if pointer parameters of *decl* can be marked as not aliasing."""
+    policy = decl.options["alias"]
+    return policy == "assume" or (policy == "check" and not _alias_checks(decl))
+
+
+def _emit_entry_thunk(func, names, ftz=False, checks=()):
+    """Emits *func* as a thunk unpacking slice arguments *names*; returns body functions.
+
+    Body function takes the same parameters followed by data pointers of
+    the unpacked slices. These are marked as not aliasing each other (see
+    the memory aliasing rules for slices), like pointer and array arguments
+    are, which lets the optimizer hoist descriptor loads and keep values
+    stored into slices in registers. Body is never inlined, since the
+    inliner drops this information; that's why functions only called from
+    compiled code aren't split unless they need the thunk anyway.
+
+    If *ftz* is set, thunk also enables flushing denormals to zero
+    for the duration of the call.
+
+    Argument pairs in *checks* are tested for overlap on entry; thunk then
+    calls either the body described above or its conservative copy without
+    aliasing information. Both have to be translated, fast one first.
+
+    """
+    from .types import Pointer
+
+    decl = func.decl
+    f = func.llvm_func
+    n = llvm.CountParams(f)
+    arg_start = 1 if decl.aggregate_result else 0
+    slice_types = [decl.argtypes[name].value_type for name in names]
+
+    params = [llvm.TypeOf(llvm.GetParam(f, i)) for i in range(n)]
+    params += [Pointer(T.element_type).llvm_type for T in slice_types]
+    ty = llvm.FunctionType(llvm.function_return_type(f),
+                           (llvm.TypeRef * len(params))(*params), len(params), False)
+
+    def add_body(suffix, noalias):
+        body = llvm.AddFunction(llvm.GetGlobalParent(f), llvm.GetValueName(f) + suffix, ty)
+        llvm.SetLinkage(body, llvm.PrivateLinkage)
+        llvm.AddFunctionAttr(body, llvm.NoInlineAttribute)
+        if noalias:
+            for i, t in enumerate(params):
+                if llvm.GetTypeKind(t) == llvm.PointerTypeKind:
+                    llvm.AddAttribute(llvm.GetParam(body, i), llvm.NoAliasAttribute)
+        return body
+
+    builder = llvm.CreateBuilder()
+    llvm.PositionBuilderAtEnd(builder, llvm.AppendBasicBlock(f, "entry"))
+
+    args = [llvm.GetParam(f, i) for i in range(n)]
+    for name, T in zip(names, slice_types):
+        param = llvm.GetParam(f, arg_start + decl.args.index(name))
+        data, _ = T._struct.emit_getattr(builder, param, "data")
+        args.append(data)
+
+    if ftz:
+        mxcsr = _emit_flush_to_zero(builder)
+
+    overlap = _emit_overlap_test(builder, func, checks) if checks else None
+    if overlap is not None:
+        bodies = [add_body("__body", True), add_body("__body_alias", False)]
+    else:
+        # Without checks, or if extents of checked arguments aren't known.
+        bodies = [add_body("__body", _assumes_noalias(decl))]
+
+    def emit_call(body):
+        result = llvm.BuildCall(builder, body, (llvm.ValueRef * len(args))(*args), len(args), "")
+
+        if ftz:
+            _emit_mxcsr(builder, "ldmxcsr", mxcsr)
+
+        if llvm.GetTypeKind(llvm.function_return_type(f)) == llvm.VoidTypeKind:
+            llvm.BuildRetVoid(builder)
+        else:
+            llvm.BuildRet(builder, result)
+
+    if overlap is not None:
+        noalias_block = llvm.AppendBasicBlock(f, "noalias")
+        alias_block = llvm.AppendBasicBlock(f, "alias")
+        llvm.BuildCondBr(builder, overlap, alias_block, noalias_block)
+
+        for block, body in zip((noalias_block, alias_block), bodies):
+            llvm.PositionBuilderAtEnd(builder, block)
+            emit_call(body)
+    else:
+        emit_call(bodies[0])
+
+    llvm.DisposeBuilder(builder)
+    return bodies
+
+
+def _emit_overlap_test(builder, func, checks):
+    """Emits test whether memory of any argument pair in *checks* overlaps.
+
+    Returns the resulting boolean value, or None if memory extent of some
+    argument isn't known, such as for pointers (instructions emitted up to
+    that point are left for the optimizer to remove).
+
+    """
+    from .types import Reference
+
+    decl = func.decl
+    arg_start = 1 if decl.aggregate_result else 0
+
+    extents = {}
+    for name in sorted(set(a for pair in checks for a in pair), key=decl.args.index):
+        t = decl.argtypes[name]
+        T = t.value_type if isinstance(t, Reference) else t
+        if not hasattr(T, "emit_extent"):
+            return None
+
+        extents[name] = T.emit_extent(builder, llvm.GetParam(func.llvm_func,
+                                                             arg_start + decl.args.index(name)))
+        if extents[name] is None:
+            return None
+
+    overlap = llvm.ConstInt(llvm.IntType(1), 0, False)
+    for a, b in checks:
+        (lo_a, hi_a), (lo_b, hi_b) = extents[a], extents[b]
+        both = llvm.BuildAnd(builder,
+                             llvm.BuildICmp(builder, llvm.IntULT, lo_a, hi_b, ""),
+                             llvm.BuildICmp(builder, llvm.IntULT, lo_b, hi_a, ""), "")
+        overlap = llvm.BuildOr(builder, overlap, both, "overlap")
+
+    return overlap
+
+
+# Flush-to-zero and denormals-are-zero bits of x86 MXCSR register.
+_MXCSR_FTZ_DAZ = 0x8040
+
+
+def _emit_flush_to_zero(builder):
+    """Emits code enabling flush-to-zero mode; returns pointer to saved MXCSR."""
+    import re
+    from .types import Int
+
+    if not re.match(r"(x86_64|i[3-6]86)-", llvm.GetDefaultTargetTriple__().value):
+        raise NotImplementedError("Flushing denormals to zero is only supported on x86")
+
+    saved = llvm.BuildAlloca(builder, Int.llvm_type, "mxcsr")
+    _emit_mxcsr(builder, "stmxcsr", saved)
+
+    flushed = llvm.BuildAlloca(builder, Int.llvm_type, "mxcsr.ftz")
+    v = llvm.BuildOr(builder, llvm.BuildLoad(builder, saved, ""),
+                     llvm.ConstInt(Int.llvm_type, _MXCSR_FTZ_DAZ, False), "")
+    llvm.BuildStore(builder, v, flushed)
+    _emit_mxcsr(builder, "ldmxcsr", flushed)
+
+    return saved
+
+
+def _emit_mxcsr(builder, name, p):
+    """Emits store to (``stmxcsr``) or load from (``ldmxcsr``) MXCSR through pointer *p*."""
+    from .types import Pointer, Byte
+
+    f = llvm.get_intrinsic(builder, "x86.sse." + name, (llvm.TypeRef * 0)())
+    p = llvm.BuildPointerCast(builder, p, Pointer(Byte).llvm_type, "")
+    llvm.BuildCall(builder, f, (llvm.ValueRef * 1)(p), 1, "")
+
+
 def entry_alloca(builder, type_, name):
     """Reserves stack space for a variable at function entry point.
 
@@ -1107,6 +1654,13 @@ def _entry_builder(builder):
     return b
 
 
+def _scalar_kind(ty):
+    """Returns kind of LLVM type *ty*; vectors use same ops as their element types."""
+    if llvm.GetTypeKind(ty) == llvm.VectorTypeKind:
+        ty = llvm.GetElementType(ty)
+    return llvm.GetTypeKind(ty)
+
+
 def _extend_bool(builder, v):
     """Extends 1-bit boolean to conventional one."""
     from .types import Bool
@@ -1153,7 +1707,7 @@ def emit_constant_string(builder, value):
     return llvm.BuildPointerCast(builder, s, String.llvm_type, "")
 
 
-def _qualified_name(module, decl):
+def _qualified_name(module_name, decl):
     """Returns qualified declaration name.
 
     The scheme used is:
@@ -1171,7 +1725,7 @@ def _qualified_name(module, decl):
         return decl.__name__
 
     suffix = "".join(decl.argtypes[arg].tag for arg in decl.args)
-    return "_".join((llvm.GetModuleName(module),
+    return "_".join((module_name,
                      decl.__module__,
                      decl.__name__,
                      suffix))
@@ -1183,7 +1737,7 @@ def _get_or_create_function(module, decl, vargs=False):
     Set *vargs* to True of the function accepts variadic arguments.
 
     """
-    name = _qualified_name(module, decl)
+    name = _qualified_name(llvm.GetModuleName(module), decl)
     llvm_func = llvm.GetNamedFunction(module, name)
     exists = bool(llvm_func)
 
@@ -1205,9 +1759,12 @@ def _get_or_create_function(module, decl, vargs=False):
         llvm_func = llvm.AddFunction(module, name, llvm_func_type)
         llvm.SetLinkage(llvm_func, llvm.ExternalLinkage)
 
-        for i, ty in enumerate(argtypes):
-            if llvm.GetTypeKind(ty.llvm_type) == llvm.PointerTypeKind:
-                llvm.AddAttribute(llvm.GetParam(llvm_func, i), llvm.NoAliasAttribute)
+        if _assumes_noalias(decl):
+            for i, ty in enumerate(argtypes):
+                if llvm.GetTypeKind(ty.llvm_type) == llvm.PointerTypeKind:
+                    llvm.AddAttribute(llvm.GetParam(llvm_func, i), llvm.NoAliasAttribute)
+
+        _add_memory_attributes(llvm_func, decl)
 
         if decl.options["inline"]:
             llvm.AddFunctionAttr(llvm_func, llvm.AlwaysInlineAttribute)
@@ -1215,6 +1772,38 @@ def _get_or_create_function(module, decl, vargs=False):
     return llvm_func, exists
 
 
+def _add_memory_attributes(llvm_func, decl):
+    """Marks *llvm_func* with attributes inferred from how *decl* uses memory.
+
+    Reference arguments which don't outlive the call are ``nocapture``;
+    functions which don't write (or read) memory other than their own stack
+    are ``readonly`` (or ``readnone``), which lets optimizer move and combine
+    their calls. Functions which change floating point mode are left alone.
+
+    """
+    from .analysis import captured_args, memory_effects
+    from .types import Pointer, Reference
+
+    if decl.pyfunc is None:
+        # Nothing is known about external functions and emitters.
+        return
+
+    captured = captured_args(decl)
+    arg_start = 1 if decl.aggregate_result else 0
+    for i, arg in enumerate(decl.args, arg_start):
+        if isinstance(decl.argtypes[arg], (Pointer, Reference)) and arg not in captured:
+            llvm.AddAttribute(llvm.GetParam(llvm_func, i), llvm.NoCaptureAttribute)
+
+    if "ftz" in decl.options["fastmath"]:
+        return
+
+    effect = memory_effects(decl)
+    if effect == "none":
+        llvm.AddFunctionAttr(llvm_func, llvm.ReadNoneAttribute)
+    elif effect == "read":
+        llvm.AddFunctionAttr(llvm_func, llvm.ReadOnlyAttribute)
+
+
 def _validate_function_args(decl, args):
     """Raises TypeError if if *args* do not match function declaration."""
     import inspect
@@ -61,17 +61,32 @@ class IntrinsicEmitter(object):
 
 
 def cast(value, target_type):
-    """Casts *value* to a specified *target_type*."""
+    """Casts *value* to a specified *target_type*.
+
+    Vectors are cast element-wise to vectors of the same size.
+
+    """
 
     def emit(builder):
 
         # No-op if LLVM type is the same
         value_type = llvm.TypeOf(value)
-        if llvm.types_equal(target_type.llvm_type, value_type):
+        target_llvm_type = target_type.llvm_type
+        if llvm.types_equal(target_llvm_type, value_type):
             return value, target_type
 
+        vectors = [llvm.GetTypeKind(t) == llvm.VectorTypeKind
+                   for t in (value_type, target_llvm_type)]
+        if any(vectors):
+            if not all(vectors) or (llvm.GetVectorSize(value_type) !=
+                                    llvm.GetVectorSize(target_llvm_type)):
+                raise TypeError("Cannot cast {0} to {1}".format(value, target_type))
+
+            value_type = llvm.GetElementType(value_type)
+            target_llvm_type = llvm.GetElementType(target_llvm_type)
+
         value_kind = llvm.GetTypeKind(value_type)
-        target_kind = llvm.GetTypeKind(target_type.llvm_type)
+        target_kind = llvm.GetTypeKind(target_llvm_type)
 
         def build_cast(op):
             return llvm.BuildCast(builder, op, value, target_type.llvm_type, "cast"), target_type
@@ -86,7 +101,7 @@ def cast(value, target_type):
         elif target_kind == llvm.IntegerTypeKind:
             # Same kind, but different(?) integer width
             value_width = llvm.GetIntTypeWidth(value_type)
-            target_width = llvm.GetIntTypeWidth(target_type.llvm_type)
+            target_width = llvm.GetIntTypeWidth(target_llvm_type)
 
             if target_width > value_width:
                 return build_cast(llvm.ZExt)
@@ -0,0 +1,147 @@
+"""Heap allocated slices.
+
+Slices created by :func:`empty` own their data, allocated with C ``malloc``.
+Once returned to Python, ownership passes to the resulting NumPy array
+and the data is freed along with it; slices which aren't returned have to
+be released explicitly with :func:`free`. Slice descriptors keep track of
+the allocated block, so views such as ``out[1:]`` can be returned or freed
+in place of the original slice.
+
+Filter-style functions, whose output size isn't known in advance, can
+grow the output as needed with :func:`resize`::
+
+    DoubleN = Slice(Double)
+
+    @function(DoubleN, x=DoubleN)
+    def positive(x):
+        out = empty(DoubleN)(16)
+        n = 0
+        for i in range(x.shape[0]):
+            if x[i] > 0.0:
+                if n == out.shape[0]:
+                    out = resize(DoubleN)(out, n * 2)
+                out[n] = x[i]
+                n += 1
+        return resize(DoubleN)(out, n)
+
+"""
+from __future__ import absolute_import
+import ctypes
+
+from . import ValueEmitter, cast
+from .. import llvm
+
+
+def empty(T):
+    """``empty(T)(*shape) -> s``
+
+    Return new uninitialized slice of type *T* with given *shape*.
+
+    """
+    def empty_(*shape):
+        if len(shape) != len(T.shape):
+            raise TypeError("Expected {0} dimensions, got {1}".format(len(T.shape), len(shape)))
+
+        def emit(builder):
+            dims = [_index(builder, d) for d in shape]
+            data = _realloc(builder, T, None, dims)
+            return _descriptor(builder, T, data, dims)
+
+        return ValueEmitter(emit)
+    return empty_
+
+
+def resize(T):
+    """``resize(T)(s, n) -> s``
+
+    Return slice *s* with major dimension changed to *n*, preserving its
+    contents; *s* must own its data, which can be moved in the process.
+
+    """
+    def resize_(s, n):
+
+        def emit(builder):
+            from ..types import const_index
+
+            shape, shape_type = T.emit_getattr(builder, s, "shape")
+            dims = [_index(builder, n)]
+            for k in range(1, len(T.shape)):
+                d, _ = shape_type.value_type.emit_getitem(builder, shape, (const_index(k),))
+                dims.append(d)
+
+            data, _ = T.emit_getattr(builder, s, "data")
+            data = _realloc(builder, T, data, dims)
+            return _descriptor(builder, T, data, dims)
+
+        return ValueEmitter(emit)
+    return resize_
+
+
+def free(s):
+    """``free(s)``
+
+    Release data owned by slice *s*, or the slice it is a view of.
+    Slices which don't own their data are left alone.
+
+    """
+    def emit(builder):
+        from ..function import c_function, _get_or_create_function
+        from ..types import Pointer, Byte
+
+        free_ = c_function("free", None, [Pointer(Byte)])
+        llvm_free, _ = _get_or_create_function(llvm.GetParentModule__(builder), free_)
+
+        # Heap block is the last descriptor field.
+        n = llvm.CountStructElementTypes(llvm.GetElementType(llvm.TypeOf(s)))
+        p = llvm.BuildLoad(builder, llvm.BuildStructGEP(builder, s, n - 1, "gep"), "base")
+        llvm.BuildCall(builder, llvm_free, (llvm.ValueRef * 1)(p), 1, "")
+        return None, None
+
+    return ValueEmitter(emit)
+
+
+def _index(builder, v):
+    """Returns value *v* cast to index type."""
+    from ..types import Index
+
+    v, _ = cast(v, Index).emit(builder)
+    return v
+
+
+def _realloc(builder, T, data, dims):
+    """Emits (re)allocation of *data* to fit slice of type *T* with shape *dims*."""
+    from ..function import c_function, _get_or_create_function
+    from ..types import Pointer, Byte, Index, const_index
+
+    realloc = c_function("realloc", Pointer(Byte), [Pointer(Byte), Index])
+    llvm_realloc, _ = _get_or_create_function(llvm.GetParentModule__(builder), realloc)
+
+    size = const_index(ctypes.sizeof(T.element_type.c_type))
+    for d in dims:
+        size = llvm.BuildMul(builder, size, d, "size")
+
+    if data is None:
+        data = Pointer(Byte).null
+    else:
+        data = llvm.BuildPointerCast(builder, data, Pointer(Byte).llvm_type, "p")
+
+    args = (llvm.ValueRef * 2)(data, size)
+    p = llvm.BuildCall(builder, llvm_realloc, args, 2, "p")
+    return llvm.BuildPointerCast(builder, p, Pointer(T.element_type).llvm_type, "data")
+
+
+def _descriptor(builder, T, data, dims):
+    """Emits new slice descriptor of type *T* for given *data* and shape *dims*."""
+    from ..function import entry_alloca
+    from ..types import Reference, Pointer, Byte, const_index
+
+    s = entry_alloca(builder, T.llvm_type, "s")
+    T._struct.emit_setattr(builder, s, "data", data)
+    T._struct.emit_setattr(builder, s, "base",
+                           llvm.BuildPointerCast(builder, data, Pointer(Byte).llvm_type, "base"))
+
+    shape, shape_type = T._struct.emit_getattr(builder, s, "shape")
+    for k, d in enumerate(dims):
+        shape_type.value_type.emit_setitem(builder, shape, (const_index(k),), d)
+
+    return s, Reference(T)
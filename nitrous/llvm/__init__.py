@@ -73,6 +73,8 @@ _func("DisposeModule", None, [ModuleRef])
 
 _func("DisposeMessage", None, [ctypes.c_char_p])
 
+_func("GetVersion__", owned_c_char_p, [])
+
 
 # Linker
 (LinkerDestroySource, LinkerPreserveSource) = range(2)
@@ -104,6 +106,8 @@ _func("VectorType", TypeRef, [TypeRef, ctypes.c_uint])
 _func("ArrayType", TypeRef, [TypeRef, ctypes.c_uint])
 
 _func("GetElementType", TypeRef, [TypeRef])
+_func("GetVectorSize", ctypes.c_uint, [TypeRef])
+_func("CountStructElementTypes", ctypes.c_uint, [TypeRef])
 
 
 # Value
@@ -117,6 +121,12 @@ _func("SetValueName", None, [ValueRef, ctypes.c_char_p])
 _func("GetValueName", ctypes.c_char_p, [ValueRef])
 _func("DumpValue", None, [ValueRef])
 
+# Metadata
+_func("MDString", ValueRef, [ctypes.c_char_p, ctypes.c_uint])
+_func("MDNode", ValueRef, [ctypes.POINTER(ValueRef), ctypes.c_uint])
+_func("GetMDKindID", ctypes.c_uint, [ctypes.c_char_p, ctypes.c_uint])
+_func("SetMetadata", None, [ValueRef, ctypes.c_uint, ValueRef])
+
 # Operations on scalar constants
 _func("ConstNull", ValueRef, [TypeRef])
 _func("ConstInt", ValueRef, [TypeRef, ctypes.c_ulonglong, Bool])
@@ -124,6 +134,8 @@ _func("ConstReal", ValueRef, [TypeRef, ctypes.c_double])
 
 _func("ConstString", ValueRef, [ctypes.c_char_p, ctypes.c_uint, Bool])
 _func("ConstArray", ValueRef, [TypeRef, ctypes.POINTER(ValueRef), ctypes.c_uint])
+_func("ConstVector", ValueRef, [ctypes.POINTER(ValueRef), ctypes.c_uint])
+_func("GetUndef", ValueRef, [TypeRef])
 
 _func("IsATerminatorInst", ValueRef, [ValueRef])
 
@@ -134,16 +146,24 @@ Opcode = ctypes.c_int
 # Globals
 _func("AddGlobal", ValueRef, [ModuleRef, TypeRef, ctypes.c_char_p])
 _func("GetNamedGlobal", ValueRef, [ModuleRef, ctypes.c_char_p])
+_func("GetFirstGlobal", ValueRef, [ModuleRef])
+_func("GetNextGlobal", ValueRef, [ValueRef])
 _func("SetInitializer", None, [ValueRef, ValueRef])
 _func("SetGlobalConstant", None, [ValueRef, Bool])
+_func("IsDeclaration", Bool, [ValueRef])
 
 
 # Functions
 _func("FunctionType", TypeRef, [TypeRef, ctypes.POINTER(TypeRef), ctypes.c_uint, ctypes.c_int])
 _func("AddFunction", ValueRef, [ModuleRef, ctypes.c_char_p, TypeRef])
 _func("GetNamedFunction", ValueRef, [ModuleRef, ctypes.c_char_p])
+_func("GetFirstFunction", ValueRef, [ModuleRef])
+_func("GetGlobalParent", ModuleRef, [ValueRef])
+_func("GetInstructionCount__", ctypes.c_uint, [ValueRef])
+_func("GetNextFunction", ValueRef, [ValueRef])
 _func("SetLinkage", None, [ValueRef, ctypes.c_int])
 _func("GetParam", ValueRef, [ValueRef, ctypes.c_uint])
+_func("CountParams", ctypes.c_uint, [ValueRef])
 _func("GetReturnType", TypeRef, [TypeRef])
 
 _func("AddAttribute", None, [ValueRef, ctypes.c_int]);
@@ -151,7 +171,11 @@ _func("AddAttribute", None, [ValueRef, ctypes.c_int]);
 _func("AddFunctionAttr", None, [ValueRef, ctypes.c_int])
 
 NoAliasAttribute = 1 << 6
+ReadNoneAttribute = 1 << 9
+ReadOnlyAttribute = 1 << 10
+NoInlineAttribute = 1 << 11
 AlwaysInlineAttribute = 1 << 12
+NoCaptureAttribute = 1 << 21
 
 
 def function_return_type(func):
@@ -268,10 +292,13 @@ _func("BuildArrayMalloc", ValueRef, [BuilderRef, TypeRef, ValueRef, ctypes.c_cha
 # Casting
 Trunc = 30
 ZExt = 31
+SExt = 32
 FPToSI = 34
 SIToFP = 36
 FPTrunc = 37
 FPExt = 38
+PtrToInt = 39
+IntToPtr = 40
 BitCast = 41
 
 
@@ -287,6 +314,7 @@ _func("BuildSelect", ValueRef, [BuilderRef, ValueRef, ValueRef, ValueRef, ctypes
 
 _func("BuildExtractElement", ValueRef, [BuilderRef, ValueRef, ValueRef, ctypes.c_char_p])
 _func("BuildInsertElement", ValueRef, [BuilderRef, ValueRef, ValueRef, ValueRef, ctypes.c_char_p])
+_func("BuildShuffleVector", ValueRef, [BuilderRef, ValueRef, ValueRef, ValueRef, ctypes.c_char_p])
 
 
 # Analysis
@@ -312,8 +340,19 @@ TargetMachineRef = ctypes.POINTER(OpaqueTargetMachine)
 
 _func("InitializeNativeTarget__", Bool, [])
 _func("GetDefaultTargetTriple__", owned_c_char_p, [])
+_func("GetHostCPUName__", owned_c_char_p, [])
+_func("GetHostCPUFeatures__", owned_c_char_p, [])
 _func("LookupTarget__", TargetRef, [ctypes.c_char_p, ctypes.POINTER(ctypes.c_char_p)])
 
+# Floating point relaxations understood by target machine and
+# execution engine builders (see LLVMSetTargetMachineFastMath__).
+FastMathReassoc = 1 << 0
+FastMathNoNaNs = 1 << 1
+FastMathNoInfs = 1 << 2
+FastMathReciprocal = 1 << 3
+FastMathContract = 1 << 4
+FastMathFlushToZero = 1 << 5
+
 _func("GetFirstTarget", TargetRef, [])
 _func("GetNextTarget", TargetRef, [TargetRef])
 _func("GetTargetDescription", ctypes.c_char_p, [TargetRef])
@@ -324,6 +363,7 @@ _func("CreateTargetMachine", TargetMachineRef,
        ctypes.c_int, ctypes.c_int])
 
 _func("DisposeTargetMachine", None, [TargetMachineRef])
+_func("SetTargetMachineFastMath__", None, [TargetMachineRef, ctypes.c_uint])
 _func("GetTargetMachineData", TargetDataRef, [TargetMachineRef])
 _func("TargetMachineEmitToFile", Bool, [TargetMachineRef, ModuleRef,
                                         ctypes.c_char_p, ctypes.c_int,
@@ -345,13 +385,19 @@ _func("RunPassManager", Bool, [PassManagerRef, ModuleRef])
 
 _func("PassManagerBuilderCreate", PassManagerBuilderRef, [])
 _func("PassManagerBuilderDispose", None, [PassManagerBuilderRef])
+_func("PassManagerBuilderDispose__", None, [PassManagerBuilderRef])
 
 _func("PassManagerBuilderSetOptLevel", None, [PassManagerBuilderRef, ctypes.c_uint])
+_func("PassManagerBuilderSetSizeLevel", None, [PassManagerBuilderRef, ctypes.c_uint])
+_func("PassManagerBuilderSetDisableUnrollLoops", None, [PassManagerBuilderRef, Bool])
+_func("PassManagerBuilderSetVectorize__", None, [PassManagerBuilderRef, Bool, Bool])
+_func("PassManagerBuilderSetUnrollLimits__", None, [PassManagerBuilderRef, ctypes.c_int, ctypes.c_int])
 _func("PassManagerBuilderUseInlinerWithThreshold", None, [PassManagerBuilderRef, ctypes.c_uint])
 _func("PassManagerBuilderPopulateModulePassManager", None,
       [PassManagerBuilderRef, PassManagerRef])
 
 _func("AddTargetData", None, [TargetDataRef, PassManagerRef])
+_func("AddAlwaysInlinerPass", None, [PassManagerRef])
 
 
 # Execution engine
@@ -364,6 +410,11 @@ _func("CreateJITCompilerForModule", Bool,
       [ctypes.POINTER(ExecutionEngineRef), ModuleRef,
        ctypes.c_uint, ctypes.POINTER(ctypes.c_char_p)])
 
+_func("CreateJITCompilerForModule__", Bool,
+      [ctypes.POINTER(ExecutionEngineRef), ModuleRef,
+       ctypes.c_uint, ctypes.c_char_p, ctypes.c_char_p,
+       ctypes.c_uint, ctypes.POINTER(ctypes.c_char_p)])
+
 _func("GetExecutionEngineTargetData", TargetDataRef, [ExecutionEngineRef])
 _func("GetPointerToGlobal", ctypes.c_void_p, [ExecutionEngineRef, ValueRef])
 
@@ -386,6 +437,10 @@ _func("ParseBitcode", Bool,
       [MemoryBufferRef, ctypes.POINTER(ModuleRef), ctypes.POINTER(ctypes.c_char_p)])
 
 
+# Bitcode Writers
+_func("WriteBitcodeToFile", ctypes.c_int, [ModuleRef, ctypes.c_char_p])
+
+
 # Command line options
 _func("ParseEnvironmentOptions", None, [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p])
 if os.environ.get("NITROUS_LLVM_OPTS"):
@@ -415,6 +470,22 @@ def get_intrinsic(builder, name, spec):
     return GetIntrinsicDeclaration(module, i, spec, len(spec))
 
 
+def build_shuffle(builder, a, b, indices, name):
+    """Builds vector of elements at *indices* of *a* followed by *b*; *b* can be None."""
+    if b is None:
+        b = GetUndef(TypeOf(a))
+    mask = [ConstInt(IntType(32), i, False) for i in indices]
+    return BuildShuffleVector(builder, a, b, ConstVector((ValueRef * len(mask))(*mask), len(mask)),
+                              name)
+
+
+def build_splat(builder, e, n, name):
+    """Builds vector of *n* elements, all set to value *e*."""
+    v = BuildInsertElement(builder, GetUndef(VectorType(TypeOf(e), n)), e,
+                           ConstInt(IntType(32), 0, False), "")
+    return build_shuffle(builder, v, None, [0] * n, name)
+
+
 def build_py_idiv(builder, a, b, name):
     """Build expression for floor integer division.
 
@@ -2,136 +2,368 @@ import ctypes
 import os
 import shutil
 import tempfile
+import threading
 
 from . import llvm
+from .function import Function, _fastmath_bits
 
 
 class Module(object):
     """A unit of compilation and a container for optimized functions."""
 
     def __init__(self, module, cleanup):
-        # List of callables to run to free up resources associated with build.
         self.__n2o_module__ = module
-        self.__cleanup = cleanup
+        # Native callables refer to build resources rather than the
+        # module itself to avoid reference cycles with its attributes.
+        self.__n2o_resources__ = _Resources(cleanup)
+
+
+class _Resources(object):
+    """Holds resources associated with a build until they're no longer used."""
+
+    def __init__(self, cleanup):
+        # List of callables to run to free up resources associated with build.
+        self.cleanup = cleanup
+        # Other objects which need to be kept alive along with the resources.
+        self.refs = []
 
     def __del__(self):
-        for f in self.__cleanup:
+        for f in self.cleanup:
             f()
 
 
-def so_module(decls, libs=[], libdirs=[], name=None):
-    """Build a module backed by shared object file."""
+class OptimizationProfile(object):
+    """Settings for IR optimization and native code generation.
+
+    :param opt_level: IR optimization level, 0 to 3.
+    :param size_level: Code size optimization level, 0 to 2 (same as ``-Os`` and ``-Oz``).
+    :param inline_threshold: Inliner cost threshold; if ``None``, only functions
+        with the inline option set are inlined.
+    :param loop_vectorize: Set ``True`` to enable loop vectorizer.
+    :param slp_vectorize: Set ``True`` to enable vectorization of straight-line
+        code (basic block vectorizer in LLVM 3.2).
+    :param unroll: Set ``False`` to disable loop unrolling.
+    :param unroll_threshold: Maximum size of unrolled loop body; LLVM default if ``None``.
+    :param unroll_count: Fixed unroll factor; chosen by LLVM if ``None``.
+    :param codegen_level: Native code generation level (one of ``llvm.CodeGenLevel*``);
+        if ``None``, module builder picks its own default.
+
+    """
+
+    _fields = ("opt_level", "size_level", "inline_threshold",
+               "loop_vectorize", "slp_vectorize",
+               "unroll", "unroll_threshold", "unroll_count",
+               "codegen_level")
+
+    def __init__(self, opt_level=2, size_level=0, inline_threshold=275,
+                 loop_vectorize=False, slp_vectorize=False,
+                 unroll=True, unroll_threshold=None, unroll_count=None,
+                 codegen_level=None):
+
+        if opt_level not in (0, 1, 2, 3):
+            raise ValueError("Invalid opt_level {0!r}".format(opt_level))
+        if size_level not in (0, 1, 2):
+            raise ValueError("Invalid size_level {0!r}".format(size_level))
+
+        self.opt_level = opt_level
+        self.size_level = size_level
+        self.inline_threshold = inline_threshold
+        self.loop_vectorize = bool(loop_vectorize)
+        self.slp_vectorize = bool(slp_vectorize)
+        self.unroll = bool(unroll)
+        self.unroll_threshold = unroll_threshold
+        self.unroll_count = unroll_count
+        self.codegen_level = codegen_level
+
+    def _values(self):
+        return tuple(getattr(self, f) for f in self._fields)
+
+    def __eq__(self, other):
+        return isinstance(other, OptimizationProfile) and self._values() == other._values()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __repr__(self):
+        args = ", ".join("{0}={1!r}".format(f, v) for f, v in zip(self._fields, self._values()))
+        return "OptimizationProfile({0})".format(args)
+
+
+#: Profile for code which should be available as quickly as possible.
+TIER0_PROFILE = OptimizationProfile(opt_level=0, inline_threshold=None, unroll=False,
+                                    codegen_level=llvm.CodeGenLevelNone)
+
+
+def so_module(decls, libs=[], libdirs=[], name=None, cache_dir=None, linker="ld", profile=None,
+              cpu="host", features=None, variants=None, select=None, trampolines=False):
+    """Build a module backed by shared object file.
+
+    Functions are optimized according to *profile* (see :class:`OptimizationProfile`),
+    unless they've been given their own through :func:`~nitrous.function.options`.
+
+    Code is generated for the *cpu*, which by default is the one detected on the
+    host, along with its *features* (eg. ``"+avx2,+fma"``). Use ``"generic"``
+    *cpu* to build artifacts which can run on any machine of the same architecture.
+
+    Alternatively, *variants* is a list of feature strings; all functions are
+    compiled for the generic CPU with each of the feature sets and included in
+    the same shared object. Once it's loaded, *select* (defaults to
+    :func:`select_variant`) is called with the list of variants and returns the
+    one whose code is going to be used. Selected variant is available as
+    ``__n2o_variant__`` module attribute.
+
+    If *trampolines* is set, native wrappers following CPython calling convention
+    are compiled along with the functions (see :mod:`nitrous.trampoline`); the
+    module then exposes functions as builtins which call native code directly,
+    without ctypes involvement. Functions with arguments or results not supported
+    by trampolines are exposed through ctypes as usual.
+
+    Native object code is emitted directly by LLVM and then linked into shared
+    object with the system *linker* (``"ld"``), which still runs as a separate
+    process. Alternatively, setting *linker* to ``"clang"`` emits textual assembly
+    and has clang assemble and link it.
+
+    If *cache_dir* is given (or ``NITROUS_CACHE_DIR`` environment variable is set),
+    the resulting shared object is stored there and reused by all subsequent
+    builds of the same module, skipping translation and compilation altogether.
+    Concurrent builds of the same module, either from other threads or
+    processes, wait for the first one to finish and then load its result.
+
+    Build statistics are available through :func:`stats`.
+
+    """
+    from . import cache
+    from .stats import BuildStats
+
+    profile = profile or OptimizationProfile()
+
+    if variants:
+        targets = [("generic", v) for v in variants]
+        selected = variants.index((select or select_variant)(variants))
+    else:
+        targets = [_target_cpu(cpu, features)]
+        selected = 0
+
+    key = cache.module_key(decls, libs, (("builder", "so"),
+                                         ("libdirs", tuple(libdirs)),
+                                         ("name", name),
+                                         ("profile", profile),
+                                         ("targets", tuple(targets)),
+                                         ("trampolines", trampolines)))
+    name = name or _module_name(key)
+    cache_dir = cache.get_dir(cache_dir)
+    build_stats = BuildStats(name, "so")
+
+    # Each variant is a separately compiled module with its own symbol names.
+    if variants:
+        units = [("{0}_v{1}".format(name, i), t) for i, t in enumerate(targets)]
+    else:
+        units = [(name, targets[0])]
+    unit_name = units[selected][0]
+
+    out = None
+
+    # Fast path; avoid locking if the module has already been built.
+    so_path = cache.lookup(cache_dir, key, ".so") if cache_dir else None
+
+    if not so_path:
+        with cache.build_lock(cache_dir, key):
+            so_path = cache.lookup(cache_dir, key, ".so") if cache_dir else None
 
-    from functools import partial
-    from subprocess import call
-    from tempfile import mkdtemp
+            if not so_path:
+                out, so_path, funcs = _build_so(decls, libs, libdirs, name, linker, profile,
+                                                units, selected, trampolines, build_stats)
 
-    module, funcs = _create_module(decls, name)
+                if cache_dir:
+                    so_path = cache.store(cache_dir, key, ".so", so_path)
 
-    for lib in libs:
-        if not isinstance(lib, basestring):
-            llvm.link_modules(module, lib.create_module())
+                # Compilation successful; build ctypes interface to new module.
+                with build_stats.phase("load"):
+                    out = _load_so(out, so_path, funcs, trampolines)
 
-    if llvm.InitializeNativeTarget__():
-        raise SystemError("Cannot initialize LLVM target")
+    if out is None:
+        build_stats.cached = True
+        with build_stats.phase("load"):
+            out = _load_cached_so(decls, unit_name, so_path, trampolines)
+
+    if variants:
+        out.__n2o_variant__ = variants[selected]
+
+    build_stats.object_size = os.path.getsize(so_path)
+    out.__n2o_stats__ = build_stats
+    build_stats.finish()
 
-    # At this point, multiple targets can be initialized
-    # (eg x86 and x86_64), but only one is functional.
-    message = ctypes.c_char_p()
-    triple = llvm.GetDefaultTargetTriple__()
-    target = llvm.LookupTarget__(triple, ctypes.byref(message))
-    if not target:
-        err = RuntimeError("Could not find suitable target: {0}".format(message.value))
-        llvm.DisposeMessage(message)
-        raise err
+    return out
 
-    machine = llvm.CreateTargetMachine(target,
-                                       triple, "", "",
-                                       llvm.CodeGenLevelDefault,
-                                       llvm.RelocPIC,
-                                       llvm.CodeModelDefault)
 
-    build_dir = mkdtemp(prefix="n2o-")
-    cleanup = [partial(llvm.DisposeModule, module), partial(shutil.rmtree, build_dir)]
+def select_variant(variants):
+    """Returns the first of *variants* whose features are all supported by host.
 
-    out = Module(module, cleanup)
+    Features are detected from ``/proc/cpuinfo``; on other platforms, only
+    variants which don't require any features can be selected.
 
-    # Path to output shared library.
-    # Getting module name again since _create_module may have used a default.
-    so_path = format(os.path.join(build_dir, llvm.GetModuleName(module)))
-    libs = tuple("-l{0}".format(lib) for lib in libs if isinstance(lib, basestring))
-    libdirs = tuple("-L{0}".format(d) for d in libdirs)
+    """
+    host = _host_features()
 
-    _optimize(module, llvm.GetTargetMachineData(machine))
+    for v in variants:
+        required = set(f[1:] for f in v.split(",") if f.startswith("+"))
+        if required <= host:
+            return v
 
-    with tempfile.NamedTemporaryFile(suffix=".s") as tmp_s:
-        message = ctypes.c_char_p()
-        status = llvm.TargetMachineEmitToFile(machine, module,
-                                              tmp_s.name, llvm.AssemblyFile,
-                                              ctypes.byref(message))
-        if status != 0:
-            error = RuntimeError("Could not assemble IR: {0}".format(message.value))
-            llvm.DisposeMessage(message)
-            raise error
+    raise RuntimeError("None of the variants is supported by host CPU")
 
-        if call(("clang", "-shared", "-o", so_path, tmp_s.name) + libs + libdirs):
-            raise RuntimeError("Could not build target extension")
 
-        # Debug
-        # if call(("llvm-objdump", "-disassemble", so_path)):
-        #     raise RuntimeError("Could not disassemble target extension")
+def jit_module(decls, libs=[], name=None, cache_dir=None, profile=None,
+               cpu="host", features=None, trampolines=False):
+    """Build a module backed by JIT execution engine.
 
-    llvm.DisposeTargetMachine(machine)
+    Functions are optimized according to *profile* for the given *cpu* and
+    *features* same as in :func:`so_module`; unless the profile says otherwise,
+    the engine generates code at the aggressive optimization level. Setting
+    *trampolines* has the same effect as in :func:`so_module`.
 
-    # Compilation successful; build ctypes interface to new module.
-    so = ctypes.cdll.LoadLibrary(so_path)
-    out.__n2o_so__ = so
+    If *cache_dir* is given (or ``NITROUS_CACHE_DIR`` environment variable is set),
+    optimized module bitcode is stored there and reused by all subsequent
+    builds of the same module, leaving only the native code generation to the
+    execution engine. Concurrent builds are coordinated same as in :func:`so_module`.
 
-    for func in funcs:
-        func.wrap_so(so)
-        setattr(out, func.__name__, func)
+    Build statistics are available through :func:`stats`; native code generation
+    is recorded as part of the ``"codegen"`` phase.
+
+    """
+    from . import cache
+    from .stats import BuildStats
+
+    profile = profile or OptimizationProfile()
+    target = _target_cpu(cpu, features)
+    key = cache.module_key(decls, libs, (("builder", "jit"),
+                                         ("name", name),
+                                         ("profile", profile),
+                                         ("target", target),
+                                         ("trampolines", trampolines)))
+    name = name or _module_name(key)
+    cache_dir = cache.get_dir(cache_dir)
+    build_stats = BuildStats(name, "jit")
+    out = None
+
+    bc_path = cache.lookup(cache_dir, key, ".bc") if cache_dir else None
+
+    if not bc_path:
+        with cache.build_lock(cache_dir, key):
+            bc_path = cache.lookup(cache_dir, key, ".bc") if cache_dir else None
+
+            if not bc_path:
+                machine = _create_target_machine(target=target)
+                module, funcs = _compile(decls, libs, name, profile,
+                                         llvm.GetTargetMachineData(machine),
+                                         trampolines, build_stats)
+                llvm.DisposeTargetMachine(machine)
+
+                if cache_dir:
+                    with tempfile.NamedTemporaryFile(suffix=".bc") as tmp_bc:
+                        if llvm.WriteBitcodeToFile(module, tmp_bc.name):
+                            raise RuntimeError("Could not write module bitcode")
+                        cache.store(cache_dir, key, ".bc", tmp_bc.name)
+
+                with build_stats.phase("codegen"):
+                    engine = _create_engine(module, profile, target, _fastmath_bits(decls))
+                    out = _wrap_engine(module, engine, funcs, trampolines)
+
+    if out is None:
+        build_stats.cached = True
+        with build_stats.phase("load"):
+            module, funcs = _load_cached_bitcode(decls, name, bc_path)
+        with build_stats.phase("codegen"):
+            engine = _create_engine(module, profile, target, _fastmath_bits(decls))
+            out = _wrap_engine(module, engine, funcs, trampolines)
+
+    out.__n2o_stats__ = build_stats
+    build_stats.finish()
 
     return out
 
 
-def jit_module(decls, libs=[], name=None):
-    """Build a module backed by JIT execution engine."""
+def lazy_module(decls, builder=None, **kwargs):
+    """Build a module which compiles its functions on first call.
+
+    Functions are exposed as stubs; the first call to each one compiles it
+    (along with all functions it calls) into a separate module using *builder*,
+    which defaults to :func:`so_module`. Remaining *kwargs* are passed on
+    to the builder.
+
+    Stubs call compiled functions through ctypes, so ``trampolines`` can't
+    be enabled.
 
+    """
     from functools import partial
 
-    module, funcs = _create_module(decls, name)
+    if kwargs.get("trampolines"):
+        raise ValueError("Lazy modules don't support trampolines")
 
-    for lib in libs:
-        llvm.link_modules(module, lib.create_module())
+    out = Module(None, [])
+    build = partial(builder or so_module, **kwargs)
 
-    if llvm.InitializeNativeTarget__():
-        raise SystemError("Cannot initialize LLVM target")
+    for decl in decls:
+        if hasattr(out, decl.__name__):
+            raise RuntimeError("Duplicate function name: {0}" .format(decl.__name__))
+        setattr(out, decl.__name__, LazyFunction(decl, build))
 
-    engine = llvm.ExecutionEngineRef()
-    opt_level = 3
+    return out
 
-    message = ctypes.c_char_p()
-    if llvm.CreateJITCompilerForModule(ctypes.byref(engine), module, opt_level, ctypes.byref(message)):
-        err = RuntimeError("Could not create execution engine: {0}".format(message.value))
-        llvm.DisposeMessage(message)
-        raise err
 
-    _optimize(module, llvm.GetExecutionEngineTargetData(engine))
+def async_module(decls, builder=None, policy="block", **kwargs):
+    """Start building a module in a background thread.
 
-    cleanup = [partial(llvm.DisposeExecutionEngine, engine)]
+    Returns a :class:`PendingModule` immediately. The module is built with
+    *builder* (defaults to :func:`so_module`), which receives all remaining
+    *kwargs*. The *policy* determines what accessing functions on the pending
+    module does before the build is complete: ``"block"`` waits for the build to
+    finish, while ``"fallback"`` returns the original Python function.
 
-    out = Module(module, cleanup)
-    out.__n2o_engine__ = engine
+    """
+    from functools import partial
 
-    for func in funcs:
-        func.wrap_engine(engine)
-        setattr(out, func.__name__, func)
+    if policy not in ("block", "fallback"):
+        raise ValueError("Unknown policy {0!r}".format(policy))
+
+    return PendingModule(decls, partial(builder or so_module, **kwargs), policy)
+
+
+def tiered_module(decls, libs=[], threshold=100):
+    """Build a module which is quickly usable and gets optimized as it's used.
+
+    All functions are first compiled without optimizations. Once a function
+    has been called *threshold* times, it is recompiled in background with
+    full optimizations and swapped in place as soon as it's ready.
+
+    """
+    from functools import partial
+
+    out = jit_module(decls, libs, profile=TIER0_PROFILE)
+    build = partial(jit_module, libs=libs)
+
+    for decl in decls:
+        func = getattr(out, decl.__name__)
+        setattr(out, decl.__name__, TieredFunction(func, build, threshold))
 
     return out
 
 
+def stats(module):
+    """Return :class:`~nitrous.stats.BuildStats` recorded while building the module."""
+    try:
+        return module.__n2o_stats__
+    except AttributeError:
+        raise ValueError("Module has no build statistics available")
+
+
 def dump(module):
     """Return a string with module output's LLVM IR."""
+    if module.__n2o_module__ is None:
+        raise ValueError("Module has no IR available")
     return llvm.DumpModuleToString(module.__n2o_module__).value
 
 
@@ -139,6 +371,194 @@ def dump(module):
 module = so_module
 
 
+class LazyFunction(Function):
+    """Function stub which gets compiled on its first call.
+
+    *build* is a callable which accepts the list of declarations and
+    returns a built :class:`Module`.
+
+    """
+
+    def __init__(self, decl, build):
+        super(LazyFunction, self).__init__(decl, None)
+        self.__build = build
+        self.__lock = threading.Lock()
+        # Keeps compiled function code alive.
+        self.__module = None
+
+    def __call__(self, *args, **kwargs):
+        if self.cfunc is None:
+            self._compile()
+        return super(LazyFunction, self).__call__(*args, **kwargs)
+
+    def call_many(self, *columns, **kwargs):
+        if self.cfunc is None:
+            self._compile()
+        return super(LazyFunction, self).call_many(*columns, **kwargs)
+
+    def _compile(self):
+        """Compiles the function, unless another thread has already done so."""
+        with self.__lock:
+            if self.cfunc is None:
+                self.__module = self.__build([self.decl])
+                self.cfunc = getattr(self.__module, self.__name__).cfunc
+
+
+class TieredFunction(Function):
+    """Function which replaces its code with an optimized version once it gets hot.
+
+    Wraps already compiled *func*; after *threshold* calls, uses *build* to
+    compile an optimized module in background and switches over to it.
+    If that fails, function stays at tier 0; the exception is kept in
+    :attr:`error` and reported as a :class:`RuntimeWarning`.
+
+    """
+
+    def __init__(self, func, build, threshold):
+        super(TieredFunction, self).__init__(func.decl, func.llvm_func, func.symbol)
+        self.cfunc = func.cfunc
+        #: Number of calls made so far.
+        self.calls = 0
+        #: Current tier; 0 is unoptimized code, 1 is fully optimized.
+        self.tier = 0
+        #: Exception raised by optimized build, if any.
+        self.error = None
+
+        self.__build = build
+        self.__threshold = threshold
+        self.__lock = threading.Lock()
+        self.__scheduled = False
+        # Keeps optimized function code alive.
+        self.__module = None
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        if self.calls >= self.__threshold and not self.__scheduled:
+            self._schedule()
+        return super(TieredFunction, self).__call__(*args, **kwargs)
+
+    def _schedule(self):
+        """Starts background recompilation, unless it's already underway."""
+        with self.__lock:
+            if self.__scheduled:
+                return
+            self.__scheduled = True
+
+        thread = threading.Thread(target=self.__optimize)
+        thread.daemon = True
+        thread.start()
+
+    def __optimize(self):
+        import warnings
+
+        try:
+            self.__module = self.__build([self.decl])
+        except Exception, e:
+            self.error = e
+            warnings.warn("Could not optimize {0}(), staying at tier 0: {1}"
+                          .format(self.__name__, e), RuntimeWarning)
+            return
+
+        # Attribute assignment is atomic; calls in progress
+        # will complete using the previous version.
+        self.cfunc = getattr(self.__module, self.__name__).cfunc
+        self.tier = 1
+
+
+class PendingModule(object):
+    """Handle to a module being built in the background.
+
+    Supports the subset of future interface (``done()``, ``result()`` and
+    ``add_done_callback()``), which is how the build integrates with event
+    loops such as tornado or trollius: the callback is where their own future
+    gets resolved (on the loop thread). Functions can be accessed as attributes
+    of the handle itself, subject to the access policy (see :func:`async_module`).
+
+    """
+
+    def __init__(self, decls, build, policy):
+        self.__decls = dict((decl.__name__, decl) for decl in decls)
+        self.__policy = policy
+        self.__done = threading.Event()
+        self.__lock = threading.Lock()
+        self.__callbacks = []
+        self.__module = None
+        self.__error = None
+
+        thread = threading.Thread(target=self.__run, args=(build, decls))
+        thread.daemon = True
+        thread.start()
+
+    def __run(self, build, decls):
+        import sys
+
+        try:
+            self.__module = build(decls)
+        except Exception:
+            self.__error = sys.exc_info()
+        finally:
+            with self.__lock:
+                self.__done.set()
+                callbacks, self.__callbacks = self.__callbacks, None
+
+            for fn in callbacks:
+                self.__invoke(fn)
+
+    def __invoke(self, fn):
+        import traceback
+
+        try:
+            fn(self)
+        except Exception:
+            # Same as concurrent.futures; there's nobody to report errors to.
+            traceback.print_exc()
+
+    def done(self):
+        """Returns True if the build has finished, successfully or not."""
+        return self.__done.is_set()
+
+    def add_done_callback(self, fn):
+        """Arranges for *fn* to be called with the handle once the build finishes.
+
+        Callbacks run in the build thread, or immediately in the calling
+        thread if the build has already finished. Event loops are expected
+        to pass the notification to their own thread.
+
+        """
+        with self.__lock:
+            if not self.__done.is_set():
+                self.__callbacks.append(fn)
+                return
+
+        self.__invoke(fn)
+
+    def result(self, timeout=None):
+        """Waits for the build to finish and returns the resulting module.
+
+        Re-raises the build exception, if any. Raises RuntimeError if the
+        build didn't finish within *timeout* seconds.
+
+        """
+        if not self.__done.wait(timeout):
+            raise RuntimeError("Module build did not finish in time")
+
+        if self.__error is not None:
+            raise self.__error[0], self.__error[1], self.__error[2]
+
+        return self.__module
+
+    def __getattr__(self, name):
+        try:
+            decl = self.__decls[name]
+        except KeyError:
+            raise AttributeError(name)
+
+        if self.__policy == "fallback" and not self.done():
+            return decl.pyfunc
+
+        return getattr(self.result(), name)
+
+
 class CppLibrary(object):
     """Creates a library from C/C++ sources."""
 
@@ -159,39 +579,334 @@ class CppLibrary(object):
     def _compile_source(self, source):
         from subprocess import call
 
-        buffer = llvm.MemoryBufferRef()
-        message = ctypes.c_char_p()
-
         with tempfile.NamedTemporaryFile(suffix=".bc") as tmp_bc:
             if call(("clang", "-c", "-emit-llvm", "-o", tmp_bc.name, source) + self.compile_args):
                 raise RuntimeError("Could not compile {0}".format(source))
 
-            status = llvm.CreateMemoryBufferWithContentsOfFile(
-                tmp_bc.name, ctypes.byref(buffer),
-                ctypes.byref(message)
-            )
-            if status != 0:
-                error = RuntimeError("Could not load module: {0}".format(message.value))
-                llvm.DisposeMessage(message)
-                raise error
+            return _load_bitcode(tmp_bc.name)
+
+
+def _build_so(decls, libs, libdirs, name, linker, profile, units, selected, trampolines, stats):
+    """Compiles and links a new shared object.
+
+    *units* is a list of ``(module name, target)`` pairs; *decls* are compiled
+    separately for each of them and all resulting code is linked together.
+
+    Returns the module object, path to the shared object and the list of
+    functions to be exposed, both for the unit at index *selected*.
+
+    """
+    from functools import partial
+    from tempfile import mkdtemp
+
+    try:
+        link = _LINKERS[linker]
+    except KeyError:
+        raise ValueError("Unknown linker {0!r}".format(linker))
+
+    build_dir = mkdtemp(prefix="n2o-")
+    cleanup = [partial(shutil.rmtree, build_dir)]
+
+    codegen_level = _codegen_level(profile, llvm.CodeGenLevelDefault)
+    compiled = []
+
+    for unit_name, target in units:
+        machine = _create_target_machine(codegen_level, target, _fastmath_bits(decls))
+        module, funcs = _compile(decls, libs, unit_name, profile,
+                                 llvm.GetTargetMachineData(machine), trampolines, stats)
+        cleanup.append(partial(llvm.DisposeModule, module))
+
+        if len(units) > 1:
+            # Only the exported functions can be visible, otherwise
+            # shared library code would clash between the variants.
+            _internalize(module, _exported_symbols(funcs, trampolines))
+
+        compiled.append((machine, module, funcs))
+
+    out = Module(compiled[selected][1], cleanup)
+
+    # Path to output shared library.
+    so_path = format(os.path.join(build_dir, name))
+    libs = tuple("-l{0}".format(lib) for lib in libs if isinstance(lib, basestring))
+    libdirs = tuple("-L{0}".format(d) for d in libdirs)
+
+    link([(machine, module) for machine, module, _ in compiled], so_path, libs + libdirs, stats)
+
+    # Debug
+    # if call(("llvm-objdump", "-disassemble", so_path)):
+    #     raise RuntimeError("Could not disassemble target extension")
+
+    for machine, _, _ in compiled:
+        llvm.DisposeTargetMachine(machine)
+
+    return out, so_path, compiled[selected][2]
+
+
+def _exported_symbols(funcs, trampolines):
+    """Returns set of symbols which are exported for *funcs*."""
+    from . import trampoline
+
+    exported = set(func.symbol for func in funcs)
+    if trampolines:
+        exported.update(trampoline.symbol(func.symbol) for func in funcs
+                        if trampoline.supported(func.decl))
+
+    return exported
+
+
+def _internalize(module, exported):
+    """Hides all functions and globals defined in *module* except *exported* ones."""
+    for get_first, get_next in ((llvm.GetFirstFunction, llvm.GetNextFunction),
+                                (llvm.GetFirstGlobal, llvm.GetNextGlobal)):
+        v = get_first(module)
+        while v:
+            if not llvm.IsDeclaration(v) and llvm.GetValueName(v) not in exported:
+                llvm.SetLinkage(v, llvm.PrivateLinkage)
+            v = get_next(v)
+
+
+def _link_object(units, so_path, args, stats):
+    """Emits native object files and links them with the system linker.
+
+    *units* is a list of ``(target machine, module)`` pairs. LLVM 3.2 can't
+    link shared objects by itself, so ``ld`` is spawned for that.
+
+    """
+    import platform
+    from subprocess import call
+
+    if platform.system() == "Darwin":
+        shared = ("-dylib", "-undefined", "dynamic_lookup")
+    else:
+        # Undefined symbols (eg. libc and libm functions)
+        # are resolved from the host process on load.
+        shared = ("-shared",)
+
+    obj_paths = tuple("{0}.{1}.o".format(so_path, i) for i in range(len(units)))
+    with stats.phase("codegen"):
+        for (machine, module), obj_path in zip(units, obj_paths):
+            _emit_to_file(machine, module, obj_path, llvm.ObjectFile)
 
-        lib_module = llvm.ModuleRef()
+    with stats.phase("link"):
+        if call(("ld",) + shared + ("-o", so_path) + obj_paths + args):
+            raise RuntimeError("Could not build target extension")
+
+
+def _link_assembly(units, so_path, args, stats):
+    """Emits assembly and has clang assemble and link it."""
+    from subprocess import call
+
+    s_paths = tuple("{0}.{1}.s".format(so_path, i) for i in range(len(units)))
+    with stats.phase("codegen"):
+        for (machine, module), s_path in zip(units, s_paths):
+            _emit_to_file(machine, module, s_path, llvm.AssemblyFile)
+
+    with stats.phase("link"):
+        if call(("clang", "-shared", "-o", so_path) + s_paths + args):
+            raise RuntimeError("Could not build target extension")
+
+
+_LINKERS = {
+    "ld": _link_object,
+    "clang": _link_assembly,
+}
+
+
+def _emit_to_file(machine, module, path, file_type):
+    """Generates native code for *module* and writes it to *path*."""
+    message = ctypes.c_char_p()
+    status = llvm.TargetMachineEmitToFile(machine, module,
+                                          path, file_type,
+                                          ctypes.byref(message))
+    if status != 0:
+        error = RuntimeError("Could not assemble IR: {0}".format(message.value))
+        llvm.DisposeMessage(message)
+        raise error
+
+
+def _load_cached_so(decls, name, so_path, trampolines):
+    """Exposes *decls* from a prebuilt shared object."""
+    from .function import _qualified_name
+
+    funcs = [Function(decl, None, _qualified_name(name, decl)) for decl in decls]
+    return _load_so(Module(None, []), so_path, funcs, trampolines)
+
+
+def _load_cached_bitcode(decls, name, bc_path):
+    """Loads prebuilt and optimized module bitcode; returns module and *decls* functions."""
+    from .function import _qualified_name
+
+    module = _load_bitcode(bc_path)
+    funcs = [Function(decl, llvm.GetNamedFunction(module, _qualified_name(name, decl)))
+             for decl in decls]
+
+    return module, funcs
+
+
+def _create_engine(module, profile, target, fastmath=0):
+    """Creates JIT execution engine which takes ownership of *module*.
+
+    *fastmath* is a combination of ``llvm.FastMath*`` flags allowed in native code.
+
+    """
+    if llvm.InitializeNativeTarget__():
+        raise SystemError("Cannot initialize LLVM target")
+
+    engine = llvm.ExecutionEngineRef()
+
+    message = ctypes.c_char_p()
+    opt_level = _codegen_level(profile, llvm.CodeGenLevelAggressive)
+    cpu, features = target
+    if llvm.CreateJITCompilerForModule__(ctypes.byref(engine), module, opt_level,
+                                         cpu, features, fastmath, ctypes.byref(message)):
+        err = RuntimeError("Could not create execution engine: {0}".format(message.value))
+        llvm.DisposeMessage(message)
+        raise err
 
-        status = llvm.ParseBitcode(buffer, ctypes.byref(lib_module), message)
-        llvm.DisposeMemoryBuffer(buffer)
-        if status != 0:
-            error = RuntimeError("Could not parse bitcode: {0}".format(message.value))
-            llvm.DisposeMessage(message)
-            raise error
+    return engine
 
-        return lib_module
 
+def _wrap_engine(module, engine, funcs, trampolines):
+    """Exposes *funcs* compiled by execution *engine* through a new module."""
+    from functools import partial
+    from . import trampoline
 
-def _create_module(decls, name):
-    from .function import emit_body, _get_or_create_function, Function
+    cleanup = [partial(llvm.DisposeExecutionEngine, engine)]
 
-    if not name:
-        name = "n2o_" + _random_hex()
+    out = Module(module, cleanup)
+    out.__n2o_engine__ = engine
+
+    for func in funcs:
+        func.wrap_engine(engine)
+        if trampolines and trampoline.supported(func.decl):
+            tramp = llvm.GetNamedFunction(module, trampoline.symbol(func.symbol))
+            address = llvm.GetPointerToGlobal(engine, tramp)
+            setattr(out, func.__name__, trampoline.wrap(func, address, out.__n2o_resources__))
+        else:
+            setattr(out, func.__name__, func)
+
+    return out
+
+
+def _load_bitcode(path):
+    """Loads module from bitcode file at *path*."""
+    buffer = llvm.MemoryBufferRef()
+    message = ctypes.c_char_p()
+
+    status = llvm.CreateMemoryBufferWithContentsOfFile(
+        path, ctypes.byref(buffer),
+        ctypes.byref(message)
+    )
+    if status != 0:
+        error = RuntimeError("Could not load module: {0}".format(message.value))
+        llvm.DisposeMessage(message)
+        raise error
+
+    module = llvm.ModuleRef()
+
+    status = llvm.ParseBitcode(buffer, ctypes.byref(module), message)
+    llvm.DisposeMemoryBuffer(buffer)
+    if status != 0:
+        error = RuntimeError("Could not parse bitcode: {0}".format(message.value))
+        llvm.DisposeMessage(message)
+        raise error
+
+    return module
+
+
+def _create_target_machine(codegen_level=llvm.CodeGenLevelDefault, target=("", ""), fastmath=0):
+    """Creates target machine for the host.
+
+    *target* is a pair of CPU name and feature string, as returned by :func:`_target_cpu`;
+    *fastmath* is a combination of ``llvm.FastMath*`` flags allowed in generated code.
+
+    """
+    if llvm.InitializeNativeTarget__():
+        raise SystemError("Cannot initialize LLVM target")
+
+    # At this point, multiple targets can be initialized
+    # (eg x86 and x86_64), but only one is functional.
+    message = ctypes.c_char_p()
+    triple = llvm.GetDefaultTargetTriple__()
+    llvm_target = llvm.LookupTarget__(triple, ctypes.byref(message))
+    if not llvm_target:
+        err = RuntimeError("Could not find suitable target: {0}".format(message.value))
+        llvm.DisposeMessage(message)
+        raise err
+
+    cpu, features = target
+    machine = llvm.CreateTargetMachine(llvm_target,
+                                       triple, cpu, features,
+                                       codegen_level,
+                                       llvm.RelocPIC,
+                                       llvm.CodeModelDefault)
+    if fastmath:
+        llvm.SetTargetMachineFastMath__(machine, fastmath)
+
+    return machine
+
+
+def _target_cpu(cpu, features):
+    """Resolves *cpu* name and *features* into values passed to LLVM.
+
+    ``"host"`` *cpu* is replaced with the name of host CPU. If *features* are not
+    given, those detected on the host are used along with the host CPU.
+
+    """
+    if cpu == "host":
+        cpu = llvm.GetHostCPUName__().value
+        if features is None:
+            features = llvm.GetHostCPUFeatures__().value
+
+    return cpu, features or ""
+
+
+def _host_features():
+    """Returns set of LLVM feature names supported by host CPU."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = next(line for line in f if line.startswith("flags")).split(":")[1].split()
+    except (IOError, StopIteration):
+        return set()
+
+    return set(_CPUINFO_FEATURES.get(flag, flag) for flag in flags)
+
+
+# Differences between /proc/cpuinfo flags and LLVM feature names.
+_CPUINFO_FEATURES = {
+    "pni": "sse3",
+    "sse4_1": "sse4.1",
+    "sse4_2": "sse4.2",
+    "bmi1": "bmi",
+    "abm": "lzcnt",
+    "pclmulqdq": "pclmul",
+    "rdrand": "rdrnd",
+    "lahf_lm": "sahf",
+}
+
+
+def _load_so(out, so_path, funcs, trampolines):
+    """Loads shared object and exposes *funcs* through module *out*."""
+    from . import trampoline
+
+    so = ctypes.cdll.LoadLibrary(so_path)
+    out.__n2o_so__ = so
+
+    for func in funcs:
+        func.wrap_so(so)
+        if trampolines and trampoline.supported(func.decl):
+            tramp = getattr(so, trampoline.symbol(func.symbol))
+            address = ctypes.cast(tramp, ctypes.c_void_p).value
+            setattr(out, func.__name__, trampoline.wrap(func, address, out.__n2o_resources__))
+        else:
+            setattr(out, func.__name__, func)
+
+    return out
+
+
+def _create_module(decls, name, trampolines, stats):
+    from .function import emit_body, _get_or_create_function
+    from . import trampoline
 
     module = llvm.ModuleCreateWithName(name)
     funcs = []
@@ -216,46 +931,140 @@ def _create_module(decls, name):
 
         # Emit new defined functions.
         if func.decl.pyfunc is not None:
-            new_funcs = emit_body(ir_builder, func)
+            new_funcs = emit_body(ir_builder, func, stats, exported=func.decl in decls)
             funcs.extend(new_funcs)
 
             if func.decl not in decls:
                 # Any compiled function that does not appear in module arguments can be hidden.
                 llvm.SetLinkage(func.llvm_func, llvm.PrivateLinkage)
 
-            if llvm.VerifyFunction(func.llvm_func, llvm.PrintMessageAction):
-                raise RuntimeError("Could not compile {0}()".format(func.__name__))
+        elif func.decl.emitter is not None:
+            with stats.phase("emit", func.symbol):
+                func.decl.emitter(ir_builder, func)
+
+        if func.decl.pyfunc is not None or func.decl.emitter is not None:
+            with stats.phase("verify", func.symbol):
+                if llvm.VerifyFunction(func.llvm_func, llvm.PrintMessageAction):
+                    raise RuntimeError("Could not compile {0}()".format(func.__name__))
 
         i += 1
 
     llvm.DisposeBuilder(ir_builder)
 
+    if trampolines:
+        for func in funcs[:len(decls)]:
+            if trampoline.supported(func.decl):
+                t = trampoline.emit_trampoline(module, func)
+                if llvm.VerifyFunction(t, llvm.PrintMessageAction):
+                    raise RuntimeError("Could not compile trampoline for {0}()".format(func.__name__))
+
     # Return only the functions from explicitly listed declarations.
     return module, funcs[:len(decls)]
 
 
-def _optimize(module, target_data):
-    """Runs optimization passes on given module."""
+def _compile(decls, libs, name, profile, target_data, trampolines, stats):
+    """Translates *decls* into a new optimized module.
+
+    If *trampolines* is set, native call wrappers are added for all supported *decls*.
+    Functions which have their own profile set are grouped by it, translated
+    and optimized in separate modules, which are then linked together. Any
+    :class:`CppLibrary` instances in *libs* are linked in before optimization.
+
+    Phase timings and instruction counts are recorded in build *stats*.
+
+    Returns the module and the list of functions created for *decls*.
+
+    """
+    groups = []
+    for decl in decls:
+        p = decl.options.get("profile") or profile
+        for group_profile, group in groups:
+            if group_profile == p:
+                group.append(decl)
+                break
+        else:
+            groups.append((p, [decl]))
+
+    module = None
+    funcs = []
+
+    for group_profile, group in groups:
+        group_module, group_funcs = _create_module(group, name, trampolines, stats)
+
+        if module is None:
+            with stats.phase("libs"):
+                for lib in libs:
+                    if not isinstance(lib, basestring):
+                        llvm.link_modules(group_module, lib.create_module())
 
-    # IR optimizations; currently at default opt level.
+        stats.count_instructions(group_module, "before")
+        with stats.phase("optimize"):
+            _optimize(group_module, target_data, group_profile)
+        stats.count_instructions(group_module, "after")
+
+        if module is None:
+            module = group_module
+        else:
+            # Functions called across groups have their private copies
+            # in each one; linker renames them to avoid conflicts.
+            llvm.link_modules(module, group_module)
+
+        funcs.extend(group_funcs)
+
+    # Linking invalidates references to functions in source modules.
+    for func in funcs:
+        func.llvm_func = llvm.GetNamedFunction(module, func.symbol)
+
+    funcs.sort(key=lambda f: decls.index(f.decl))
+    return module, funcs
+
+
+def _optimize(module, target_data, profile):
+    """Runs optimization passes on given module according to *profile*."""
     pm = llvm.CreatePassManager()
     if target_data is not None:
         llvm.AddTargetData(target_data, pm)
 
     pm_builder = llvm.PassManagerBuilderCreate()
-    llvm.PassManagerBuilderUseInlinerWithThreshold(pm_builder, 275)
+    llvm.PassManagerBuilderSetOptLevel(pm_builder, profile.opt_level)
+    llvm.PassManagerBuilderSetSizeLevel(pm_builder, profile.size_level)
+
+    if profile.inline_threshold is not None:
+        llvm.PassManagerBuilderUseInlinerWithThreshold(pm_builder, profile.inline_threshold)
+    else:
+        # Functions with inline option set still need to be inlined.
+        llvm.AddAlwaysInlinerPass(pm)
+
+    llvm.PassManagerBuilderSetVectorize__(pm_builder, profile.loop_vectorize, profile.slp_vectorize)
+
+    if not profile.unroll:
+        llvm.PassManagerBuilderSetDisableUnrollLoops(pm_builder, llvm.TRUE)
+    elif profile.unroll_threshold is not None or profile.unroll_count is not None:
+        llvm.PassManagerBuilderSetUnrollLimits__(pm_builder,
+                                                 _or_default(profile.unroll_threshold),
+                                                 _or_default(profile.unroll_count))
+
     llvm.PassManagerBuilderPopulateModulePassManager(pm_builder, pm)
 
-    if not llvm.RunPassManager(pm, module):
-        raise RuntimeError("Could not run IR optimization passes")
+    # Returned status only tells whether module has been modified,
+    # which isn't the case for eg. trivial functions at level 0.
+    llvm.RunPassManager(pm, module)
 
-    llvm.PassManagerBuilderDispose(pm_builder)
+    # Also releases unroll limits; see PassManagerBuilderSetUnrollLimits__.
+    llvm.PassManagerBuilderDispose__(pm_builder)
     llvm.DisposePassManager(pm)
 
 
-def _random_hex(digits=8):
-    """Generates a random hexadecimal string *n* characters long"""
-    from string import hexdigits
-    from random import choice
+def _or_default(value):
+    """Returns *value* or -1, which makes LLVM use its default, if it's None."""
+    return -1 if value is None else value
+
+
+def _codegen_level(profile, default):
+    """Returns native code generation level for *profile*."""
+    return default if profile.codegen_level is None else profile.codegen_level
+
 
-    return "".join(choice(hexdigits) for _ in range(digits))
+def _module_name(key):
+    """Returns deterministic module name based on its cache *key*."""
+    return "n2o_" + key[:16]
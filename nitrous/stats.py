@@ -0,0 +1,129 @@
+"""Module build statistics.
+
+Every module builder records how long each phase of the build took, both in
+total and per function, along with IR instruction counts before and after
+optimization and the size of the native object produced. The statistics are
+available through :func:`nitrous.module.stats`.
+
+Functions registered with :func:`add_hook` receive the statistics of every
+finished build as a series of structured events (plain dictionaries), which
+can be forwarded to external metrics systems.
+
+"""
+from contextlib import contextmanager
+from time import time
+
+
+#: Build phases in the order they're executed.
+PHASES = ("parse", "emit", "verify", "libs", "optimize", "codegen", "link", "load")
+
+_hooks = []
+
+
+def add_hook(hook):
+    """Registers *hook* to be called with each build statistics event.
+
+    Events are dictionaries with ``"event"`` key set to one of:
+
+    * ``"phase"``: total ``"time"`` spent in the ``"phase"``;
+    * ``"function"``: ``"times"`` per phase and ``"instructions"`` before and
+      after optimization for the ``"function"``;
+    * ``"build"``: emitted last, with total ``"time"``, ``"object_size"``
+      and ``"cached"`` flag.
+
+    All events also carry ``"module"`` name and ``"builder"`` kind.
+
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    """Unregisters previously added *hook*."""
+    _hooks.remove(hook)
+
+
+class BuildStats(object):
+    """Statistics of a single module build."""
+
+    def __init__(self, module_name, builder):
+        self.module_name = module_name
+        self.builder = builder
+        #: True if the module has been loaded from cache.
+        self.cached = False
+        #: Total time in seconds spent in each phase.
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        #: Per-function phase times and instruction counts.
+        self.functions = {}
+        #: Size of the native object in bytes, if one was produced.
+        self.object_size = None
+        self.time = None
+
+        self.__start = time()
+
+    def record(self, phase, elapsed, function=None):
+        """Adds *elapsed* seconds to the *phase*, and *function* if given."""
+        self.phases[phase] += elapsed
+        if function is not None:
+            times = self._function(function)["times"]
+            times[phase] = times.get(phase, 0.0) + elapsed
+
+    @contextmanager
+    def phase(self, phase, function=None):
+        """Records the time spent in the context as *phase*."""
+        t0 = time()
+        try:
+            yield
+        finally:
+            self.record(phase, time() - t0, function)
+
+    def count_instructions(self, module, stage):
+        """Records number of instructions for each function defined in *module*.
+
+        *stage* is either ``"before"`` or ``"after"`` optimization.
+
+        """
+        from . import llvm
+
+        f = llvm.GetFirstFunction(module)
+        while f:
+            if not llvm.IsDeclaration(f):
+                count = llvm.GetInstructionCount__(f)
+                self._function(llvm.GetValueName(f))["instructions"][stage] = count
+            f = llvm.GetNextFunction(f)
+
+    def finish(self):
+        """Completes the build and reports statistics to registered hooks."""
+        self.time = time() - self.__start
+
+        for event in self.events():
+            for hook in _hooks:
+                hook(event)
+
+    def events(self):
+        """Returns the list of events describing this build."""
+        events = []
+
+        for phase in PHASES:
+            events.append(self._event("phase", phase=phase, time=self.phases[phase]))
+
+        for name in sorted(self.functions):
+            f = self.functions[name]
+            events.append(self._event("function", function=name,
+                                      times=dict(f["times"]),
+                                      instructions=dict(f["instructions"])))
+
+        events.append(self._event("build", time=self.time,
+                                  object_size=self.object_size,
+                                  cached=self.cached))
+        return events
+
+    def _event(self, kind, **fields):
+        fields.update(event=kind, module=self.module_name, builder=self.builder)
+        return fields
+
+    def _function(self, name):
+        return self.functions.setdefault(name, {"times": {}, "instructions": {}})
+
+    def __repr__(self):
+        phases = ", ".join("{0}={1:.4f}".format(p, self.phases[p]) for p in PHASES)
+        return "<BuildStats {0} ({1})>".format(self.module_name, phases)
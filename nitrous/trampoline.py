@@ -0,0 +1,391 @@
+"""Native call trampolines.
+
+Trampoline is a function with CPython calling convention (``METH_VARARGS``)
+compiled into the module next to the function it wraps. It unpacks Python
+arguments, calls the function directly and boxes its result, so calls made
+through it bypass ctypes argument conversion and checking altogether.
+
+Only functions with scalar (except :data:`~nitrous.types.Char`), string and
+pointer, array or slice arguments can have a trampoline; pointer, array and
+slice arguments accept any object supporting the buffer protocol, such as
+NumPy arrays, as long as its item format matches (and, for arrays, its size);
+buffers of arguments the function may write into must be writable. Result
+must be a scalar or a string, if any.
+
+"""
+from __future__ import absolute_import
+import ctypes
+
+from . import llvm
+from .types import Scalar, Pointer, Reference, Bool, Char, String, Int, Index, Byte
+from .types.array import Array, FastSlice, Slice, Any
+from .types.buffer import PyBuffer, PyBUF_C_CONTIGUOUS, PyBUF_FORMAT, PyBUF_WRITABLE
+
+
+METH_VARARGS = 0x0001
+
+class _PyMethodDef(ctypes.Structure):
+    _fields_ = [("ml_name", ctypes.c_char_p),
+                ("ml_meth", ctypes.c_void_p),
+                ("ml_flags", ctypes.c_int),
+                ("ml_doc", ctypes.c_char_p)]
+
+
+def symbol(func_symbol):
+    """Returns trampoline symbol name for a function exported as *func_symbol*."""
+    return func_symbol + "__py"
+
+
+def supported(decl):
+    """Returns True if a trampoline can be generated for function *decl*."""
+    if decl.restype is not None and _result_kind(decl.restype) is None:
+        return False
+    return all(_arg_kind(decl.argtypes[arg]) is not None for arg in decl.args)
+
+
+def wrap(func, address, owner):
+    """Returns builtin function calling trampoline of *func* at *address*.
+
+    *owner* is an object with ``refs`` list which must be kept alive for as long
+    as compiled code is in use; it is referenced by the returned callable.
+
+    """
+    method = _PyMethodDef(func.__name__, address, METH_VARARGS, func.decl.pyfunc.__doc__)
+    owner.refs.append(method)
+
+    new_cfunction = ctypes.pythonapi.PyCFunction_NewEx
+    new_cfunction.restype = ctypes.py_object
+    new_cfunction.argtypes = [ctypes.POINTER(_PyMethodDef), ctypes.py_object, ctypes.py_object]
+
+    return new_cfunction(ctypes.byref(method), owner, None)
+
+
+def emit_trampoline(module, func):
+    """Adds trampoline calling *func* to *module*; returns the new LLVM function."""
+    from .analysis import written_args
+
+    decl = func.decl
+
+    obj_type = _object_type()
+    params = (llvm.TypeRef * 2)(obj_type, obj_type)
+    ty = llvm.FunctionType(obj_type, params, 2, False)
+    f = llvm.AddFunction(module, symbol(func.symbol), ty)
+
+    b = _TrampolineBuilder(f)
+
+    # Unpack exact number of arguments from the argument tuple.
+    n = len(decl.args)
+    objs = [llvm.BuildAlloca(b.builder, obj_type, arg) for arg in decl.args]
+    name = b.string(decl.__name__)
+    count = llvm.ConstInt(Index.llvm_type, n, True)
+    ok = b.call("PyArg_UnpackTuple", Int.llvm_type,
+                [obj_type, obj_type, Index.llvm_type, Index.llvm_type],
+                [llvm.GetParam(f, 1), name, count, count] + objs, vararg=True)
+    b.check(llvm.BuildICmp(b.builder, llvm.IntEQ, ok, llvm.ConstInt(Int.llvm_type, 0, True), ""))
+
+    written = written_args(decl)
+    args = []
+    for arg, obj in zip(decl.args, objs):
+        t = decl.argtypes[arg]
+        args.append(b.emit_arg(_arg_kind(t), t, llvm.BuildLoad(b.builder, obj, arg),
+                               arg in written))
+
+    result = llvm.BuildCall(b.builder, func.llvm_func,
+                            (llvm.ValueRef * n)(*args), n, "")
+
+    b.release_buffers()
+    llvm.BuildRet(b.builder, b.emit_result(decl.restype, result))
+
+    llvm.DisposeBuilder(b.builder)
+    return f
+
+
+class _TrampolineBuilder(object):
+    """Emits IR converting values between Python objects and native types."""
+
+    def __init__(self, func):
+        self.func = func
+        self.module = llvm.GetGlobalParent(func)
+        self.builder = llvm.CreateBuilder()
+        llvm.PositionBuilderAtEnd(self.builder, llvm.AppendBasicBlock(func, "entry"))
+        # Buffer views acquired so far, to be released on exit.
+        self.views = []
+
+    def call(self, name, restype, argtypes, args, vararg=False):
+        """Emits call to a C API function, declaring it first if needed."""
+        f = llvm.GetNamedFunction(self.module, name)
+        if not f:
+            params = (llvm.TypeRef * len(argtypes))(*argtypes)
+            f = llvm.AddFunction(self.module, name,
+                                 llvm.FunctionType(restype, params, len(argtypes), vararg))
+
+        return llvm.BuildCall(self.builder, f, (llvm.ValueRef * len(args))(*args), len(args), "")
+
+    def string(self, s):
+        """Emits pointer to a constant string."""
+        from .function import emit_constant_string
+        return emit_constant_string(self.builder, s)
+
+    def check(self, failed):
+        """Emits early exit if *failed* condition is true.
+
+        Python exception must be already set when the condition holds.
+
+        """
+        fail_block = llvm.AppendBasicBlock(self.func, "fail")
+        ok_block = llvm.AppendBasicBlock(self.func, "ok")
+        llvm.BuildCondBr(self.builder, failed, fail_block, ok_block)
+
+        llvm.PositionBuilderAtEnd(self.builder, fail_block)
+        self.release_buffers()
+        llvm.BuildRet(self.builder, llvm.ConstNull(_object_type()))
+
+        llvm.PositionBuilderAtEnd(self.builder, ok_block)
+
+    def check_error(self, v, error_value):
+        """Emits early exit if *v* equals *error_value* and exception is set."""
+        if llvm.GetTypeKind(llvm.TypeOf(v)) == llvm.IntegerTypeKind:
+            is_error_value = llvm.BuildICmp(self.builder, llvm.IntEQ, v, error_value, "")
+        else:
+            is_error_value = llvm.BuildFCmp(self.builder, llvm.RealOEQ, v, error_value, "")
+
+        occurred = self.call("PyErr_Occurred", _object_type(), [], [])
+        is_set = llvm.BuildICmp(self.builder, llvm.IntNE, occurred, llvm.ConstNull(_object_type()), "")
+        self.check(llvm.BuildAnd(self.builder, is_error_value, is_set, ""))
+
+    def raise_error(self, failed, exc_name, message):
+        """Emits exception raise with *message* if *failed* condition is true."""
+        exc = llvm.GetNamedGlobal(self.module, exc_name)
+        if not exc:
+            exc = llvm.AddGlobal(self.module, _object_type(), exc_name)
+
+        fail_block = llvm.AppendBasicBlock(self.func, "raise")
+        ok_block = llvm.AppendBasicBlock(self.func, "ok")
+        llvm.BuildCondBr(self.builder, failed, fail_block, ok_block)
+
+        llvm.PositionBuilderAtEnd(self.builder, fail_block)
+        self.call("PyErr_SetString", llvm.VoidType(), [_object_type(), _object_type()],
+                  [llvm.BuildLoad(self.builder, exc, ""), self.string(message)])
+        self.release_buffers()
+        llvm.BuildRet(self.builder, llvm.ConstNull(_object_type()))
+
+        llvm.PositionBuilderAtEnd(self.builder, ok_block)
+
+    def release_buffers(self):
+        for view in self.views:
+            self.call("PyBuffer_Release", llvm.VoidType(), [llvm.TypeOf(view)], [view])
+
+    def emit_arg(self, kind, t, obj, writable=True):
+        """Emits conversion of Python object *obj* to a value of type *t*.
+
+        Buffers are requested to be *writable* if set.
+
+        """
+        obj_type = _object_type()
+        long_type = Index.llvm_type
+
+        if kind == "int":
+            v = self.call("PyInt_AsLong", long_type, [obj_type], [obj])
+            self.check_error(v, llvm.ConstInt(long_type, -1, True))
+            if llvm.GetIntTypeWidth(t.llvm_type) < llvm.GetIntTypeWidth(long_type):
+                v = llvm.BuildCast(self.builder, llvm.Trunc, v, t.llvm_type, "")
+            return v
+
+        elif kind == "bool":
+            v = self.call("PyObject_IsTrue", Int.llvm_type, [obj_type], [obj])
+            zero = llvm.ConstInt(Int.llvm_type, 0, True)
+            self.check(llvm.BuildICmp(self.builder, llvm.IntSLT, v, zero, ""))
+            v = llvm.BuildICmp(self.builder, llvm.IntNE, v, zero, "")
+            return llvm.BuildCast(self.builder, llvm.ZExt, v, t.llvm_type, "")
+
+        elif kind == "float":
+            v = self.call("PyFloat_AsDouble", llvm.DoubleType(), [obj_type], [obj])
+            self.check_error(v, llvm.ConstReal(llvm.DoubleType(), -1.0))
+            if llvm.GetTypeKind(t.llvm_type) != llvm.DoubleTypeKind:
+                v = llvm.BuildCast(self.builder, llvm.FPTrunc, v, t.llvm_type, "")
+            return v
+
+        elif kind == "string":
+            v = self.call("PyString_AsString", obj_type, [obj_type], [obj])
+            self.check(llvm.BuildICmp(self.builder, llvm.IntEQ, v, llvm.ConstNull(obj_type), ""))
+            return v
+
+        elif kind == "buffer":
+            if isinstance(t, Reference):
+                view = self._get_buffer(obj, t.value_type.element_type, writable)
+
+                # Arrays have a fixed size, unlike pointers and fast slices.
+                size = ctypes.sizeof(t.value_type.c_type)
+                length, _ = PyBuffer.emit_getattr(self.builder, view, "len")
+                self.raise_error(llvm.BuildICmp(self.builder, llvm.IntNE, length,
+                                                llvm.ConstInt(Index.llvm_type, size, True), ""),
+                                 "PyExc_TypeError",
+                                 "Expected array of {0} bytes".format(size))
+            else:
+                view = self._get_buffer(obj, t.element_type, writable)
+
+            data, _ = PyBuffer.emit_getattr(self.builder, view, "buf")
+            return llvm.BuildPointerCast(self.builder, data, t.llvm_type, "")
+
+        elif kind == "slice":
+            slice_type = t.value_type
+            view = self._get_buffer(obj, slice_type.element_type, writable)
+
+            ndim, _ = PyBuffer.emit_getattr(self.builder, view, "ndim")
+            expected = llvm.ConstInt(Int.llvm_type, len(slice_type.shape), True)
+            self.raise_error(llvm.BuildICmp(self.builder, llvm.IntNE, ndim, expected, ""),
+                             "PyExc_ValueError",
+                             "Expected {0}-dimensional buffer".format(len(slice_type.shape)))
+
+            s = llvm.BuildAlloca(self.builder, slice_type.llvm_type, "slice")
+            data, _ = PyBuffer.emit_getattr(self.builder, view, "buf")
+            data = llvm.BuildPointerCast(self.builder, data,
+                                         llvm.PointerType(slice_type.element_type.llvm_type, 0), "")
+            slice_type._struct.emit_setattr(self.builder, s, "data", data)
+            # Memory belongs to the buffer exporter.
+            slice_type._struct.emit_setattr(self.builder, s, "base", Pointer(Byte).null)
+
+            src_shape, _ = PyBuffer.emit_getattr(self.builder, view, "shape")
+            dst_shape, dst_shape_type = slice_type._struct.emit_getattr(self.builder, s, "shape")
+            for i in range(len(slice_type.shape)):
+                idx = llvm.ConstInt(Index.llvm_type, i, True)
+                dim_p = llvm.BuildGEP(self.builder, src_shape, ctypes.byref(idx), 1, "")
+                dim = llvm.BuildLoad(self.builder, dim_p, "")
+                if slice_type.shape[i] is not Any:
+                    static = llvm.ConstInt(Index.llvm_type, slice_type.shape[i], True)
+                    self.raise_error(llvm.BuildICmp(self.builder, llvm.IntNE, dim, static, ""),
+                                     "PyExc_ValueError",
+                                     "Buffer shape doesn't match {0}".format(slice_type))
+                dst_shape_type.value_type.emit_setitem(self.builder, dst_shape, (idx,), dim)
+
+            return s
+
+        raise TypeError("Unsupported trampoline argument type {0}".format(t))
+
+    def emit_result(self, restype, v):
+        """Emits conversion of function result *v* to a new Python object."""
+        obj_type = _object_type()
+        long_type = Index.llvm_type
+
+        if restype is None:
+            # Empty format returns new reference to None.
+            return self.call("Py_BuildValue", obj_type, [obj_type], [self.string("")], vararg=True)
+
+        kind = _result_kind(restype)
+
+        if kind == "int":
+            if llvm.GetIntTypeWidth(restype.llvm_type) < llvm.GetIntTypeWidth(long_type):
+                v = llvm.BuildCast(self.builder, llvm.SExt, v, long_type, "")
+            return self.call("PyInt_FromLong", obj_type, [long_type], [v])
+
+        elif kind == "bool":
+            v = llvm.BuildCast(self.builder, llvm.ZExt, v, long_type, "")
+            return self.call("PyBool_FromLong", obj_type, [long_type], [v])
+
+        elif kind == "float":
+            if llvm.GetTypeKind(restype.llvm_type) != llvm.DoubleTypeKind:
+                v = llvm.BuildCast(self.builder, llvm.FPExt, v, llvm.DoubleType(), "")
+            return self.call("PyFloat_FromDouble", obj_type, [llvm.DoubleType()], [v])
+
+        elif kind == "string":
+            return self.call("PyString_FromString", obj_type, [obj_type], [v])
+
+        raise TypeError("Unsupported trampoline result type {0}".format(restype))
+
+    def _get_buffer(self, obj, element_type, writable):
+        """Emits buffer view acquisition for *obj*; returns pointer to the view.
+
+        Buffer items must match *element_type*, the same way they're checked
+        for ctypes calls, and buffer must be *writable* if set.
+
+        """
+        view = llvm.BuildAlloca(self.builder, PyBuffer.llvm_type, "view")
+        flags = llvm.ConstInt(Int.llvm_type,
+                              PyBUF_C_CONTIGUOUS | PyBUF_FORMAT |
+                              (PyBUF_WRITABLE if writable else 0), True)
+        status = self.call("PyObject_GetBuffer", Int.llvm_type,
+                           [_object_type(), llvm.TypeOf(view), Int.llvm_type],
+                           [obj, view, flags])
+        self.check(llvm.BuildICmp(self.builder, llvm.IntNE, status,
+                                  llvm.ConstInt(Int.llvm_type, 0, True), ""))
+        self.views.append(view)
+
+        itemsize, _ = PyBuffer.emit_getattr(self.builder, view, "itemsize")
+        expected = llvm.ConstInt(Index.llvm_type, ctypes.sizeof(element_type.c_type), True)
+        self.raise_error(llvm.BuildICmp(self.builder, llvm.IntNE, itemsize, expected, ""),
+                         "PyExc_TypeError",
+                         "Buffer item size doesn't match {0}".format(element_type))
+
+        self._check_format(view, element_type)
+        return view
+
+    def _check_format(self, view, element_type):
+        """Emits check of buffer *view* format against *element_type*."""
+        from .types.buffer import matching_formats
+
+        formats = matching_formats(element_type.c_type)
+        if formats is None:
+            return
+
+        format, _ = PyBuffer.emit_getattr(self.builder, view, "format")
+        # Format is left NULL by some exporters for unsigned bytes.
+        is_null = llvm.BuildICmp(self.builder, llvm.IntEQ, format,
+                                 llvm.ConstNull(llvm.TypeOf(format)), "")
+        format = llvm.BuildSelect(self.builder, is_null, self.string("B"), format, "")
+
+        matched = llvm.ConstInt(llvm.IntType(1), 0, False)
+        zero = llvm.ConstInt(Int.llvm_type, 0, True)
+        for f in formats:
+            cmp = self.call("strcmp", Int.llvm_type, [_object_type(), _object_type()],
+                            [format, self.string(f)])
+            matched = llvm.BuildOr(self.builder, matched,
+                                   llvm.BuildICmp(self.builder, llvm.IntEQ, cmp, zero, ""), "")
+
+        self.raise_error(llvm.BuildNot(self.builder, matched, ""), "PyExc_TypeError",
+                         "Buffer format doesn't match {0}".format(element_type))
+
+
+def _object_type():
+    """Type of PyObject pointers; treated as opaque."""
+    return llvm.PointerType(Byte.llvm_type, 0)
+
+
+def _scalar_kind(t):
+    if t is Char:
+        # ctypes passes these as single-character strings.
+        return None
+    elif t is String:
+        return "string"
+    elif t is Bool:
+        return "bool"
+
+    kind = llvm.GetTypeKind(t.llvm_type)
+    if kind == llvm.IntegerTypeKind:
+        return "int"
+    elif kind in (llvm.FloatTypeKind, llvm.DoubleTypeKind):
+        return "float"
+
+    return None
+
+
+def _arg_kind(t):
+    """Returns kind of argument conversion for type *t*, or None if unsupported."""
+    if getattr(getattr(t, "value_type", t), "layout", "C") != "C":
+        # Buffers are requested to be C-contiguous.
+        return None
+    elif isinstance(t, Scalar):
+        return _scalar_kind(t)
+    elif isinstance(t, (Pointer, FastSlice)):
+        return "buffer" if isinstance(t.element_type, Scalar) else None
+    elif isinstance(t, Reference):
+        if isinstance(t.value_type, Array):
+            return "buffer"
+        elif isinstance(t.value_type, Slice):
+            return "slice"
+
+    return None
+
+
+def _result_kind(t):
+    """Returns kind of result conversion for type *t*, or None if unsupported."""
+    return _scalar_kind(t) if isinstance(t, Scalar) else None
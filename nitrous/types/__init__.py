@@ -109,6 +109,37 @@ class Pointer(object):
 
         return p
 
+    def converter(self, writable=True):
+        """Returns function equivalent to :meth:`convert`, with pointer type resolved once.
+
+        Besides NumPy arrays and ctypes objects, accepts any object supporting
+        the buffer protocol (see :mod:`nitrous.types.buffer`), which has to be
+        *writable* if set. Element types of arrays and buffers are checked.
+
+        """
+        from .array import ndarray_checker, buffer_or_none
+
+        pointer_type = ctypes.POINTER(self.element_type.c_type)
+        check = ndarray_checker(self.element_type, writable)
+
+        try:
+            from numpy import ndarray
+        except ImportError:
+            ndarray = ()
+
+        def convert(p):
+            if isinstance(p, ndarray):
+                check(p)
+                return p.ctypes.data_as(pointer_type)
+            if p is None or isinstance(p, _CDATA):
+                return p
+
+            buf = buffer_or_none(p, self.element_type, writable)
+            # Let ctypes report incompatible arguments.
+            return p if buf is None else buf.pointer(pointer_type)
+
+        return convert
+
 
 class Structure(object):
 
@@ -153,16 +184,24 @@ class Structure(object):
 
     def emit_getattr(self, builder, ref, attr):
         """IR: Emits attribute value load from structure reference."""
+        from .tbaa import annotate
+
         gep, t = self._field_gep(builder, ref, attr)
         if is_aggregate(t):
             return gep, Reference(t)
         else:
-            return llvm.BuildLoad(builder, gep, "v"), t
+            return annotate(llvm.BuildLoad(builder, gep, "v"), t), t
 
     def emit_setattr(self, builder, ref, attr, v):
         """IR: Emits GEP used to set the attribute value."""
-        addr, _ = self._field_gep(builder, ref, attr)
-        llvm.BuildStore(builder, v, addr)
+        from .tbaa import annotate
+
+        addr, t = self._field_gep(builder, ref, attr)
+        annotate(llvm.BuildStore(builder, v, addr), t)
+
+    def emit_extent(self, builder, ref):
+        """IR: Returns integer addresses where structure *ref* starts and ends."""
+        return emit_address_range(builder, ref, const_index(0), const_index(1))
 
     def _field_gep(self, builder, p, field):
         """Returns GEP and type for a *field*"""
@@ -197,6 +236,14 @@ class Reference(object):
                             if hasattr(self.value_type, "convert")
                             else v)
 
+    def converter(self, writable=True):
+        """Returns function equivalent to :meth:`convert`."""
+        byref = ctypes.byref
+        convert = converter(self.value_type, writable)
+        if convert is None:
+            return byref
+        return lambda v: byref(convert(v))
+
 
 String = Scalar(ctypes.c_char_p, Pointer(Char).llvm_type, "String", "S")
 """Null-terminated byte string.
@@ -208,7 +255,34 @@ that it provides a better Python interop by mapping to
 """
 
 
+def converter(ty, writable=True):
+    """Returns function converting Python values to arguments of type *ty*.
+
+    Types can provide a ``converter(writable)`` factory which precomputes
+    anything that doesn't depend on the actual value, with ``convert`` method
+    used otherwise. Array memory has to be *writable* if set. Returns None if
+    values are passed to ctypes as is.
+
+    """
+    if hasattr(ty, "converter"):
+        return ty.converter(writable)
+    return getattr(ty, "convert", None)
+
+
+# Base classes of ctypes objects, which are passed to ctypes as is.
+_CDATA = (ctypes.Array, ctypes.Structure, ctypes.Union, ctypes._Pointer, ctypes._SimpleCData)
+
+
 def is_aggregate(ty):
     """Returns True if type is an aggregate."""
     kind = llvm.GetTypeKind(ty.llvm_type)
     return kind in (llvm.StructTypeKind, llvm.ArrayTypeKind)
+
+
+def emit_address_range(builder, p, lo, hi):
+    """IR: Returns integer addresses of items *lo* and *hi* of pointer *p*."""
+    def address(k):
+        gep = llvm.BuildGEP(builder, p, ctypes.byref(k), 1, "")
+        return llvm.BuildCast(builder, llvm.PtrToInt, gep, Index.llvm_type, "")
+
+    return address(lo), address(hi)
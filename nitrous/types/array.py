@@ -1,4 +1,6 @@
-from . import Pointer, Structure, Reference, Index, const_index, is_aggregate
+from . import Pointer, Structure, Reference, Index, Byte, const_index, is_aggregate, _CDATA
+from . import emit_address_range
+from . import tbaa
 from .. import llvm
 import ctypes
 
@@ -8,7 +10,7 @@ except ImportError:
     np = None
 
 
-__all__ = ["Any", "Array", "FastSlice", "Slice"]
+__all__ = ["Any", "Array", "FastSlice", "Slice", "StridedSlice"]
 
 
 class _AnyClass(object):
@@ -22,30 +24,48 @@ Any = _AnyClass()
 
 
 class _ItemAccessor(object):
-    """Mixin for common Array/Slice item accessing routines."""
+    """Mixin for common Array/Slice item accessing routines.
+
+    Items are laid out in row-major ("C") or column-major ("F") order,
+    depending on the *layout* attribute.
+
+    """
+
+    layout = "C"
+
+    #: Whether dimensions declared as ``Any`` are known at runtime.
+    runtime_shape = False
 
     def emit_getitem(self, builder, v, i):
-        if len(i) < len(self.shape):
+        if any(isinstance(k, IndexRange) for k in i):
+            return self._emit_view(builder, v, i)
+        elif len(i) < len(self.shape):
             return self._emit_subslice(builder, v, i)
         else:
             gep = self._item_gep(builder, v, i)
             if is_aggregate(self.element_type):
                 return gep, Reference(self.element_type)
             else:
-                return llvm.BuildLoad(builder, gep, "getitem"), self.element_type
+                load = llvm.BuildLoad(builder, gep, "getitem")
+                return tbaa.annotate(load, self.element_type), self.element_type
 
     def emit_setitem(self, builder, v, i, e):
         if not llvm.types_equal(self.element_type.llvm_type, llvm.TypeOf(e)):
             # FIXME because we don't have e's nitrous type, for now just state
             # what the type *should* be for assignment to succeed.
             raise TypeError("Element value must be a(n) {0}".format(self.element_type))
+        if any(isinstance(k, IndexRange) for k in i):
+            raise TypeError("Cannot assign to a range of items")
         gep = self._item_gep(builder, v, i)
-        llvm.BuildStore(builder, e, gep)
+        tbaa.annotate(llvm.BuildStore(builder, e, gep), self.element_type)
 
     def _emit_subslice(self, builder, v, i):
         """Emits a sub-slice based on partial index *i*"""
         from ..function import entry_alloca
 
+        if self.layout == "F":
+            return self._emit_strided_subslice(builder, v, i)
+
         SSTy = Slice(self.element_type, self.shape[len(i):])
         ss = entry_alloca(builder, SSTy.llvm_type, "subslice")
 
@@ -61,9 +81,252 @@ class _ItemAccessor(object):
         # Setting pointer to data sub-block.
         data_idx = i + (const_index(0),) * (len(self.shape) - len(i))
         SSTy._struct.emit_setattr(builder, ss, "data", self._item_gep(builder, v, data_idx))
+        SSTy._struct.emit_setattr(builder, ss, "base", self._emit_base(builder, v))
+
+        return ss, SSTy
+
+    def _emit_strided_subslice(self, builder, v, i):
+        """Emits a strided sub-slice of column-major items based on partial index *i*.
+
+        Items with fixed major indices aren't contiguous in column-major
+        layout, so the result is a :class:`StridedSlice`.
+
+        """
+        from ..function import entry_alloca
+        from operator import mul
+
+        n = len(i)
+        static_strides = [Any if Any in self.shape[:k] else reduce(mul, self.shape[:k], 1)
+                          for k in range(len(self.shape))]
+        SSTy = StridedSlice(self.element_type, self.shape[n:], static_strides[n:])
+        ss = entry_alloca(builder, SSTy.llvm_type, "subslice")
+
+        subshape, subshape_ty = SSTy._struct.emit_getattr(builder, ss, "shape")
+        substrides, substrides_ty = SSTy._struct.emit_getattr(builder, ss, "strides")
+        shape, shape_ty = self.emit_getattr(builder, v, "shape")
+
+        stride = const_index(1)
+        for k in range(len(self.shape)):
+            if self.shape[k] is Any:
+                dim, _ = shape_ty.value_type.emit_getitem(builder, shape, (const_index(k),))
+            else:
+                dim = const_index(self.shape[k])
+            if k >= n:
+                subshape_ty.value_type.emit_setitem(builder, subshape, (const_index(k - n),), dim)
+                substrides_ty.value_type.emit_setitem(builder, substrides, (const_index(k - n),),
+                                                      stride)
+            stride = llvm.BuildMul(builder, stride, dim, "stride")
+
+        data_idx = i + (const_index(0),) * (len(self.shape) - n)
+        SSTy._struct.emit_setattr(builder, ss, "data", self._item_gep(builder, v, data_idx))
+        SSTy._struct.emit_setattr(builder, ss, "base", self._emit_base(builder, v))
 
         return ss, SSTy
 
+    def _emit_view(self, builder, v, i):
+        """Emits a view of items selected by index *i* containing ranges.
+
+        View is a slice pointing into the same memory, with a dimension for
+        each range; missing trailing indices select whole dimensions. Result
+        is a regular :class:`Slice` if the selected items are contiguous, or
+        a :class:`StridedSlice` otherwise.
+
+        Range bounds follow Python rules: negative ones count from the end
+        and both are clamped to the dimension. Dimensions of unknown size
+        (``Any`` in fast slices) have negative bounds clamped to zero.
+
+        """
+        from ..function import entry_alloca
+
+        ndim = len(self.shape)
+        if len(i) > ndim:
+            raise TypeError("Too many indices for {0}-dimensional {1}".format(ndim, self))
+        i = tuple(i) + (IndexRange(None, None),) * (ndim - len(i))
+        kept = [k for k in range(ndim) if isinstance(i[k], IndexRange)]
+
+        dims = self._emit_dims(builder, v)
+
+        start = []
+        lengths = []
+        for k, index in enumerate(i):
+            if not isinstance(index, IndexRange):
+                start.append(index)
+                continue
+
+            if index.stop is None and dims[k] is None:
+                raise TypeError("Range over dimension {0} of {1} needs an explicit end"
+                                .format(k, self))
+            lo = (_emit_range_bound(builder, index.start, dims[k])
+                  if index.start is not None else const_index(0))
+            hi = (_emit_range_bound(builder, index.stop, dims[k])
+                  if index.stop is not None else dims[k])
+
+            start.append(lo)
+            lengths.append(_emit_max(builder, llvm.BuildSub(builder, hi, lo, "n"), const_index(0)))
+
+        # Whole static dimensions remain static.
+        view_shape = tuple(self.shape[k] if i[k].whole else Any for k in kept)
+
+        if self._contiguous_view(i, kept):
+            T = Slice(self.element_type, view_shape, layout=self.layout)
+        else:
+            static_strides = self._static_strides()
+            T = StridedSlice(self.element_type, view_shape, [static_strides[k] for k in kept])
+
+        view = entry_alloca(builder, T.llvm_type, "view")
+        T._struct.emit_setattr(builder, view, "data", self._item_gep(builder, v, tuple(start)))
+        T._struct.emit_setattr(builder, view, "base", self._emit_base(builder, v))
+
+        view_dims, view_dims_ty = T._struct.emit_getattr(builder, view, "shape")
+        for j, n in enumerate(lengths):
+            view_dims_ty.value_type.emit_setitem(builder, view_dims, (const_index(j),), n)
+
+        if isinstance(T, StridedSlice):
+            strides = self._emit_strides(builder, v, dims)
+            view_strides, view_strides_ty = T._struct.emit_getattr(builder, view, "strides")
+            for j, k in enumerate(kept):
+                view_strides_ty.value_type.emit_setitem(builder, view_strides,
+                                                        (const_index(j),), strides[k])
+
+        return view, Reference(T)
+
+    def _emit_base(self, builder, v):
+        """Returns heap block holding items of *v*, if allocated by compiled code.
+
+        Only slices keep track of it (see :mod:`nitrous.lib.memory`);
+        null pointer is returned for anything else.
+
+        """
+        return Pointer(Byte).null
+
+    def emit_extent(self, builder, v):
+        """IR: Returns integer addresses where items of *v* start and end.
+
+        Returns None if the size isn't known, as for fast slices
+        with dimensions declared as ``Any``.
+
+        """
+        dims = self._emit_dims(builder, v)
+        if any(d is None for d in dims):
+            return None
+
+        n = const_index(1)
+        for d in dims:
+            n = llvm.BuildMul(builder, n, d, "n")
+
+        p = self._item_gep(builder, v, (const_index(0),) * len(dims))
+        return emit_address_range(builder, p, const_index(0), n)
+
+    def _emit_dims(self, builder, v):
+        """Returns sizes of dimensions of *v*; constant if static, None if unknown."""
+        if not self.runtime_shape or all(d is not Any for d in self.shape):
+            return [None if d is Any else const_index(d) for d in self.shape]
+
+        shape, shape_ty = self.emit_getattr(builder, v, "shape")
+
+        def emit_dimension(k):
+            if self.shape[k] is not Any:
+                return const_index(self.shape[k])
+            d, _ = shape_ty.value_type.emit_getitem(builder, shape, (const_index(k),))
+            return d
+
+        return [emit_dimension(k) for k in range(len(self.shape))]
+
+    def _contiguous_view(self, i, kept):
+        """Returns True if items selected by full index *i* are contiguous.
+
+        That's the case if all dimensions minor to the major kept one are
+        selected whole.
+
+        """
+        if self.layout == "F":
+            minor = range(kept[-1])
+        else:
+            minor = range(kept[0] + 1, len(self.shape))
+        return all(isinstance(i[k], IndexRange) and i[k].whole for k in minor)
+
+    def _static_strides(self):
+        """Returns strides of dimensions in elements; ``Any`` where not static."""
+        n = len(self.shape)
+        order = range(n) if self.layout == "F" else range(n - 1, -1, -1)
+
+        strides = [None] * n
+        stride = 1
+        for k in order:
+            strides[k] = stride
+            stride = Any if stride is Any or self.shape[k] is Any else stride * self.shape[k]
+        return strides
+
+    def _emit_strides(self, builder, v, dims):
+        """Emits strides of dimensions in elements, given their sizes *dims*."""
+        n = len(self.shape)
+        order = range(n) if self.layout == "F" else range(n - 1, -1, -1)
+
+        strides = [None] * n
+        stride = const_index(1)
+        for k in order:
+            strides[k] = stride
+            if dims[k] is not None:
+                stride = llvm.BuildMul(builder, stride, dims[k], "stride")
+        return strides
+
+    def _minor_dims(self):
+        """Returns indices of dimensions whose sizes determine item offsets.
+
+        These are all but the major dimension, which is the first one in
+        row-major layout and the last one in column-major layout.
+
+        """
+        n = len(self.shape)
+        return range(n - 1) if self.layout == "F" else range(1, n)
+
+
+class IndexRange(object):
+    """Range of indices ``start:stop`` along a dimension; either bound can be None.
+
+    Indexing arrays and slices with ranges produces views (see
+    :meth:`_ItemAccessor._emit_view`).
+
+    """
+
+    def __init__(self, start, stop):
+        self.start = start
+        self.stop = stop
+
+    @property
+    def whole(self):
+        """True if range covers the whole dimension."""
+        return self.start is None and self.stop is None
+
+
+def _emit_min(builder, a, b):
+    return llvm.BuildSelect(builder, llvm.BuildICmp(builder, llvm.IntSLT, a, b, ""), a, b, "min")
+
+
+def _emit_max(builder, a, b):
+    return llvm.BuildSelect(builder, llvm.BuildICmp(builder, llvm.IntSGT, a, b, ""), a, b, "max")
+
+
+def _emit_range_bound(builder, b, n):
+    """Emits range bound *b* normalized to ``[0, n]`` as Python does; *n* may be None."""
+    zero = const_index(0)
+    if n is None:
+        return _emit_max(builder, b, zero)
+
+    negative = llvm.BuildICmp(builder, llvm.IntSLT, b, zero, "")
+    wrapped = _emit_max(builder, llvm.BuildAdd(builder, b, n, ""), zero)
+    return llvm.BuildSelect(builder, negative, wrapped, _emit_min(builder, b, n), "bound")
+
+
+def _check_layout(layout):
+    if layout not in ("C", "F"):
+        raise ValueError("Layout must be either 'C' or 'F', got {0!r}".format(layout))
+    return layout
+
+
+def _layout_repr(layout):
+    return "" if layout == "C" else ", layout={0!r}".format(layout)
+
 
 class Array(_ItemAccessor):
     """Array backed by llvm.ArrayType rather than pointer to memory.
@@ -74,12 +337,14 @@ class Array(_ItemAccessor):
 
     """
 
-    def __init__(self, element_type, shape):
+    def __init__(self, element_type, shape, layout="C"):
         self.element_type = element_type
         self.shape = shape
+        self.layout = _check_layout(layout)
 
     def __repr__(self):
-        return "Array({0}, shape={1})".format(self.element_type, repr(self.shape))
+        return "Array({0}, shape={1}{2})".format(self.element_type, repr(self.shape),
+                                                 _layout_repr(self.layout))
 
     def __str__(self):
         return "<Array {0}>".format(shape_str(self.element_type, self.shape))
@@ -117,13 +382,44 @@ class Array(_ItemAccessor):
     @property
     def tag(self):
         shape_tag = "".join("d{0}".format(d) for d in self.shape)
-        return "A{0}{1}".format(shape_tag, self.element_type.tag)
+        return "A{0}{1}{2}".format(self.layout.replace("C", ""), shape_tag, self.element_type.tag)
 
     def convert(self, p):
         if np and isinstance(p, np.ndarray):
             p = np.ctypeslib.as_ctypes(p)
         return p
 
+    def converter(self, writable=True):
+        """Returns function equivalent to :meth:`convert`.
+
+        Instead of building new ctypes array type on every call, contiguous
+        ndarray or buffer memory is mapped directly onto the array type.
+
+        """
+        c_type = self.c_type
+        size = ctypes.sizeof(c_type)
+        check = ndarray_checker(self.element_type, writable, self.layout)
+
+        def convert(p):
+            if np and isinstance(p, np.ndarray):
+                check(p)
+                address, nbytes, buf = p.ctypes.data, p.nbytes, None
+            else:
+                buf = buffer_or_none(p, self.element_type, writable, self.layout)
+                if buf is None:
+                    return p
+                address, nbytes = buf.address, buf.itemsize * _product(buf.shape)
+
+            if nbytes != size:
+                raise TypeError("Expected array of {0} bytes, got {1}".format(size, nbytes))
+
+            a = c_type.from_address(address)
+            # Memory isn't referenced by arrays created from address.
+            a._n2o_buffer = buf
+            return a
+
+        return convert
+
     def emit_getattr(self, builder, ref, attr):
         ndim = len(self.shape)
 
@@ -143,6 +439,7 @@ class Array(_ItemAccessor):
                 shape = llvm.AddGlobal(module, llvm.TypeOf(shape_init), shape_name)
                 llvm.SetInitializer(shape, shape_init)
                 llvm.SetGlobalConstant(shape, llvm.TRUE)
+                llvm.SetLinkage(shape, llvm.PrivateLinkage)
 
             return shape, Array(Index, (ndim,))
 
@@ -157,9 +454,8 @@ class Array(_ItemAccessor):
         # TODO check const shape dimension values?
 
         # Build conversion from ND-index to flat memory offset
-        # FIXME currently assumes row-major memory alignment, first dimension can vary
-        const_shape = map(const_index, self.shape[1:])
-        ii = flatten_index(builder, i, const_shape)
+        const_shape = [const_index(self.shape[d]) for d in self._minor_dims()]
+        ii = flatten_index(builder, i, const_shape, self.layout)
         # Cast so that we can get GEP to a particular element.
         p_type = llvm.PointerType(self.element_type.llvm_type, 0)
         p = llvm.BuildPointerCast(builder, v, p_type, "array.ptr")
@@ -168,13 +464,15 @@ class Array(_ItemAccessor):
 
 class FastSlice(_ItemAccessor):
 
-    def __init__(self, element_type, shape=(Any,)):
+    def __init__(self, element_type, shape=(Any,), layout="C"):
         self.element_type = element_type
         self.shape = shape
         self.ndim = len(shape)
+        self.layout = _check_layout(layout)
 
     def __repr__(self):
-        return "FastSlice({0}, shape={1})".format(self.element_type, repr(self.shape))
+        return "FastSlice({0}, shape={1}{2})".format(self.element_type, repr(self.shape),
+                                                     _layout_repr(self.layout))
 
     def __str__(self):
         return "<FastSlice {0}>".format(shape_str(self.element_type, self.shape))
@@ -190,7 +488,7 @@ class FastSlice(_ItemAccessor):
     @property
     def tag(self):
         shape_tag = "".join("d{0}".format(d) for d in self.shape)
-        return "F{0}{1}".format(shape_tag, self.element_type.tag)
+        return "F{0}{1}{2}".format(self.layout.replace("C", ""), shape_tag, self.element_type.tag)
 
     def convert(self, p):
         pointer_type = ctypes.POINTER(self.element_type.c_type)
@@ -202,6 +500,28 @@ class FastSlice(_ItemAccessor):
 
         return ctypes.cast(p, pointer_type)
 
+    def converter(self, writable=True):
+        """Returns function equivalent to :meth:`convert`, with pointer type resolved once.
+
+        Accepts objects supporting the buffer protocol as well.
+
+        """
+        pointer_type = ctypes.POINTER(self.element_type.c_type)
+        cast = ctypes.cast
+        check = ndarray_checker(self.element_type, writable, self.layout)
+
+        def convert(p):
+            if np and isinstance(p, np.ndarray):
+                check(p)
+                return p.ctypes.data_as(pointer_type)
+            if not isinstance(p, _CDATA):
+                buf = buffer_or_none(p, self.element_type, writable, self.layout)
+                if buf is not None:
+                    return buf.pointer(pointer_type)
+            return cast(p, pointer_type)
+
+        return convert
+
     def emit_getattr(self, builder, ref, attr):
         ndim = len(self.shape)
 
@@ -221,6 +541,7 @@ class FastSlice(_ItemAccessor):
                 shape = llvm.AddGlobal(module, llvm.TypeOf(shape_init), shape_name)
                 llvm.SetInitializer(shape, shape_init)
                 llvm.SetGlobalConstant(shape, llvm.TRUE)
+                llvm.SetLinkage(shape, llvm.PrivateLinkage)
 
             return shape, Array(Index, (ndim,))
 
@@ -235,9 +556,8 @@ class FastSlice(_ItemAccessor):
         # TODO check const shape dimension values?
 
         # Build conversion from ND-index to flat memory offset
-        # FIXME currently assumes row-major memory alignment, first dimension can vary
-        const_shape = [const_index(d) for d in self.shape[1:]]
-        ii = flatten_index(builder, i, const_shape)
+        const_shape = [const_index(self.shape[d]) for d in self._minor_dims()]
+        ii = flatten_index(builder, i, const_shape, self.layout)
         return llvm.BuildGEP(builder, v, ctypes.byref(ii), 1, "addr")
 
 
@@ -251,10 +571,17 @@ class Slice(_ItemAccessor):
     #
     # The resulting structure supports getitem/setitem so that there's
     # no need to address it's `data` attribute.
+    #
+    # Descriptor also holds `base` pointer to the heap block owning the
+    # data if it was allocated by compiled code, or NULL otherwise;
+    # views of the slice inherit it.
 
-    def __init__(self, element_type, shape=(Any,)):
+    runtime_shape = True
+
+    def __init__(self, element_type, shape=(Any,), layout="C"):
         self.element_type = element_type
         self.shape = shape
+        self.layout = _check_layout(layout)
 
         # Prevent distinct slice LLVM types being allocated every single
         # time one declares them. This is a problem in places like
@@ -267,11 +594,13 @@ class Slice(_ItemAccessor):
             self._struct = _slice_types.setdefault(
                 k, Structure("Slice",
                              ("data", Pointer(element_type)),
-                             ("shape", Array(Index, (len(shape),))))
+                             ("shape", Array(Index, (len(shape),))),
+                             ("base", Pointer(Byte)))
             )
 
     def __repr__(self):
-        return "Slice({0}, shape={1})".format(self.element_type, repr(self.shape))
+        return "Slice({0}, shape={1}{2})".format(self.element_type, repr(self.shape),
+                                                 _layout_repr(self.layout))
 
     def __str__(self):
         return "<Slice {0}>".format(shape_str(self.element_type, self.shape))
@@ -287,7 +616,7 @@ class Slice(_ItemAccessor):
     @property
     def tag(self):
         shape_tag = "".join("d{0}".format(d) for d in self.shape)
-        return "B{0}{1}".format(shape_tag, self.element_type.tag)
+        return "B{0}{1}{2}".format(self.layout.replace("C", ""), shape_tag, self.element_type.tag)
 
     def convert(self, p):
         pointer_type = ctypes.POINTER(self.element_type.c_type)
@@ -302,6 +631,124 @@ class Slice(_ItemAccessor):
         conv_p = ctypes.cast(p, pointer_type)
         return self._struct.c_type(conv_p, (Index.c_type * len(shape))(*shape))
 
+    def converter(self, writable=True):
+        """Returns function equivalent to :meth:`convert`.
+
+        Descriptor built for an ndarray is remembered and returned again
+        while subsequent calls pass arrays with the same data address, shape
+        and type, which is the common case of a function repeatedly applied
+        to the same buffers. Descriptor contents are fully determined by
+        these, and slices can't be modified by compiled code, so it's safe
+        to share it between calls.
+
+        Objects supporting the buffer protocol are accepted as well; their
+        shape comes from the buffer, or from static slice dimensions for
+        one-dimensional buffers of raw memory.
+
+        """
+        struct_type = self._struct.c_type
+        pointer_type = ctypes.POINTER(self.element_type.c_type)
+        cast = ctypes.cast
+        convert = self.convert
+        check = ndarray_checker(self.element_type, writable, self.layout)
+        # Single (key, descriptor) pair, replaced as a whole so that
+        # concurrent callers never see a key with another key's descriptor.
+        last = [None]
+
+        def convert_cached(p):
+            if np and isinstance(p, np.ndarray):
+                # Strides tell apart eg. square array from its transpose,
+                # which has to be rejected (or accepted) by the layout check.
+                key = (p.ctypes.data, p.shape, p.strides, p.dtype)
+                cached = last[0]
+                if cached is None or cached[0] != key:
+                    check(p)
+                    shape = self._check_shape(p.shape)
+                    cached = (key, struct_type(cast(key[0], pointer_type),
+                                               (Index.c_type * len(shape))(*shape)))
+                    last[0] = cached
+                elif writable and not p.flags.writeable:
+                    raise ValueError("Array must be writable")
+                return cached[1]
+
+            if not isinstance(p, _CDATA):
+                buf = buffer_or_none(p, self.element_type, writable, self.layout)
+                if buf is not None:
+                    shape = self._check_shape(buf.shape)
+                    d = struct_type(buf.pointer(pointer_type), (Index.c_type * len(shape))(*shape))
+                    d._n2o_buffer = buf
+                    return d
+
+            return convert(p)
+
+        return convert_cached
+
+    def _check_shape(self, shape, reshape=True):
+        """Returns *shape* of argument memory, validated against slice shape.
+
+        One-dimensional contiguous memory gets reshaped if *reshape* is set
+        and all but the major slice dimension are static.
+
+        """
+        minor_shape = [self.shape[d] for d in self._minor_dims()]
+        if reshape and len(shape) == 1 and len(self.shape) > 1 and Any not in minor_shape:
+            minor = _product(minor_shape)
+            if shape[0] % minor:
+                raise ValueError("Cannot reshape {0} elements to {1}".format(shape[0], self))
+            if self.layout == "F":
+                shape = tuple(minor_shape) + (shape[0] // minor,)
+            else:
+                shape = (shape[0] // minor,) + tuple(minor_shape)
+
+        if len(shape) != len(self.shape):
+            raise ValueError("Expected {0}-dimensional array, got {1} dimensions"
+                             .format(len(self.shape), len(shape)))
+
+        for expected, actual in zip(self.shape, shape):
+            if expected is not Any and expected != actual:
+                raise ValueError("Shape {0} doesn't match {1}".format(shape, self))
+
+        return shape
+
+    def wrap_result(self, d, args):
+        """Returns NumPy array for slice descriptor *d* returned by a function.
+
+        If descriptor data belongs to a heap block allocated by
+        :mod:`nitrous.lib.memory`, the array takes ownership of the block,
+        freeing it once no longer in use. Otherwise, the array is a view
+        which keeps all of function *args* (objects and their converted
+        values) alive, since data may point into any of them. Descriptor
+        is returned as is if NumPy isn't available.
+
+        """
+        if not np:
+            return d
+
+        address = ctypes.cast(d.data, ctypes.c_void_p).value
+        base = ctypes.cast(d.base, ctypes.c_void_p).value
+        shape = tuple(d.shape)
+
+        owner = _HeapBlock(base) if base else tuple(args)
+
+        if not address:
+            # Allocator is free to return NULL for empty slices.
+            return np.empty(shape, dtype=self.element_type.c_type)
+
+        return np.asarray(_ResultBuffer(address, shape, self.element_type.c_type, owner,
+                                        self._result_strides(d)))
+
+    def _result_strides(self, d):
+        """Returns strides in bytes of data described by *d*; None if C-contiguous."""
+        if self.layout == "C":
+            return None
+
+        size = ctypes.sizeof(self.element_type.c_type)
+        strides = []
+        for dim in d.shape:
+            strides.append(size)
+            size *= dim
+        return tuple(strides)
+
     def emit_getattr(self, builder, ref, attr):
         if attr == "ndim":
             return const_index(len(self.shape)), None
@@ -313,6 +760,10 @@ class Slice(_ItemAccessor):
     def emit_setattr(self, builder, ref, attr, v):
         raise TypeError("Slice is immutable")
 
+    def _emit_base(self, builder, v):
+        base, _ = self._struct.emit_getattr(builder, v, "base")
+        return base
+
     def _item_gep(self, builder, v, i):
         if len(i) != len(self.shape):
             raise TypeError("Index and slice shapes don't match ({0} != {1})"
@@ -332,13 +783,306 @@ class Slice(_ItemAccessor):
             return dim
 
         # Build conversion from ND-index to flat memory offset
-        # FIXME currently assumes row-major memory alignment, first dimension can vary
-        const_shape = [emit_dimension(d) for d in range(1, len(self.shape))]
-        ii = flatten_index(builder, i, const_shape)
+        const_shape = [emit_dimension(d) for d in self._minor_dims()]
+        ii = flatten_index(builder, i, const_shape, self.layout)
         return llvm.BuildGEP(builder, data_value, ctypes.byref(ii), 1, "addr")
 
 
-def flatten_index(builder, index, const_shape):
+class StridedSlice(Slice):
+    """Slice over memory laid out with arbitrary strides.
+
+    Descriptor carries per-dimension strides next to the shape, so that
+    non-contiguous NumPy views, such as ``a[:, 1]``, ``a[::2]`` or ``a.T``,
+    can be passed without copying. Strides are counted in elements and can
+    be negative; arguments whose strides aren't multiples of element size
+    are rejected.
+
+    Like the shape, *strides* can be partially static. Declaring innermost
+    stride as 1 (ie. element size) addresses the last dimension the same way
+    as contiguous slices do, so that loops over it can still be vectorized;
+    arguments are checked to match.
+
+    """
+
+    # Strides describe any layout; subslices are addressed through them.
+    layout = None
+
+    def __init__(self, element_type, shape=(Any,), strides=None):
+        self.element_type = element_type
+        self.shape = shape
+        self.strides = tuple(strides) if strides is not None else (Any,) * len(shape)
+
+        if len(self.strides) != len(shape):
+            raise ValueError("Expected {0} strides, got {1}".format(len(shape), len(self.strides)))
+
+        k = (llvm.address_of(element_type.llvm_type), shape, "strided")
+        try:
+            self._struct = _slice_types[k]
+        except KeyError:
+            self._struct = _slice_types.setdefault(
+                k, Structure("StridedSlice",
+                             ("data", Pointer(element_type)),
+                             ("shape", Array(Index, (len(shape),))),
+                             ("strides", Array(Index, (len(shape),))),
+                             ("base", Pointer(Byte)))
+            )
+
+    def __repr__(self):
+        return "StridedSlice({0}, shape={1}, strides={2})".format(
+            self.element_type, repr(self.shape), repr(self.strides))
+
+    def __str__(self):
+        return "<StridedSlice {0}>".format(shape_str(self.element_type, self.shape))
+
+    @property
+    def tag(self):
+        shape_tag = "".join("d{0}".format(d) for d in self.shape)
+        strides_tag = "".join("s{0}".format(d) for d in self.strides)
+        return "T{0}{1}{2}".format(shape_tag, strides_tag, self.element_type.tag)
+
+    def convert(self, p):
+        pointer_type = ctypes.POINTER(self.element_type.c_type)
+
+        if np and isinstance(p, np.ndarray):
+            return self._descriptor(p.ctypes.data_as(pointer_type), p.shape,
+                                    self._element_strides(p.shape, p.strides))
+
+        shape = ctypes_shape(p)
+        return self._descriptor(ctypes.cast(p, pointer_type), shape, _contiguous_strides(shape))
+
+    def converter(self, writable=True):
+        """Returns function equivalent to :meth:`convert`.
+
+        Descriptors of ndarrays are reused the same way as for
+        :class:`Slice`, keyed on strides as well. Other objects supporting
+        the buffer protocol are contiguous.
+
+        """
+        pointer_type = ctypes.POINTER(self.element_type.c_type)
+        cast = ctypes.cast
+        convert = self.convert
+        check = ndarray_checker(self.element_type, writable, layout=None)
+        # See Slice.converter.
+        last = [None]
+
+        def convert_cached(p):
+            if np and isinstance(p, np.ndarray):
+                key = (p.ctypes.data, p.shape, p.strides, p.dtype)
+                cached = last[0]
+                if cached is None or cached[0] != key:
+                    check(p)
+                    shape = self._check_shape(p.shape, reshape=False)
+                    strides = self._element_strides(shape, p.strides)
+                    cached = (key, self._descriptor(cast(key[0], pointer_type), shape, strides))
+                    last[0] = cached
+                elif writable and not p.flags.writeable:
+                    raise ValueError("Array must be writable")
+                return cached[1]
+
+            if not isinstance(p, _CDATA):
+                buf = buffer_or_none(p, self.element_type, writable)
+                if buf is not None:
+                    shape = self._check_shape(buf.shape)
+                    d = self._descriptor(buf.pointer(pointer_type), shape,
+                                         self._check_strides(shape, _contiguous_strides(shape)))
+                    d._n2o_buffer = buf
+                    return d
+
+            return convert(p)
+
+        return convert_cached
+
+    def _descriptor(self, data, shape, strides):
+        n = len(shape)
+        return self._struct.c_type(data, (Index.c_type * n)(*shape), (Index.c_type * n)(*strides))
+
+    def _element_strides(self, shape, strides):
+        """Returns byte *strides* converted to elements, validated against slice strides."""
+        size = ctypes.sizeof(self.element_type.c_type)
+        if any(s % size for s in strides):
+            raise ValueError("Strides {0} aren't multiples of element size {1}".format(strides, size))
+        return self._check_strides(shape, tuple(s // size for s in strides))
+
+    def _check_strides(self, shape, strides):
+        for expected, actual, dim in zip(self.strides, strides, shape):
+            # Strides of dimensions with a single element don't matter.
+            if expected is not Any and expected != actual and dim > 1:
+                raise ValueError("Strides {0} don't match {1!r}".format(strides, self))
+        return strides
+
+    def _result_strides(self, d):
+        size = ctypes.sizeof(self.element_type.c_type)
+        return tuple(s * size for s in d.strides)
+
+    def emit_getattr(self, builder, ref, attr):
+        if attr == "strides":
+            return self._struct.emit_getattr(builder, ref, attr)
+        return super(StridedSlice, self).emit_getattr(builder, ref, attr)
+
+    def emit_extent(self, builder, v):
+        """IR: Returns integer addresses of the first and past the last item of *v*.
+
+        Strides can be negative, so items don't necessarily start at data pointer.
+
+        """
+        dims = self._emit_dims(builder, v)
+        first, last = const_index(0), const_index(1)
+        for k, d in enumerate(dims):
+            span = llvm.BuildMul(builder, llvm.BuildSub(builder, d, const_index(1), ""),
+                                 self._emit_stride(builder, v, k), "span")
+            first = llvm.BuildAdd(builder, first, _emit_min(builder, span, const_index(0)), "")
+            last = llvm.BuildAdd(builder, last, _emit_max(builder, span, const_index(0)), "")
+
+        data, _ = self.emit_getattr(builder, v, "data")
+        return emit_address_range(builder, data, first, last)
+
+    def _contiguous_view(self, i, kept):
+        return False
+
+    def _static_strides(self):
+        return list(self.strides)
+
+    def _emit_strides(self, builder, v, dims):
+        return [self._emit_stride(builder, v, k) for k in range(len(self.shape))]
+
+    def _emit_stride(self, builder, v, k):
+        """Returns stride of dimension *k*, constant if static."""
+        if self.strides[k] is not Any:
+            return const_index(self.strides[k])
+
+        strides, strides_type = self.emit_getattr(builder, v, "strides")
+        stride, _ = strides_type.value_type.emit_getitem(builder, strides, (const_index(k),))
+        return stride
+
+    def _emit_subslice(self, builder, v, i):
+        """Emits a sub-slice based on partial index *i*, keeping remaining strides."""
+        from ..function import entry_alloca
+
+        n = len(i)
+        SSTy = StridedSlice(self.element_type, self.shape[n:], self.strides[n:])
+        ss = entry_alloca(builder, SSTy.llvm_type, "subslice")
+
+        for attr in ("shape", "strides"):
+            dst, dst_ty = SSTy._struct.emit_getattr(builder, ss, attr)
+            src, src_ty = self.emit_getattr(builder, v, attr)
+            for j in range(len(self.shape) - n):
+                dim, _ = src_ty.value_type.emit_getitem(builder, src, (const_index(j + n),))
+                dst_ty.value_type.emit_setitem(builder, dst, (const_index(j),), dim)
+
+        data_idx = i + (const_index(0),) * (len(self.shape) - n)
+        SSTy._struct.emit_setattr(builder, ss, "data", self._item_gep(builder, v, data_idx))
+        SSTy._struct.emit_setattr(builder, ss, "base", self._emit_base(builder, v))
+
+        return ss, SSTy
+
+    def _item_gep(self, builder, v, i):
+        if len(i) != len(self.shape):
+            raise TypeError("Index and slice shapes don't match ({0} != {1})"
+                            .format(len(i), len(self.shape)))
+
+        data_value, _ = self.emit_getattr(builder, v, "data")
+
+        # Offset is a dot product of index and strides; unit
+        # strides don't need the multiplication.
+        offset = const_index(0)
+        for k, index in enumerate(i):
+            if self.strides[k] != 1:
+                index = llvm.BuildMul(builder, index, self._emit_stride(builder, v, k), "v")
+            offset = llvm.BuildAdd(builder, offset, index, "v")
+
+        return llvm.BuildGEP(builder, data_value, ctypes.byref(offset), 1, "addr")
+
+
+def ndarray_checker(element_type, writable, layout="C"):
+    """Returns function validating ndarray arguments for arrays of *element_type*.
+
+    Arrays must be of matching type, writable if *writable* is set and
+    contiguous in given *layout*, unless it's None. Types match under the
+    same rules as buffer formats.
+
+    """
+    from . import Scalar
+    from .buffer import _format_matches
+
+    c_type = element_type.c_type
+    dtype = np.dtype(c_type) if np and isinstance(element_type, Scalar) else None
+
+    def check(p):
+        if dtype is not None and p.dtype != dtype and not _format_matches(p.dtype.char, c_type):
+            raise TypeError("Expected array of {0}, got {1}".format(dtype, p.dtype))
+        if layout == "C" and not p.flags.c_contiguous:
+            raise ValueError("Array must be C-contiguous")
+        if layout == "F" and not p.flags.f_contiguous:
+            raise ValueError("Array must be Fortran-contiguous")
+        if writable and not p.flags.writeable:
+            raise ValueError("Array must be writable")
+
+    return check
+
+
+def buffer_or_none(p, element_type, writable, layout="C"):
+    """Returns memory of *p* with checked format; None if it isn't a buffer."""
+    from .buffer import Buffer, is_buffer
+
+    if not is_buffer(p):
+        return None
+
+    buf = Buffer(p, writable, layout)
+    buf.check_format(element_type)
+    return buf
+
+
+def _contiguous_strides(shape):
+    """Returns strides, in elements, of C-contiguous array of *shape*."""
+    strides = []
+    n = 1
+    for d in reversed(shape):
+        strides.insert(0, n)
+        n *= d
+    return tuple(strides)
+
+
+def _product(values):
+    from operator import mul
+    return reduce(mul, values, 1)
+
+
+class _ResultBuffer(object):
+    """Exposes memory returned from compiled code to NumPy.
+
+    Memory remains valid for as long as its *owner* is alive, which
+    this buffer (and any array created from it) keeps referenced.
+
+    """
+
+    def __init__(self, address, shape, c_type, owner, strides=None):
+        self.__array_interface__ = {"data": (address, False),
+                                    "shape": shape,
+                                    "strides": strides,
+                                    "typestr": np.dtype(c_type).str,
+                                    "version": 3}
+        self.owner = owner
+
+
+class _HeapBlock(object):
+    """Memory allocated by compiled code, released when garbage collected."""
+
+    def __init__(self, address):
+        self.address = address
+        # Referenced here to remain available during interpreter shutdown.
+        self.__free = _free
+
+    def __del__(self):
+        self.__free(self.address)
+
+
+# Same allocator which compiled code gets linked against.
+_free = ctypes.CDLL(None).free
+_free.argtypes = [ctypes.c_void_p]
+_free.restype = None
+
+
+def flatten_index(builder, index, const_shape, layout="C"):
     """Converts N-dimensional index into 1-dimensional one.
 
     index is of a form ``(i0, i1, ... iN)``, where *i* is ValueRefs
@@ -346,10 +1090,17 @@ def flatten_index(builder, index, const_shape):
 
     First dimension is considered to be variable. Given array shape
     ``(d0, d1, ... dN)``, *const_shape* contains ``(d1, d2, ... dN)``.
+    In column-major *layout* ("F"), last dimension is variable instead
+    and *const_shape* contains ``(d0, d1, ... dN-1)``.
 
     If array is 1-dimensional, *const_shape* is an empty tuple.
 
     """
+    if layout == "F":
+        # Column-major offset is the row-major offset of reversed index
+        # into array of reversed shape.
+        index, const_shape = index[::-1], const_shape[::-1]
+
     mul_ = lambda x, y: llvm.BuildMul(builder, x, y, "v")
 
     # out = 0
@@ -0,0 +1,193 @@
+"""Access to memory of objects supporting the buffer protocol.
+
+Array arguments (pointers, slices and arrays) accept any object exposing its
+memory through the buffer protocol, such as ``memoryview``, ``bytearray``,
+``mmap.mmap`` or ``array.array``, without copying it. Objects which only
+support the old-style buffer protocol are treated as one-dimensional arrays
+of bytes, except for ``array.array``, which provides its element format.
+
+"""
+from __future__ import absolute_import
+import ctypes
+import struct
+import sys
+
+from . import Structure, Pointer, Byte, Index, Int
+from .array import Array
+
+
+# Buffer request flags.
+PyBUF_WRITABLE = 0x0001
+PyBUF_FORMAT = 0x0004
+PyBUF_ND = 0x0008
+PyBUF_STRIDES = 0x0010 | PyBUF_ND
+PyBUF_C_CONTIGUOUS = 0x0020 | PyBUF_STRIDES
+PyBUF_F_CONTIGUOUS = 0x0040 | PyBUF_STRIDES
+
+
+PyBuffer = Structure("Py_buffer",
+                     ("buf", Pointer(Byte)),
+                     ("obj", Pointer(Byte)),
+                     ("len", Index),
+                     ("itemsize", Index),
+                     ("readonly", Int),
+                     ("ndim", Int),
+                     ("format", Pointer(Byte)),
+                     ("shape", Pointer(Index)),
+                     ("strides", Pointer(Index)),
+                     ("suboffsets", Pointer(Index)),
+                     ("smalltable", Array(Index, (2,))),
+                     ("internal", Pointer(Byte)))
+"""Layout of ``Py_buffer`` view structure."""
+
+
+class _View(PyBuffer.c_type):
+    """Buffer view which is released when garbage collected."""
+
+    def __del__(self):
+        if self.obj:
+            _release(ctypes.byref(self))
+
+
+class Buffer(object):
+    """Contiguous memory of *obj*, requested to be *writable* if set.
+
+    Memory is contiguous in row-major ("C") or column-major ("F") *layout*;
+    shape is given in logical order either way.
+
+    Raises TypeError if *obj* doesn't support the buffer protocol; requests
+    for memory it can't provide, such as writable memory of a read-only
+    object, fail with the error raised by the exporter (usually BufferError).
+
+    """
+
+    def __init__(self, obj, writable=False, layout="C"):
+        flags = ((PyBUF_F_CONTIGUOUS if layout == "F" else PyBUF_C_CONTIGUOUS) |
+                 PyBUF_FORMAT | (PyBUF_WRITABLE if writable else 0))
+
+        view = _View()
+        try:
+            _get_buffer(ctypes.py_object(obj), ctypes.byref(view), flags)
+        except TypeError:
+            if _has_new_buffer(obj):
+                # Buffer is there, but not as requested.
+                raise
+            elif not _has_buffer(ctypes.py_object(obj)):
+                raise TypeError("{0} object doesn't support the buffer protocol"
+                                .format(type(obj).__name__))
+            self.__init_old(obj, writable)
+        else:
+            # Keeps the view alive along with anything derived from this buffer.
+            self.view = view
+            self.address = ctypes.cast(view.buf, ctypes.c_void_p).value
+            self.itemsize = view.itemsize
+            self.format = ctypes.string_at(view.format) if view.format else "B"
+            if view.shape:
+                self.shape = tuple(view.shape[i] for i in range(view.ndim))
+            else:
+                self.shape = (view.len // view.itemsize,)
+
+    def __init_old(self, obj, writable):
+        """Initializes from object supporting only old-style buffer protocol."""
+        address = ctypes.c_void_p()
+        size = ctypes.c_ssize_t()
+        if writable:
+            _as_write_buffer(ctypes.py_object(obj), ctypes.byref(address), ctypes.byref(size))
+        else:
+            _as_read_buffer(ctypes.py_object(obj), ctypes.byref(address), ctypes.byref(size))
+
+        # Memory remains valid for as long as object is around.
+        self.view = obj
+        self.address = address.value
+        self.format = getattr(obj, "typecode", "B")
+        self.itemsize = struct.calcsize(self.format)
+        self.shape = (size.value // self.itemsize,)
+
+    def pointer(self, pointer_type):
+        """Returns ctypes pointer of *pointer_type* to the buffer memory.
+
+        Pointer keeps the buffer alive for as long as it's around.
+
+        """
+        p = ctypes.cast(self.address, pointer_type)
+        p._n2o_buffer = self
+        return p
+
+    def check_format(self, element_type):
+        """Raises TypeError if buffer elements don't match scalar *element_type*."""
+        if not _format_matches(self.format, element_type.c_type):
+            raise TypeError("Buffer format '{0}' doesn't match {1}".format(self.format, element_type))
+
+
+def is_buffer(obj):
+    """Returns True if *obj* supports either form of the buffer protocol."""
+    return _has_new_buffer(obj) or bool(_has_buffer(ctypes.py_object(obj)))
+
+
+def matching_formats(c_type):
+    """Returns sorted list of struct formats describing values of ctypes scalar *c_type*.
+
+    Returns None if *c_type* isn't a simple type, whose format can't be told.
+
+    """
+    if not isinstance(getattr(c_type, "_type_", None), str):
+        return None
+
+    formats = [prefix + f for prefix in [""] + list(_NATIVE_ORDER) for f in _FORMAT_KINDS]
+    return sorted(f for f in formats if _format_matches(f, c_type))
+
+
+def _format_matches(format, c_type):
+    """Returns True if struct *format* describes values of ctypes scalar *c_type*."""
+    expected = getattr(c_type, "_type_", None)
+    if not isinstance(expected, str):
+        # Not a simple ctypes type, eg. structure; can't tell.
+        return True
+
+    if format[:1] in _NATIVE_ORDER:
+        format = format[1:]
+    if len(format) != 1 or format not in _FORMAT_KINDS:
+        return False
+
+    if format == expected:
+        return True
+    return (_FORMAT_KINDS[format] == _FORMAT_KINDS.get(expected) and
+            struct.calcsize(format) == ctypes.sizeof(c_type))
+
+
+# Byte order prefixes which match native layout.
+_NATIVE_ORDER = "@=" + ("<" if sys.byteorder == "little" else ">!")
+
+# Formats which describe the same values, given the same size; single
+# bytes are treated as raw memory regardless of their sign.
+_FORMAT_KINDS = dict([(f, "int") for f in "hilq"] +
+                     [(f, "uint") for f in "HILQ"] +
+                     [(f, "byte") for f in "bBc"] +
+                     [(f, "float") for f in "fd"] +
+                     [("?", "bool")])
+
+
+def _has_new_buffer(obj):
+    """Returns True if *obj* supports new-style buffer protocol."""
+    try:
+        memoryview(obj)
+    except TypeError:
+        return False
+    return True
+
+
+def _api(name, restype, argtypes):
+    f = getattr(ctypes.pythonapi, name)
+    f.restype = restype
+    f.argtypes = argtypes
+    return f
+
+
+_get_buffer = _api("PyObject_GetBuffer", ctypes.c_int,
+                   [ctypes.py_object, ctypes.c_void_p, ctypes.c_int])
+_release = _api("PyBuffer_Release", None, [ctypes.c_void_p])
+_has_buffer = _api("PyObject_CheckReadBuffer", ctypes.c_int, [ctypes.py_object])
+_as_read_buffer = _api("PyObject_AsReadBuffer", ctypes.c_int,
+                       [ctypes.py_object, ctypes.c_void_p, ctypes.c_void_p])
+_as_write_buffer = _api("PyObject_AsWriteBuffer", ctypes.c_int,
+                        [ctypes.py_object, ctypes.c_void_p, ctypes.c_void_p])
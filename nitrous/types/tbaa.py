@@ -0,0 +1,61 @@
+"""Type-based alias analysis metadata.
+
+Loads and stores of slice, array and structure items are tagged with the
+type of value they access, so that accesses to different types are known
+not to overlap; eg. stores into ``Double`` slice data don't invalidate
+shape dimensions (``Index``) loaded from its descriptor. As in C, memory
+must not be accessed as different types; byte-sized types may alias
+anything, and all pointers are treated as the same type.
+
+"""
+from __future__ import absolute_import
+import ctypes
+
+from .. import llvm
+
+
+# Nodes are uniqued within LLVM context, which is global; keep them around.
+_nodes = {}
+
+
+def annotate(inst, t):
+    """Attaches TBAA tag for value type *t* to load or store *inst*; returns *inst*.
+
+    Accesses of non-scalar types (eg. vectors) are left untagged.
+
+    """
+    node = _type_node(t)
+    if node is not None:
+        llvm.SetMetadata(inst, llvm.GetMDKindID("tbaa", 4), node)
+    return inst
+
+
+def _type_node(t):
+    """Returns TBAA type descriptor for scalar type *t*, or None."""
+    from . import Scalar, Pointer
+
+    if isinstance(t, Pointer) or (isinstance(t, Scalar) and
+                                  llvm.GetTypeKind(t.llvm_type) == llvm.PointerTypeKind):
+        return _node("any pointer", _node("omnipotent char", _root()))
+    elif not isinstance(t, Scalar):
+        return None
+    elif ctypes.sizeof(t.c_type) == 1:
+        return _node("omnipotent char", _root())
+    else:
+        # Types with the same tag share representation and may alias.
+        return _node(t.tag, _node("omnipotent char", _root()))
+
+
+def _root():
+    return _node("nitrous TBAA")
+
+
+def _node(name, parent=None):
+    try:
+        return _nodes[name]
+    except KeyError:
+        operands = [llvm.MDString(name, len(name))]
+        if parent is not None:
+            operands.append(parent)
+        node = llvm.MDNode((llvm.ValueRef * len(operands))(*operands), len(operands))
+        return _nodes.setdefault(name, node)
@@ -3,9 +3,16 @@
  */
 
 #include <llvm-c/Core.h>
+#include <llvm-c/ExecutionEngine.h>
 #include <llvm-c/Target.h>
 #include <llvm-c/TargetMachine.h>
+#include <llvm-c/Transforms/PassManagerBuilder.h>
 
+#include <llvm/ADT/StringMap.h>
+#include <llvm/Config/llvm-config.h>
+#include <llvm/Function.h>
+#include <llvm/ExecutionEngine/ExecutionEngine.h>
+#include <llvm/ExecutionEngine/JIT.h>
 #include <llvm/Intrinsics.h>
 #include <llvm/Support/CommandLine.h>
 #include <llvm/Support/Host.h>
@@ -13,11 +20,54 @@
 #include <llvm/Support/TargetRegistry.h>
 #include <llvm/Support/raw_ostream.h>
 #include <llvm/Target/TargetMachine.h>
+#include <llvm/Target/TargetOptions.h>
+#include <llvm/Transforms/IPO/PassManagerBuilder.h>
+#include <llvm/Transforms/Scalar.h>
+#include <llvm/PassManager.h>
 #include <llvm/Linker.h>
 
+#include <map>
 #include <vector>
 
 
+/* Loop unrolling limits requested for each pass manager builder. Extensions
+ * are plain function pointers in LLVM 3.2 and can't carry the limits along;
+ * entries live until the builder is disposed (LLVMPassManagerBuilderDispose__),
+ * so that it can populate any number of pass managers. */
+static std::map<const llvm::PassManagerBuilder*, std::pair<int, int> > UnrollLimits;
+
+static void
+addLoopUnrollPass(const llvm::PassManagerBuilder &Builder, llvm::PassManagerBase &PM) {
+    std::map<const llvm::PassManagerBuilder*, std::pair<int, int> >::iterator I = UnrollLimits.find(&Builder);
+    if (I != UnrollLimits.end())
+        PM.add(llvm::createLoopUnrollPass(I->second.first, I->second.second));
+}
+
+
+/* Floating point relaxations; same values as llvm.FastMath* in Python. */
+enum FastMathFlags {
+    FastMathReassoc = 1 << 0,
+    FastMathNoNaNs = 1 << 1,
+    FastMathNoInfs = 1 << 2,
+    FastMathReciprocal = 1 << 3,
+    FastMathContract = 1 << 4,
+    FastMathFlushToZero = 1 << 5
+};
+
+static void
+setFastMathOptions(llvm::TargetOptions &Options, unsigned Flags) {
+    // Unsafe FP math covers both reassociation and reciprocal approximations;
+    // options() only accepts these flags together.
+    Options.UnsafeFPMath = (Flags & FastMathReassoc) && (Flags & FastMathReciprocal);
+    Options.NoNaNsFPMath = (Flags & FastMathNoNaNs) != 0;
+    Options.NoInfsFPMath = (Flags & FastMathNoInfs) != 0;
+#if LLVM_VERSION_MAJOR > 3 || LLVM_VERSION_MINOR >= 2
+    Options.AllowFPOpFusion = (Flags & FastMathContract) ? llvm::FPOpFusion::Fast
+                                                         : llvm::FPOpFusion::Standard;
+#endif
+}
+
+
 extern "C" {
 
     void
@@ -87,6 +137,113 @@ extern "C" {
         return strdup(llvm::sys::getDefaultTargetTriple().c_str());
     }
 
+    /**
+     * Returns LLVM library version as "major.minor" string.
+     *
+     * Result must be freed with LLVMDisposeMessage.
+     */
+    char *
+    LLVMGetVersion__() {
+        std::string out;
+        llvm::raw_string_ostream stream(out);
+        stream << LLVM_VERSION_MAJOR << "." << LLVM_VERSION_MINOR;
+        return strdup(stream.str().c_str());
+    }
+
+    /**
+     * See llvm::sys::getHostCPUName()
+     *
+     * Result must be freed with LLVMDisposeMessage.
+     */
+    char *
+    LLVMGetHostCPUName__() {
+        return strdup(llvm::sys::getHostCPUName().c_str());
+    }
+
+    /**
+     * Returns comma-separated list of features (eg. "+avx,-sse4a") detected
+     * on the host; empty if detection is not supported on this platform.
+     *
+     * Result must be freed with LLVMDisposeMessage.
+     */
+    char *
+    LLVMGetHostCPUFeatures__() {
+        llvm::StringMap<bool> Features;
+        std::string out;
+
+        if (llvm::sys::getHostCPUFeatures(Features)) {
+            for (llvm::StringMap<bool>::const_iterator I = Features.begin(), E = Features.end(); I != E; ++I) {
+                if (!out.empty())
+                    out += ",";
+                out += (I->getValue() ? "+" : "-");
+                out += I->getKey().str();
+            }
+        }
+
+        return strdup(out.c_str());
+    }
+
+    /**
+     * Same as LLVMCreateJITCompilerForModule, but generates code
+     * for given *CPU* name and comma-separated *Features*, with
+     * floating point relaxations given by *FastMath* flags.
+     */
+    LLVMBool
+    LLVMCreateJITCompilerForModule__(LLVMExecutionEngineRef *OutJIT, LLVMModuleRef M, unsigned OptLevel,
+                                     const char *CPU, const char *Features, unsigned FastMath,
+                                     char **OutError) {
+        std::string Error;
+        std::vector<std::string> MAttrs;
+        llvm::TargetOptions Options;
+        setFastMathOptions(Options, FastMath);
+
+        llvm::StringRef Remaining(Features);
+        while (!Remaining.empty()) {
+            std::pair<llvm::StringRef, llvm::StringRef> Split = Remaining.split(',');
+            if (!Split.first.empty())
+                MAttrs.push_back(Split.first.str());
+            Remaining = Split.second;
+        }
+
+        llvm::EngineBuilder builder(llvm::unwrap(M));
+        builder.setEngineKind(llvm::EngineKind::JIT)
+            .setErrorStr(&Error)
+            .setOptLevel((llvm::CodeGenOpt::Level)OptLevel)
+            .setMCPU(CPU)
+            .setMAttrs(MAttrs)
+            .setTargetOptions(Options);
+
+        if (llvm::ExecutionEngine *JIT = builder.create()) {
+            *OutJIT = reinterpret_cast<LLVMExecutionEngineRef>(JIT);
+            return 0;
+        }
+
+        *OutError = strdup(Error.c_str());
+        return 1;
+    }
+
+    /**
+     * Sets floating point relaxations given by *FastMath* flags
+     * for code generated by target machine *T*.
+     */
+    void
+    LLVMSetTargetMachineFastMath__(LLVMTargetMachineRef T, unsigned FastMath) {
+        setFastMathOptions(reinterpret_cast<llvm::TargetMachine*>(T)->Options, FastMath);
+    }
+
+    /**
+     * Returns total number of instructions in all basic blocks of function *F*.
+     */
+    unsigned
+    LLVMGetInstructionCount__(LLVMValueRef F) {
+        unsigned count = 0;
+        llvm::Function *Fn = llvm::unwrap<llvm::Function>(F);
+        for (llvm::Function::iterator BB = Fn->begin(), E = Fn->end(); BB != E; ++BB) {
+            count += BB->size();
+        }
+        return count;
+    }
+
     LLVMModuleRef
     LLVMGetParentModule__(LLVMBuilderRef B) {
         llvm::Module *M = llvm::unwrap(B)->GetInsertBlock()->getParent()->getParent();
@@ -111,6 +268,40 @@ extern "C" {
     }
 
 
+    /**
+     * Enables loop and basic block (SLP) vectorizers.
+     */
+    void
+    LLVMPassManagerBuilderSetVectorize__(LLVMPassManagerBuilderRef PMB, LLVMBool Loop, LLVMBool SLP) {
+        llvm::PassManagerBuilder *Builder = reinterpret_cast<llvm::PassManagerBuilder*>(PMB);
+        Builder->LoopVectorize = Loop;
+        Builder->Vectorize = SLP;
+    }
+
+    /**
+     * Replaces the default loop unrolling pass with one using given
+     * *Threshold* and *Count*; -1 keeps the LLVM default for either.
+     */
+    void
+    LLVMPassManagerBuilderSetUnrollLimits__(LLVMPassManagerBuilderRef PMB, int Threshold, int Count) {
+        llvm::PassManagerBuilder *Builder = reinterpret_cast<llvm::PassManagerBuilder*>(PMB);
+        Builder->DisableUnrollLoops = true;
+        if (UnrollLimits.find(Builder) == UnrollLimits.end())
+            Builder->addExtension(llvm::PassManagerBuilder::EP_LoopOptimizerEnd, addLoopUnrollPass);
+        UnrollLimits[Builder] = std::make_pair(Threshold, Count);
+    }
+
+    /**
+     * Same as LLVMPassManagerBuilderDispose, but also forgets unroll limits
+     * of *PMB*, which would otherwise apply to a later builder at its address.
+     */
+    void
+    LLVMPassManagerBuilderDispose__(LLVMPassManagerBuilderRef PMB) {
+        UnrollLimits.erase(reinterpret_cast<llvm::PassManagerBuilder*>(PMB));
+        LLVMPassManagerBuilderDispose(PMB);
+    }
+
+
     /* Copied from LLVM 3.2 trunk */
 
     enum LLVMLinkerMode__ {
@@ -0,0 +1,163 @@
+import unittest
+
+from nitrous.function import function, c_function
+from nitrous.types import Double, Long, Pointer
+from nitrous.types.array import Slice, Any
+from nitrous.analysis import written_args, captured_args, memory_effects
+from nitrous.lib.math import sqrt
+
+
+DoubleN = Slice(Double)
+DoubleNxN = Slice(Double, (Any, Any))
+
+ext = c_function("ext", None, [DoubleN])
+
+
+@function(Double, x=DoubleN, y=DoubleN, n=Long)
+def read_only(x, y, n):
+    return x[0] + y[n]
+
+
+@function(x=DoubleN, y=DoubleN)
+def store(x, y):
+    x[0] = y[0]
+
+
+@function(x=Slice(Double, (Any, Any)), y=DoubleN)
+def store_alias(x, y):
+    row = x[0]
+    row[1] = y[0]
+
+
+@function(x=DoubleNxN, y=DoubleN)
+def store_unpacked(x, y):
+    row, k = x[0], 1
+    row[k] = y[0]
+
+
+@function(x=DoubleNxN, y=DoubleNxN, n=Long)
+def store_conditional(x, y, n):
+    row = x[0] if n > 0 else y[0]
+    row[0] = 1.0
+
+
+@function(x=DoubleN, y=DoubleN, n=Long)
+def store_conditional_item(x, y, n):
+    (x if n > 0 else y)[0] = 1.0
+
+
+@function(x=DoubleN, y=DoubleN)
+def store_callee(x, y):
+    store(y, x)
+
+
+@function(x=DoubleN, y=DoubleN)
+def external(x, y):
+    ext(x)
+
+
+@function(DoubleN, x=DoubleN, y=DoubleN)
+def returned(x, y):
+    return x
+
+
+@function(Double, x=Pointer(Double), y=Pointer(Double))
+def pointer_value(x, y):
+    return x[0] + y[0]
+
+
+@function(Double, x=Double, y=Double)
+def hypot(x, y):
+    return sqrt(Double)(x * x + y * y)
+
+
+@function(Double, x=DoubleN)
+def norm(x):
+    return hypot(x[0], x[1])
+
+
+@function(x=DoubleN)
+def say(x):
+    print x[0]
+
+
+class WrittenArgsTests(unittest.TestCase):
+
+    def test_read_only(self):
+        self.assertEqual(written_args(read_only), set())
+
+    def test_store(self):
+        self.assertEqual(written_args(store), set(["x"]))
+
+    def test_alias(self):
+        """Stores through local subslices are traced back to arguments."""
+        self.assertEqual(written_args(store_alias), set(["x"]))
+
+    def test_unpacked_alias(self):
+        self.assertEqual(written_args(store_unpacked), set(["x"]))
+
+    def test_conditional_alias(self):
+        """Either of conditional expression branches may be written."""
+        self.assertEqual(written_args(store_conditional), set(["x", "y"]))
+        self.assertEqual(written_args(store_conditional_item), set(["x", "y"]))
+
+    def test_callee(self):
+        self.assertEqual(written_args(store_callee), set(["y"]))
+
+    def test_external(self):
+        """Arguments passed to C functions may be written."""
+        self.assertEqual(written_args(external), set(["x"]))
+
+    def test_return(self):
+        self.assertEqual(written_args(returned), set(["x"]))
+
+    def test_loaded_values(self):
+        """Values loaded from memory are not references to it."""
+        self.assertEqual(written_args(pointer_value), set())
+
+
+class CapturedArgsTests(unittest.TestCase):
+
+    def test_read_only(self):
+        self.assertEqual(captured_args(read_only), set())
+
+    def test_store(self):
+        """Storing values loaded from an argument doesn't capture it."""
+        self.assertEqual(captured_args(store), set())
+
+    def test_callee(self):
+        self.assertEqual(captured_args(store_callee), set())
+
+    def test_external(self):
+        self.assertEqual(captured_args(external), set(["x"]))
+
+    def test_return(self):
+        self.assertEqual(captured_args(returned), set(["x"]))
+
+
+class MemoryEffectsTests(unittest.TestCase):
+
+    def test_none(self):
+        """Math functions don't access memory."""
+        self.assertEqual(memory_effects(hypot), "none")
+
+    def test_read(self):
+        self.assertEqual(memory_effects(read_only), "read")
+        self.assertEqual(memory_effects(norm), "read")
+
+    def test_write(self):
+        self.assertEqual(memory_effects(store), "write")
+        self.assertEqual(memory_effects(store_callee), "write")
+        self.assertEqual(memory_effects(external), "write")
+
+    def test_aliased_write(self):
+        """Writes through tuple-unpacked or conditional aliases aren't reads."""
+        self.assertEqual(memory_effects(store_unpacked), "write")
+        self.assertEqual(memory_effects(store_conditional), "write")
+        self.assertEqual(memory_effects(store_conditional_item), "write")
+
+    def test_print(self):
+        self.assertEqual(memory_effects(say), "write")
+
+    def test_external_function(self):
+        self.assertEqual(memory_effects(ext), "write")
@@ -1,5 +1,6 @@
 from nitrous.module import module, dump
 from nitrous.function import function
+import platform
 import unittest
 
 
@@ -51,3 +52,369 @@ class AggregateReturnTests(unittest.TestCase):
         self.assertEqual(c.x, 1.0)
         self.assertEqual(c.y, 2.0)
         self.assertEqual(c.z, 3.0)
+
+    def test_out(self):
+        """Result is written into caller-supplied storage."""
+        from nitrous.types import Structure, Double, Long
+
+        Pair = Structure("Pair", ("a", Double), ("b", Double))
+
+        @function(Pair, a=Double, b=Double)
+        def make_pair(a, b):
+            return Pair(a, b)
+
+        @function(Pair, a=Double)
+        def make_twin(a):
+            return make_pair(a, a)
+
+        m = module([make_pair, make_twin])
+
+        out = Pair.c_type()
+        self.assertIs(m.make_pair(1.0, 2.0, out=out), out)
+        self.assertEqual((out.a, out.b), (1.0, 2.0))
+
+        self.assertIs(m.make_twin(3.0, out=out), out)
+        self.assertEqual((out.a, out.b), (3.0, 3.0))
+
+        with self.assertRaises(TypeError):
+            m.make_pair(1.0, 2.0, result=out)
+
+        @function(Long, x=Long)
+        def ident(x):
+            return x
+
+        m = module([ident])
+        with self.assertRaises(TypeError):
+            m.ident(1, out=out)
+
+    def test_out_ndarray(self):
+        """NumPy arrays can receive array results."""
+        import numpy as np
+        from nitrous.types import Double
+        from nitrous.types.array import Array
+
+        Vec = Array(Double, (3,))
+
+        @function(Vec, x=Double)
+        def fill(x):
+            v = Vec()
+            for i in range(3):
+                v[i] = x
+            return v
+
+        m = module([fill])
+
+        out = np.zeros(3)
+        self.assertIs(m.fill(2.0, out=out), out)
+        self.assertEqual(list(out), [2.0, 2.0, 2.0])
+
+        with self.assertRaises(TypeError):
+            m.fill(2.0, out=np.zeros(4))
+
+    def test_result_pool(self):
+        """Results are taken from a pool of buffers."""
+        from nitrous.function import options
+        from nitrous.types import Structure, Double
+
+        Pair = Structure("Pair", ("a", Double), ("b", Double))
+
+        @options(result_pool=2)
+        @function(Pair, a=Double, b=Double)
+        def make_pair(a, b):
+            return Pair(a, b)
+
+        m = module([make_pair])
+
+        p0 = m.make_pair(1.0, 2.0)
+        p1 = m.make_pair(3.0, 4.0)
+        self.assertIsNot(p0, p1)
+        self.assertEqual((p0.a, p1.a), (1.0, 3.0))
+
+        self.assertIs(m.make_pair(5.0, 6.0), p0)
+        self.assertEqual((p0.a, p0.b), (5.0, 6.0))
+
+
+class CallManyTests(unittest.TestCase):
+
+    def setUp(self):
+        from nitrous.types import Double, Long
+
+        @function(Double, a=Long, b=Double)
+        def axb(a, b):
+            return a * b
+
+        self.m = module([axb])
+        self.addCleanup(delattr, self, "m")
+
+    def test_columns(self):
+        """Function is called for each row of argument columns."""
+        from array import array
+
+        a = array("l", [1, 2, 3])
+        b = array("d", [0.5, 1.5, 2.5])
+        out = array("d", [0.0] * 3)
+
+        self.assertIs(self.m.axb.call_many(a, b, out=out), out)
+        self.assertEqual(list(out), [0.5, 3.0, 7.5])
+
+    def test_alloc_out(self):
+        """Output column is allocated if not given."""
+        from array import array
+
+        out = self.m.axb.call_many(array("l", [2, 4]), array("d", [1.0, 0.5]))
+        self.assertEqual(list(out), [2.0, 2.0])
+
+    def test_readonly_columns(self):
+        """Argument columns don't have to be writable, unlike the output one."""
+        import numpy as np
+
+        a = np.array([1, 2, 3], dtype=np.int64)
+        b = np.array([0.5, 1.5, 2.5])
+        for column in (a, b):
+            column.flags.writeable = False
+
+        self.assertEqual(list(self.m.axb.call_many(a, b)), [0.5, 3.0, 7.5])
+
+        out = np.zeros(3)
+        out.flags.writeable = False
+        with self.assertRaises(ValueError):
+            self.m.axb.call_many(a, b, out=out)
+
+    def test_invalid_columns(self):
+        """Column count and lengths are checked."""
+        from array import array
+
+        with self.assertRaises(TypeError):
+            self.m.axb.call_many(array("l", [1]))
+        with self.assertRaises(ValueError):
+            self.m.axb.call_many(array("l", [1]), array("d", [1.0, 2.0]))
+
+    def test_unsupported(self):
+        """Only scalar functions can be called in batches."""
+        from nitrous.types import Double
+        from nitrous.types.array import Slice
+
+        @function(Double, x=Slice(Double))
+        def first(x):
+            return x[0]
+
+        m = module([first])
+        with self.assertRaises(TypeError):
+            m.first.call_many([])
+
+
+class FastMathTests(unittest.TestCase):
+
+    def test_flags(self):
+        """Fast math flags are normalized and validated."""
+        from nitrous.function import options, FASTMATH_FLAGS
+        from nitrous.types import Double
+
+        @options(fastmath=["nnan", "contract", "nnan"])
+        @function(Double, x=Double)
+        def f(x):
+            return x
+
+        self.assertEqual(f.options["fastmath"], ("contract", "nnan"))
+
+        @options(fastmath=True)
+        @function(Double, x=Double)
+        def g(x):
+            return x
+
+        self.assertEqual(g.options["fastmath"], tuple(sorted(FASTMATH_FLAGS)))
+
+        with self.assertRaises(ValueError):
+            options(fastmath=["nnan", "fast"])
+
+        # Only available as a single target option.
+        options(fastmath=["reassoc", "arcp"])
+        with self.assertRaises(ValueError):
+            options(fastmath=["reassoc"])
+        with self.assertRaises(ValueError):
+            options(fastmath="arcp")
+
+    def test_module_flags(self):
+        """Target options only allow relaxations shared by all functions."""
+        from nitrous.function import options, _fastmath_bits
+        from nitrous.types import Double
+        from nitrous import llvm
+
+        @options(fastmath=True)
+        @function(Double, x=Double)
+        def f(x):
+            return x
+
+        @options(fastmath=("nnan", "ninf"))
+        @function(Double, x=Double)
+        def g(x):
+            return x
+
+        @function(Double, x=Double)
+        def h(x):
+            return x
+
+        self.assertEqual(_fastmath_bits([f, g]), llvm.FastMathNoNaNs | llvm.FastMathNoInfs)
+        self.assertEqual(_fastmath_bits([f, g, h]), 0)
+
+    def test_contract(self):
+        """Products added to or subtracted from are fused."""
+        from nitrous.function import options
+        from nitrous.types import Double
+
+        @options(fastmath=["contract"])
+        @function(Double, a=Double, b=Double, c=Double)
+        def axpy(a, b, c):
+            return a * b + c
+
+        @options(fastmath=["contract"])
+        @function(Double, a=Double, b=Double, c=Double)
+        def c_axy(a, b, c):
+            return c - a * b
+
+        m = module([axpy, c_axy])
+        self.assertIn("llvm.fmuladd", dump(m))
+
+        self.assertEqual(m.axpy(2.0, 3.0, 1.0), 7.0)
+        self.assertEqual(m.c_axy(2.0, 3.0, 1.0), -5.0)
+
+    def test_contract_integers(self):
+        """Integer expressions are left as they are."""
+        from nitrous.function import options
+        from nitrous.types import Long
+
+        @options(fastmath=["contract"])
+        @function(Long, a=Long, b=Long, c=Long)
+        def axmy(a, b, c):
+            return a * b - c
+
+        m = module([axmy])
+        self.assertNotIn("llvm.fmuladd", dump(m))
+        self.assertEqual(m.axmy(2, 3, 1), 5)
+
+    @unittest.skipUnless(platform.machine() in ("x86_64", "i386", "i686"), "MXCSR is x86 only")
+    def test_ftz(self):
+        """Denormals are flushed to zero only within the function."""
+        from nitrous.function import options
+        from nitrous.types import Double
+
+        @options(fastmath=["ftz"])
+        @function(Double, x=Double, y=Double)
+        def mul_ftz(x, y):
+            return x * y
+
+        @function(Double, x=Double, y=Double)
+        def mul(x, y):
+            return x * y
+
+        m = module([mul_ftz, mul])
+
+        self.assertEqual(m.mul_ftz(1e-310, 1.0), 0.0)
+        self.assertEqual(m.mul(1e-310, 1.0), 1e-310)
+
+
+class MemoryAttributesTests(unittest.TestCase):
+
+    def test_attributes(self):
+        """Functions and arguments are marked according to memory use."""
+        from nitrous.lib.math import sqrt
+        from nitrous.types import Double
+        from nitrous.types.array import Slice
+
+        @function(Double, x=Double, y=Double)
+        def hypot(x, y):
+            return sqrt(Double)(x * x + y * y)
+
+        @function(Double, x=Slice(Double))
+        def norm(x):
+            return hypot(x[0], x[1])
+
+        ir = dump(module([hypot, norm]))
+
+        self.assertIn("readnone", ir)
+        self.assertIn("readonly", ir)
+        self.assertIn("nocapture", ir)
+
+
+class AliasTests(unittest.TestCase):
+
+    def test_policies(self):
+        """Alias policy is validated and determines entry checks."""
+        from nitrous.function import options, _alias_checks
+        from nitrous.types import Double
+        from nitrous.types.array import Slice
+
+        @options(alias="check")
+        @function(x=Slice(Double), y=Slice(Double), z=Slice(Double))
+        def scale(x, y, z):
+            for i in range(x.shape[0]):
+                x[i] = y[i] * z[i]
+
+        @options(alias="check")
+        @function(Double, x=Slice(Double), y=Slice(Double))
+        def dot(x, y):
+            s = 0.0
+            for i in range(x.shape[0]):
+                s += x[i] * y[i]
+            return s
+
+        self.assertEqual(scale.options["alias"], "check")
+        # Read-only arguments may overlap each other.
+        self.assertEqual(_alias_checks(scale), [("x", "y"), ("x", "z")])
+        self.assertEqual(_alias_checks(dot), [])
+
+        ir = dump(module([scale, dot]))
+        self.assertIn("scale__body_alias", ir)
+        self.assertNotIn("dot__body_alias", ir)
+
+        with self.assertRaises(ValueError):
+            options(alias="restrict")
+
+    def test_overlap(self):
+        """Overlapping arguments are handled by the conservative body."""
+        from nitrous.function import options
+        from nitrous.types import Double
+        from nitrous.types.array import Slice
+        import numpy as np
+
+        def doubling(alias):
+
+            @options(alias=alias)
+            @function(x=Slice(Double), y=Slice(Double))
+            def double(x, y):
+                for i in range(x.shape[0]):
+                    x[i] = y[i] * 2.0
+
+            return double
+
+        for alias in ("check", "none"):
+            f = module([doubling(alias)]).double
+
+            a = np.ones(8)
+            f(a[1:], a[:-1])
+            self.assertEqual(list(a), [2.0 ** k for k in range(8)])
+
+            # Separate memory gives the same result either way.
+            b = np.ones(7)
+            f(b, np.arange(7.0))
+            self.assertEqual(list(b), [2.0 * k for k in range(7)])
+
+    def test_unknown_extent(self):
+        """Arguments of unknown size are only handled by the conservative body."""
+        from nitrous.function import options
+        from nitrous.types import Double, Index
+        from nitrous.types.array import FastSlice
+        import numpy as np
+
+        @options(alias="check")
+        @function(x=FastSlice(Double), y=FastSlice(Double), n=Index)
+        def double(x, y, n):
+            for i in range(n):
+                x[i] = y[i] * 2.0
+
+        m = module([double])
+        self.assertNotIn("double__body_alias", dump(m))
+
+        a = np.ones(8)
+        m.double(a[1:], a[:-1], 7)
+        self.assertEqual(list(a), [2.0 ** k for k in range(8)])
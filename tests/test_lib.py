@@ -145,6 +145,101 @@ class CastTests(unittest.TestCase):
             module([int_to_long])
 
 
+class MemoryTests(unittest.TestCase):
+
+    def setUp(self):
+        import numpy as np
+        from nitrous.types.array import Slice
+        from nitrous.lib.memory import empty, resize, free
+
+        DoubleN = Slice(Double)
+
+        @function(DoubleN, x=DoubleN)
+        def positive(x):
+            out = empty(DoubleN)(2)
+            n = 0
+            for i in range(x.shape[0]):
+                if x[i] > 0.0:
+                    if n == out.shape[0]:
+                        out = resize(DoubleN)(out, n * 2)
+                    out[n] = x[i]
+                    n += 1
+            return resize(DoubleN)(out, n)
+
+        @function(DoubleN, x=DoubleN)
+        def same(x):
+            return x
+
+        @function(Double, n=Long)
+        def scratch(n):
+            tmp = empty(DoubleN)(n)
+            s = 0.0
+            for i in range(n):
+                tmp[i] = 1.0
+                s += tmp[i]
+            free(tmp)
+            return s
+
+        @function(DoubleN, n=Long)
+        def tail(n):
+            out = empty(DoubleN)(n)
+            for i in range(n):
+                out[i] = Double(i)
+            return out[1:]
+
+        @function(Double, n=Long)
+        def scratch_view(n):
+            tmp = empty(DoubleN)(n)
+            tmp[0] = 1.0
+            s = tmp[0]
+            free(tmp[1:])
+            return s
+
+        self.m = module([positive, same, scratch, tail, scratch_view])
+        self.np = np
+        self.addCleanup(delattr, self, "m")
+
+    def test_owned_result(self):
+        """Slices allocated by compiled code are returned as arrays."""
+        x = self.np.array([1.0, -1.0, 2.0, 3.0, -4.0, 5.0])
+        y = self.m.positive(x)
+
+        self.assertIsInstance(y, self.np.ndarray)
+        self.assertEqual(y.tolist(), [1.0, 2.0, 3.0, 5.0])
+        self.assertEqual(self.m.positive(-x).tolist(), [1.0, 4.0])
+        self.assertEqual(self.m.positive(self.np.zeros(0)).tolist(), [])
+
+    def test_view_result(self):
+        """Slices of arguments are returned as views."""
+        x = self.np.arange(3.0)
+        y = self.m.same(x)
+
+        y[0] = 10.0
+        self.assertEqual(x[0], 10.0)
+        self.assertTrue(any(a is x for a in y.base.owner))
+
+    def test_buffer_view_result(self):
+        """Views of buffer arguments keep the buffers alive."""
+        from array import array
+
+        x = array("d", [1.0, 2.0])
+        y = self.m.same(x)
+        del x
+
+        self.assertEqual(y.tolist(), [1.0, 2.0])
+
+    def test_owned_view_result(self):
+        """Views of allocated slices own the whole allocated block."""
+        y = self.m.tail(4)
+        self.assertEqual(y.tolist(), [1.0, 2.0, 3.0])
+        self.assertNotEqual(y.base.owner.address, y.ctypes.data)
+
+    def test_free(self):
+        """Temporary slices can be released."""
+        self.assertEqual(self.m.scratch(5), 5.0)
+        self.assertEqual(self.m.scratch_view(5), 1.0)
+
+
 class PrintTests(unittest.TestCase):
 
     def test_various(self):
@@ -124,3 +124,612 @@ class CppLibraryTests(unittest.TestCase):
 
         so_m = so_module([foo], libs=[self.lib])
         self.assertEqual(so_m.foo(a, b, c), ref)
+
+
+class CacheTests(unittest.TestCase):
+
+    def setUp(self):
+        from tempfile import mkdtemp
+        from shutil import rmtree
+
+        self.cache_dir = mkdtemp()
+        self.addCleanup(rmtree, self.cache_dir)
+
+    def test_reuse(self):
+        """Rebuilding identical module loads it from cache."""
+        import os
+        from nitrous.module import so_module
+
+        @function(Long, a=Long)
+        def add1(a):
+            return a + 1
+
+        m1 = so_module([add1], cache_dir=self.cache_dir)
+        artifacts = os.listdir(self.cache_dir)
+        self.assertEqual(len(artifacts), 1)
+
+        m2 = so_module([add1], cache_dir=self.cache_dir)
+        self.assertEqual(os.listdir(self.cache_dir), artifacts)
+
+        self.assertIsNone(m2.__n2o_module__)
+        self.assertEqual(m1.add1(5), 6)
+        self.assertEqual(m2.add1(5), 6)
+
+    def test_reuse_jit(self):
+        """Rebuilding identical JIT module loads optimized bitcode from cache."""
+        import os
+        from nitrous.module import jit_module
+
+        @function(Long, a=Long)
+        def add1(a):
+            return a + 1
+
+        m1 = jit_module([add1], cache_dir=self.cache_dir)
+        artifacts = [f for f in os.listdir(self.cache_dir) if f.endswith(".bc")]
+        self.assertEqual(len(artifacts), 1)
+
+        m2 = jit_module([add1], cache_dir=self.cache_dir)
+
+        self.assertEqual(m1.add1(5), 6)
+        self.assertEqual(m2.add1(5), 6)
+
+    def test_concurrent(self):
+        """Concurrent builds of the same module compile it once."""
+        import os
+        from threading import Thread
+        from nitrous.module import so_module
+
+        @function(Long, a=Long)
+        def add1(a):
+            return a + 1
+
+        results = []
+
+        def build():
+            m = so_module([add1], cache_dir=self.cache_dir)
+            results.append(m.add1(1))
+
+        threads = [Thread(target=build) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(results, [2] * 8)
+
+        artifacts = [f for f in os.listdir(self.cache_dir) if f.endswith(".so")]
+        self.assertEqual(len(artifacts), 1)
+
+    def test_key(self):
+        """Cache key depends on sources of all functions and constants they use."""
+        from nitrous.cache import module_key
+
+        def get_foo(n):
+
+            @function(Long, a=Long)
+            def bar(a):
+                return a + n
+
+            @function(Long, a=Long)
+            def foo(a):
+                return bar(a)
+
+            return foo
+
+        self.assertEqual(module_key([get_foo(1)]), module_key([get_foo(1)]))
+        self.assertNotEqual(module_key([get_foo(1)]), module_key([get_foo(2)]))
+
+    def test_key_environment(self):
+        """Cache key depends on nitrous and, for trampolines, on Python ABI."""
+        from nitrous import cache
+
+        @function(Long, a=Long)
+        def add1(a):
+            return a + 1
+
+        key = cache.module_key([add1])
+
+        digest = cache._package_digest()
+        cache._package_digests[:] = ["other"]
+        try:
+            self.assertNotEqual(cache.module_key([add1]), key)
+        finally:
+            cache._package_digests[:] = [digest]
+
+        abi = cache._python_abi
+        options = (("trampolines", True),)
+        key = cache.module_key([add1], options=options)
+        cache._python_abi = lambda: "other"
+        try:
+            self.assertNotEqual(cache.module_key([add1], options=options), key)
+        finally:
+            cache._python_abi = abi
+
+    def test_key_attribute(self):
+        """Cache key depends on functions referenced through module attributes."""
+        from nitrous.cache import module_key
+        from types import ModuleType
+
+        def get_foo(n):
+
+            @function(Long, a=Long)
+            def bar(a):
+                return a + n
+
+            mylib = ModuleType("mylib")
+            mylib.bar = bar
+
+            @function(Long, a=Long)
+            def foo(a):
+                return mylib.bar(a)
+
+            return foo
+
+        self.assertEqual(module_key([get_foo(1)]), module_key([get_foo(1)]))
+        self.assertNotEqual(module_key([get_foo(1)]), module_key([get_foo(2)]))
+
+
+class LazyTests(unittest.TestCase):
+
+    def test_compile_on_call(self):
+        """Functions are compiled only when they are first called."""
+        from nitrous.module import lazy_module
+
+        @function(Long, a=Long)
+        def add1(a):
+            return a + 1
+
+        @function(Long, a=Long)
+        def broken(a):
+            return a + 1.0
+
+        m = lazy_module([add1, broken])
+
+        self.assertIsNone(m.add1.cfunc)
+        self.assertEqual(m.add1(5), 6)
+        self.assertIsNotNone(m.add1.cfunc)
+
+        with self.assertRaises(TypeError):
+            m.broken(5)
+
+    def test_trampolines(self):
+        """Stubs need ctypes functions; trampolines are rejected up front."""
+        from nitrous.module import lazy_module
+
+        @function(Long, a=Long)
+        def add1(a):
+            return a + 1
+
+        with self.assertRaises(ValueError):
+            lazy_module([add1], trampolines=True)
+
+        self.assertEqual(lazy_module([add1], trampolines=False).add1(5), 6)
+
+    def test_concurrent(self):
+        """Concurrent first calls compile the function once."""
+        from threading import Thread
+        from nitrous.module import lazy_module, jit_module
+
+        @function(Long, a=Long)
+        def add1(a):
+            return a + 1
+
+        builds = []
+
+        def builder(decls):
+            builds.append(decls)
+            return jit_module(decls)
+
+        m = lazy_module([add1], builder=builder)
+        results = []
+
+        threads = [Thread(target=lambda: results.append(m.add1(1))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(results, [2] * 8)
+        self.assertEqual(len(builds), 1)
+
+
+class AsyncTests(unittest.TestCase):
+
+    def test_result(self):
+        from nitrous.module import async_module
+
+        @function(Long, a=Long)
+        def add1(a):
+            return a + 1
+
+        pending = async_module([add1])
+        m = pending.result()
+
+        self.assertTrue(pending.done())
+        self.assertEqual(m.add1(5), 6)
+        self.assertEqual(pending.add1(5), 6)
+
+    def test_error(self):
+        from nitrous.module import async_module
+
+        @function(Long, a=Long)
+        def broken(a):
+            return a + 1.0
+
+        pending = async_module([broken])
+
+        with self.assertRaises(TypeError):
+            pending.result()
+
+    def test_done_callback(self):
+        """Callbacks run once the build finishes, or immediately after it has."""
+        from threading import Event
+        from nitrous.module import async_module, so_module
+
+        @function(Long, a=Long)
+        def add1(a):
+            return a + 1
+
+        release = Event()
+
+        def builder(decls):
+            release.wait()
+            return so_module(decls)
+
+        pending = async_module([add1], builder=builder)
+        called = []
+        finished = Event()
+
+        def callback(p):
+            called.append(p.result().add1(5))
+            finished.set()
+
+        pending.add_done_callback(callback)
+        self.assertEqual(called, [])
+
+        release.set()
+        finished.wait(60)
+        self.assertEqual(called, [6])
+
+        pending.add_done_callback(callback)
+        self.assertEqual(called, [6, 6])
+
+    def test_fallback(self):
+        """Python function is used until the build finishes."""
+        from threading import Event
+        from nitrous.module import async_module, so_module
+
+        @function(Long, a=Long)
+        def add1(a):
+            return a + 1
+
+        release = Event()
+
+        def builder(decls):
+            release.wait()
+            return so_module(decls)
+
+        pending = async_module([add1], builder=builder, policy="fallback")
+
+        self.assertIs(pending.add1, add1.pyfunc)
+        self.assertEqual(pending.add1(5), 6)
+
+        release.set()
+        pending.result()
+
+        self.assertIsNot(pending.add1, add1.pyfunc)
+        self.assertEqual(pending.add1(5), 6)
+
+
+class TieredTests(unittest.TestCase):
+
+    def test(self):
+        """Functions switch to optimized code after enough calls."""
+        from time import sleep
+        from nitrous.module import tiered_module
+
+        @function(Long, a=Long)
+        def add1(a):
+            return a + 1
+
+        m = tiered_module([add1], threshold=3)
+        self.assertEqual(m.add1.tier, 0)
+
+        for i in range(3):
+            self.assertEqual(m.add1(i), i + 1)
+
+        for _ in range(100):
+            if m.add1.tier == 1:
+                break
+            sleep(0.1)
+
+        self.assertEqual(m.add1.tier, 1)
+        self.assertEqual(m.add1.calls, 3)
+        self.assertEqual(m.add1(5), 6)
+
+    def test_error(self):
+        """Failed optimized build is reported and leaves function at tier 0."""
+        import warnings
+        from time import sleep
+        from nitrous.module import jit_module, TieredFunction
+
+        @function(Long, a=Long)
+        def add1(a):
+            return a + 1
+
+        def build(decls):
+            raise RuntimeError("Out of luck")
+
+        f = TieredFunction(jit_module([add1]).add1, build, 1)
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            self.assertEqual(f(1), 2)
+
+            for _ in range(100):
+                if caught:
+                    break
+                sleep(0.1)
+
+        self.assertEqual(len(caught), 1)
+        self.assertIs(caught[0].category, RuntimeWarning)
+        self.assertIsInstance(f.error, RuntimeError)
+        self.assertEqual(f.tier, 0)
+        self.assertEqual(f(2), 3)
+
+
+class ProfileTests(unittest.TestCase):
+
+    def test_per_function(self):
+        """Functions with their own profile are compiled along with the rest."""
+        from nitrous.module import so_module, jit_module, OptimizationProfile
+        from nitrous.function import options
+
+        @function(Long, a=Long)
+        def add1(a):
+            return a + 1
+
+        @options(profile=OptimizationProfile(opt_level=0, inline_threshold=None))
+        @function(Long, a=Long)
+        def add2(a):
+            return add1(add1(a))
+
+        @function(Long, a=Long)
+        def add3(a):
+            return add2(add1(a))
+
+        fast = OptimizationProfile(opt_level=3, loop_vectorize=True, unroll_count=4)
+
+        for builder in (so_module, jit_module):
+            m = builder([add1, add2, add3], profile=fast)
+            self.assertEqual(m.add1(1), 2)
+            self.assertEqual(m.add2(1), 3)
+            self.assertEqual(m.add3(1), 4)
+
+    def test_key(self):
+        """Profiles are part of module cache key."""
+        from nitrous.cache import module_key
+        from nitrous.module import OptimizationProfile
+
+        @function(Long, a=Long)
+        def add1(a):
+            return a + 1
+
+        def key(**kwargs):
+            return module_key([add1], options=(("profile", OptimizationProfile(**kwargs)),))
+
+        self.assertEqual(key(opt_level=3), key(opt_level=3))
+        self.assertNotEqual(key(opt_level=3), key(opt_level=1))
+        self.assertNotEqual(key(), key(unroll=False))
+
+
+class TargetTests(unittest.TestCase):
+
+    def test_cpu(self):
+        """Modules can be built for host or generic CPU."""
+        from nitrous.module import so_module, jit_module
+
+        @function(Long, a=Long)
+        def add1(a):
+            return a + 1
+
+        for builder in (so_module, jit_module):
+            for cpu in ("host", "generic"):
+                m = builder([add1], cpu=cpu)
+                self.assertEqual(m.add1(5), 6)
+
+    def test_variants(self):
+        """Each of the compiled variants can be selected at load time."""
+        from nitrous.module import so_module
+
+        @function(Long, a=Long)
+        def add1(a):
+            return a + 1
+
+        variants = ["+sse4.2,+popcnt", ""]
+
+        for v in variants:
+            m = so_module([add1], variants=variants, select=lambda variants: v)
+            self.assertEqual(m.__n2o_variant__, v)
+            self.assertEqual(m.add1(5), 6)
+
+    def test_select_variant(self):
+        """Default selection picks the first variant supported by host (x86-64)."""
+        from nitrous.module import select_variant
+
+        self.assertEqual(select_variant(["+no-such-feature", "+sse2", ""]), "+sse2")
+
+
+class StatsTests(unittest.TestCase):
+
+    def test_phases(self):
+        """Builders record phase times, instruction counts and object size."""
+        from nitrous.module import so_module, jit_module, stats
+        from nitrous.function import _qualified_name
+
+        @function(Long, a=Long)
+        def add1(a):
+            return a + 1
+
+        for builder in (so_module, jit_module):
+            m = builder([add1])
+            s = stats(m)
+
+            for phase in ("parse", "emit", "verify", "optimize", "codegen"):
+                self.assertGreater(s.phases[phase], 0)
+
+            f = s.functions[_qualified_name(s.module_name, add1)]
+            self.assertGreater(f["times"]["emit"], 0)
+            self.assertGreater(f["instructions"]["before"], 0)
+            self.assertGreater(f["instructions"]["after"], 0)
+
+        self.assertGreater(stats(so_module([add1])).object_size, 0)
+
+    def test_hook(self):
+        """Registered hooks receive build events."""
+        from nitrous.module import so_module
+        from nitrous.stats import add_hook, remove_hook
+
+        @function(Long, a=Long)
+        def add1(a):
+            return a + 1
+
+        events = []
+        add_hook(events.append)
+        try:
+            m = so_module([add1])
+        finally:
+            remove_hook(events.append)
+
+        self.assertEqual(set(e["event"] for e in events), set(["phase", "function", "build"]))
+        self.assertEqual(events[-1]["event"], "build")
+        self.assertEqual(events[-1]["module"], m.__n2o_stats__.module_name)
+        self.assertFalse(events[-1]["cached"])
+
+
+class TrampolineTests(unittest.TestCase):
+
+    def test_scalars(self):
+        """Functions with scalar arguments are exposed as native builtins."""
+        from types import BuiltinFunctionType
+        from nitrous.module import so_module, jit_module
+        from nitrous.types import Double, Bool
+
+        @function(Double, a=Long, b=Double, neg=Bool)
+        def axpb(a, b, neg):
+            if neg:
+                return -b * a
+            return b * a
+
+        for builder in (so_module, jit_module):
+            m = builder([axpb], trampolines=True)
+            self.assertIsInstance(m.axpb, BuiltinFunctionType)
+            self.assertEqual(m.axpb(3, 1.5, False), 4.5)
+            self.assertEqual(m.axpb(3, 1.5, True), -4.5)
+
+            with self.assertRaises(TypeError):
+                m.axpb(3, 1.5)
+            with self.assertRaises(TypeError):
+                m.axpb("3", 1.5, False)
+
+    def test_buffers(self):
+        """Pointer and slice arguments accept buffer objects."""
+        import numpy as np
+        from nitrous.module import so_module
+        from nitrous.types import Double, Index
+        from nitrous.types.array import Slice, FastSlice
+
+        @function(Double, x=FastSlice(Double), n=Index)
+        def sum_fast(x, n):
+            s = 0.0
+            for i in range(n):
+                s += x[i]
+            return s
+
+        @function(Double, x=Slice(Double))
+        def sum_slice(x):
+            s = 0.0
+            for i in range(x.shape[0]):
+                s += x[i]
+            return s
+
+        m = so_module([sum_fast, sum_slice], trampolines=True)
+        x = np.arange(10, dtype=np.float64)
+
+        self.assertEqual(m.sum_fast(x, 10), 45.0)
+        self.assertEqual(m.sum_slice(x), 45.0)
+
+        with self.assertRaises(ValueError):
+            m.sum_slice(np.zeros((2, 2)))
+
+        # Items of the same size, but different type.
+        with self.assertRaises(TypeError):
+            m.sum_slice(np.arange(10, dtype=np.int64))
+
+    def test_static_dims(self):
+        """Static slice dimensions are checked the same way as for ctypes calls."""
+        import numpy as np
+        from nitrous.module import so_module
+        from nitrous.types import Double
+        from nitrous.types.array import Slice, Any
+
+        @function(Double, x=Slice(Double, (Any, 3)))
+        def last_column(x):
+            s = 0.0
+            for i in range(x.shape[0]):
+                s += x[i, 2]
+            return s
+
+        x = np.arange(12, dtype=np.float64).reshape(4, 3)
+
+        for trampolines in (False, True):
+            m = so_module([last_column], trampolines=trampolines)
+            self.assertEqual(m.last_column(x), x[:, 2].sum())
+            with self.assertRaises(ValueError):
+                m.last_column(np.zeros((4, 4)))
+
+    def test_arrays(self):
+        """Array arguments accept buffers of matching size."""
+        import numpy as np
+        from nitrous.module import so_module
+        from nitrous.types import Double
+        from nitrous.types.array import Array
+
+        Double3 = Array(Double, (3,))
+
+        @function(Double, x=Double3)
+        def sum3(x):
+            return x[0] + x[1] + x[2]
+
+        @function(x=Double3)
+        def clear3(x):
+            for i in range(3):
+                x[i] = 0.0
+
+        m = so_module([sum3, clear3], trampolines=True)
+        x = np.array([1.0, 2.0, 3.0])
+
+        self.assertEqual(m.sum3(x), 6.0)
+        m.clear3(x)
+        self.assertEqual(x.tolist(), [0.0, 0.0, 0.0])
+
+        with self.assertRaises(TypeError):
+            m.sum3(np.zeros(2))
+        with self.assertRaises(TypeError):
+            m.sum3(np.zeros(3, dtype=np.int64))
+        with self.assertRaises(BufferError):
+            m.clear3(bytes(np.zeros(3).data))
+
+    def test_fallback(self):
+        """Unsupported functions keep using ctypes."""
+        from nitrous.module import so_module
+        from nitrous.function import Function
+        from nitrous.types import Char
+
+        @function(Char, c=Char)
+        def same(c):
+            return c
+
+        m = so_module([same], trampolines=True)
+        self.assertIsInstance(m.same, Function)
+        self.assertEqual(m.same("a"), "a")
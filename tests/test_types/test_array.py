@@ -4,7 +4,7 @@ import ctypes
 from nitrous.module import module
 from nitrous.function import function
 from nitrous.types import Long
-from nitrous.types.array import Array, FastSlice, Slice, Any
+from nitrous.types.array import Array, FastSlice, Slice, StridedSlice, Any
 
 try:
     import numpy as np
@@ -89,6 +89,65 @@ class FastSliceTests(ArrayTestsBase, unittest.TestCase):
         self.assertEqual(str(self.B), "<FastSlice [12 x Long]>")
 
 
+class StridedSliceTests(ArrayTestsBase, unittest.TestCase):
+
+    A = StridedSlice(Long, (Any,) * 3)
+    B = StridedSlice(Long, strides=(1,))
+
+    def test_repr(self):
+        self.assertEqual(repr(self.A), "StridedSlice(Long, shape=(Any, Any, Any), "
+                                       "strides=(Any, Any, Any))")
+        self.assertEqual(repr(self.B), "StridedSlice(Long, shape=(Any,), strides=(1,))")
+
+    def test_str(self):
+        self.assertEqual(str(self.A), "<StridedSlice [? x [? x [? x Long]]]>")
+        self.assertEqual(str(self.B), "<StridedSlice [? x Long]>")
+
+    def test_tag(self):
+        self.assertNotEqual(self.B.tag, Slice(Long).tag)
+        self.assertNotEqual(self.B.tag, StridedSlice(Long).tag)
+
+    @unittest.skipIf(not np, "NumPy integration feature")
+    def test_views(self):
+        """Non-contiguous views are addressed through their strides."""
+        a = np.arange(12, dtype=Long.c_type).reshape(2, 3, 2)
+        b = np.zeros(12, dtype=Long.c_type)
+
+        for view in (a[:, ::2], a[::-1], a.transpose(2, 0, 1)):
+            self.assertEqual(self.m.f(view, b), view.size)
+            self.assertEqual(b[:view.size].tolist(), view.ravel().tolist())
+
+    @unittest.skipIf(not np, "NumPy integration feature")
+    def test_static_stride(self):
+        """Static strides must match the argument."""
+        a = np.zeros((2, 3, 4), dtype=Long.c_type)
+        b = np.zeros(24, dtype=Long.c_type)
+
+        self.m.f(a[:, :, :2], b)
+        with self.assertRaises(ValueError):
+            self.m.f(a[:, :, :2], b[::2])
+
+
+@unittest.skipIf(not np, "NumPy integration feature")
+class StridedSubsliceTests(unittest.TestCase):
+
+    def test_row(self):
+
+        @function(Long, x=StridedSlice(Long, (Any, Any)), i=Long)
+        def row_sum(x, i):
+            row = x[i]
+            s = 0
+            for j in range(row.shape[0]):
+                s += row[j]
+            return s
+
+        m = module([row_sum])
+        a = np.arange(12, dtype=Long.c_type).reshape(3, 4)
+
+        self.assertEqual(m.row_sum(a.T, 1), a[:, 1].sum())
+        self.assertEqual(m.row_sum(a[::2, 1::2], 1), a[2, 1::2].sum())
+
+
 class ArrayTests(ArrayTestsBase, unittest.TestCase):
 
     A = Array(Long, (2, 3, 2))
@@ -151,6 +210,293 @@ class SliceReferenceTests(unittest.TestCase):
 
         self.assertTrue(is_aggregate(Slice(Long)))
 
+    def test_unpacked(self):
+        """Unpacked descriptors behave the same when passed on and returned."""
+        LongN = Slice(Long)
+
+        @function(x=LongN, y=LongN)
+        def copy(x, y):
+            for i in range(x.shape[0]):
+                y[i] = x[i]
+
+        @function(LongN, x=LongN, y=LongN)
+        def copy_back(x, y):
+            copy(x, y)
+            return y
+
+        m = module([copy_back])
+        x = (Long.c_type * 3)(1, 2, 3)
+        y = (Long.c_type * 3)()
+
+        m.copy_back(x, y)
+        self.assertEqual(list(y), [1, 2, 3])
+
+
+@unittest.skipIf(not np, "NumPy integration feature")
+class SliceConverterTests(unittest.TestCase):
+
+    def test_reuse_descriptor(self):
+        """Slice descriptor is reused for the same data and shape."""
+        from nitrous.types import converter
+
+        convert = converter(Slice(Long, shape=(Any, Any)))
+        x = np.zeros((2, 3), dtype=Long.c_type)
+
+        d = convert(x)
+        self.assertIs(convert(x), d)
+        self.assertEqual(list(d.shape), [2, 3])
+        self.assertEqual(ctypes.addressof(d.data.contents), x.ctypes.data)
+
+        # View of the same memory with a different shape.
+        self.assertEqual(list(convert(x.reshape(3, 2)).shape), [3, 2])
+        self.assertIsNot(convert(x), d)
+
+    def test_transpose(self):
+        """Same memory and shape in a different layout isn't taken from cache."""
+        from nitrous.types import converter
+
+        convert = converter(Slice(Long, shape=(Any, Any)))
+        x = np.zeros((3, 3), dtype=Long.c_type)
+
+        convert(x)
+        with self.assertRaises(ValueError):
+            convert(x.T)
+
+    def test_call(self):
+        """Repeated calls see updated contents of the same array."""
+
+        @function(Long, x=Slice(Long))
+        def f(x):
+            return x[0]
+
+        m = module([f])
+        x = np.zeros(1, dtype=Long.c_type)
+
+        self.assertEqual(m.f(x), 0)
+        x[0] = 5
+        self.assertEqual(m.f(x), 5)
+
+
+class LayoutTests(unittest.TestCase):
+
+    def test_repr(self):
+        self.assertEqual(repr(Slice(Long, (Any, 3), layout="F")),
+                         "Slice(Long, shape=(Any, 3), layout='F')")
+        self.assertEqual(repr(Array(Long, (2, 3), layout="F")),
+                         "Array(Long, shape=(2, 3), layout='F')")
+
+    def test_tag(self):
+        self.assertNotEqual(Slice(Long, layout="F").tag, Slice(Long).tag)
+        self.assertNotEqual(FastSlice(Long, layout="F").tag, FastSlice(Long).tag)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Slice(Long, layout="X")
+
+
+@unittest.skipIf(not np, "NumPy integration feature")
+class ColumnMajorTests(unittest.TestCase):
+
+    def setUp(self):
+
+        def f(a, b):
+            m = 0
+            for i in range(a.shape[0]):
+                for j in range(a.shape[1]):
+                    b[m] = a[i, j]
+                    m += 1
+            return m
+
+        self.a = np.asfortranarray(np.arange(6, dtype=Long.c_type).reshape(2, 3))
+        self.b = np.zeros(6, dtype=Long.c_type)
+        self.f = f
+
+    def check(self, A):
+        m = module([function(Long, a=A, b=Slice(Long))(self.f)])
+
+        self.assertEqual(m.f(self.a, self.b), 6)
+        self.assertEqual(self.b.tolist(), range(6))
+
+        # Row-major memory is rejected rather than misread.
+        with self.assertRaises(ValueError):
+            m.f(np.ascontiguousarray(self.a), self.b)
+
+    def test_slice(self):
+        self.check(Slice(Long, (Any, Any), layout="F"))
+
+    def test_static_slice(self):
+        self.check(Slice(Long, (2, Any), layout="F"))
+
+    def test_fast_slice(self):
+        self.check(FastSlice(Long, (2, 3), layout="F"))
+
+    def test_array(self):
+        self.check(Array(Long, (2, 3), layout="F"))
+
+    def test_subslice(self):
+        """Rows of column-major slices are strided."""
+
+        @function(Long, a=Slice(Long, (Any, Any), layout="F"), i=Long)
+        def row_sum(a, i):
+            row = a[i]
+            s = 0
+            for j in range(row.shape[0]):
+                s += row[j]
+            return s
+
+        m = module([row_sum])
+        self.assertEqual(m.row_sum(self.a, 1), 3 + 4 + 5)
+
+    def test_result(self):
+        """Column-major results keep their layout."""
+        A = Slice(Long, (Any, Any), layout="F")
+
+        @function(A, a=A)
+        def identity(a):
+            return a
+
+        m = module([identity])
+        r = m.identity(self.a)
+
+        self.assertTrue(r.flags.f_contiguous)
+        self.assertEqual(r.tolist(), self.a.tolist())
+
+
+@unittest.skipIf(not np, "NumPy integration feature")
+class ViewTests(unittest.TestCase):
+
+    def setUp(self):
+        self.x = np.arange(12, dtype=Long.c_type).reshape(3, 4)
+
+    def check(self, A, f, expected, *args):
+        m = module([function(Long, x=A, **dict(("a{0}".format(k), Long)
+                                             for k in range(len(args))))(f)])
+        self.assertEqual(getattr(m, f.__name__)(self.x, *args), expected)
+
+    def test_rows(self):
+
+        def rows(x, a0, a1):
+            v = x[a0:a1]
+            s = 0
+            for i in range(v.shape[0]):
+                for j in range(v.shape[1]):
+                    s += v[i, j]
+            return s * 100 + v.shape[0]
+
+        for A in (Slice(Long, (Any, Any)), Slice(Long, (Any, 4)), FastSlice(Long, (3, 4)),
+                  Array(Long, (3, 4))):
+            self.check(A, rows, self.x[1:3].sum() * 100 + 2, 1, 3)
+            # Ranges are clamped to the dimension.
+            self.check(A, rows, self.x[2:].sum() * 100 + 1, 2, 10)
+
+    def test_row(self):
+
+        def row(x, a0):
+            v = x[a0, :]
+            s = 0
+            for j in range(v.shape[0]):
+                s += v[j]
+            return s
+
+        self.check(Slice(Long, (Any, Any)), row, self.x[1].sum(), 1)
+
+    def test_column(self):
+        """Columns are strided views."""
+
+        def column(x, a0):
+            v = x[:, a0]
+            s = 0
+            for i in range(v.shape[0]):
+                s += v[i] * (i + 1)
+            return s
+
+        expected = (self.x[:, 2] * np.arange(1, 4)).sum()
+        self.check(Slice(Long, (Any, Any)), column, expected, 2)
+        self.check(Array(Long, (3, 4)), column, expected, 2)
+
+    def test_block(self):
+
+        def block(x, a0, a1):
+            v = x[a0:a1, a0:a1]
+            s = 0
+            for i in range(v.shape[0]):
+                for j in range(v.shape[1]):
+                    s += v[i, j]
+            return s
+
+        self.check(Slice(Long, (Any, Any)), block, self.x[1:3, 1:3].sum(), 1, 3)
+
+    def test_fast_slice(self):
+        """Fast slices with dimensions of unknown size need explicit range ends."""
+
+        def total(x, a0, a1):
+            v = x[a0:a1]
+            s = 0
+            for i in range(v.shape[0]):
+                s += v[i]
+            return s * 100 + v.shape[0]
+
+        self.x = np.arange(12, dtype=Long.c_type)
+        self.check(FastSlice(Long), total, self.x[2:5].sum() * 100 + 3, 2, 5)
+        self.check(FastSlice(Long), total, self.x[:5].sum() * 100 + 5, -3, 5)
+
+        @function(Long, x=FastSlice(Long), n=Long)
+        def tail(x, n):
+            return x[n:].shape[0]
+
+        with self.assertRaisesRegexp(TypeError, "explicit end"):
+            module([tail])
+
+    def test_open_bounds(self):
+
+        def bounds(x, a0):
+            return x[a0:].shape[0] * 10 + x[:a0].shape[0]
+
+        self.check(Slice(Long, (Any, Any)), bounds, 21, 1)
+
+    def test_negative_bounds(self):
+        """Negative bounds count from the end of the dimension."""
+
+        def rows(x, a0, a1):
+            v = x[a0:a1]
+            s = 0
+            for i in range(v.shape[0]):
+                for j in range(v.shape[1]):
+                    s += v[i, j]
+            return s * 100 + v.shape[0]
+
+        for A in (Slice(Long, (Any, Any)), Array(Long, (3, 4))):
+            self.check(A, rows, self.x[-2:10].sum() * 100 + 2, -2, 10)
+            self.check(A, rows, self.x[0:-1].sum() * 100 + 2, 0, -1)
+            self.check(A, rows, self.x[-10:1].sum() * 100 + 1, -10, 1)
+
+    def test_call(self):
+        """Views can be passed to other functions."""
+        LongN = Slice(Long)
+
+        @function(Long, v=LongN)
+        def total(v):
+            s = 0
+            for i in range(v.shape[0]):
+                s += v[i]
+            return s
+
+        @function(Long, x=LongN, n=Long)
+        def head(x, n):
+            return total(x[:n])
+
+        m = module([head])
+        self.assertEqual(m.head(np.arange(10, dtype=Long.c_type), 4), 6)
+
+    def test_step(self):
+
+        @function(Long, x=Slice(Long))
+        def step(x):
+            return x[::2].shape[0]
+
+        with self.assertRaisesRegexp(NotImplementedError, "steps are not supported"):
+            module([step])
+
 
 class IndexTests(unittest.TestCase):
 
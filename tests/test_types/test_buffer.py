@@ -0,0 +1,141 @@
+import unittest
+import ctypes
+import mmap
+from array import array
+
+from nitrous.module import module
+from nitrous.function import function
+from nitrous.types import Double, Long, Byte, Index, Pointer
+from nitrous.types.array import Array, FastSlice, Slice, Any
+
+
+class BufferTests(unittest.TestCase):
+
+    def test_buffer(self):
+        from nitrous.types.buffer import Buffer
+
+        x = array("d", (1.0, 2.0, 3.0))
+        b = Buffer(x)
+
+        self.assertEqual(b.address, x.buffer_info()[0])
+        self.assertEqual(b.shape, (3,))
+        self.assertEqual(b.itemsize, ctypes.sizeof(ctypes.c_double))
+        b.check_format(Double)
+
+        with self.assertRaises(TypeError):
+            b.check_format(Long)
+
+    def test_memoryview(self):
+        from nitrous.types.buffer import Buffer
+
+        b = Buffer(memoryview(bytearray(8)), writable=True)
+        self.assertEqual(b.shape, (8,))
+        self.assertEqual(b.format, "B")
+
+    def test_not_buffer(self):
+        from nitrous.types.buffer import Buffer, is_buffer
+
+        self.assertFalse(is_buffer([1]))
+        with self.assertRaises(TypeError):
+            Buffer([1])
+
+    def test_read_only(self):
+        from nitrous.types.buffer import Buffer
+
+        Buffer("abc")
+        with self.assertRaises(BufferError):
+            Buffer("abc", writable=True)
+
+
+class BufferArgTests(unittest.TestCase):
+
+    def setUp(self):
+
+        @function(Double, x=Slice(Double))
+        def total(x):
+            s = 0.0
+            for i in range(x.shape[0]):
+                s += x[i]
+            return s
+
+        @function(x=Slice(Byte), v=Byte)
+        def fill(x, v):
+            for i in range(x.shape[0]):
+                x[i] = v
+
+        @function(Long, x=Slice(Byte, (Any, 4)))
+        def rows(x):
+            return x.shape[0]
+
+        @function(Double, x=FastSlice(Double), n=Index)
+        def total_fast(x, n):
+            s = 0.0
+            for i in range(n):
+                s += x[i]
+            return s
+
+        @function(Double, x=Array(Double, (2,)))
+        def total_pair(x):
+            return x[0] + x[1]
+
+        self.m = module([total, fill, rows, total_fast, total_pair])
+        self.addCleanup(delattr, self, "m")
+
+    def test_array(self):
+        """Shape and format come from array.array."""
+        x = array("d", (1.0, 2.0, 3.0))
+
+        self.assertEqual(self.m.total(x), 6.0)
+        self.assertEqual(self.m.total_fast(x, 3), 6.0)
+        self.assertEqual(self.m.total_pair(x[:2]), 3.0)
+
+    def test_bytearray(self):
+        x = bytearray(4)
+        self.m.fill(x, 7)
+        self.assertEqual(x, bytearray([7] * 4))
+
+    def test_memoryview(self):
+        x = bytearray(4)
+        self.m.fill(memoryview(x), 3)
+        self.assertEqual(x, bytearray([3] * 4))
+
+    def test_mmap(self):
+        x = mmap.mmap(-1, 8)
+        self.addCleanup(x.close)
+
+        self.m.fill(x, 1)
+        self.assertEqual(x[:], "\x01" * 8)
+
+    def test_reshape(self):
+        """One-dimensional buffers fill static minor dimensions."""
+        self.assertEqual(self.m.rows(bytearray(12)), 3)
+
+        with self.assertRaises(ValueError):
+            self.m.rows(bytearray(10))
+
+    def test_format_mismatch(self):
+        with self.assertRaises(TypeError):
+            self.m.total(array("i", (1, 2, 3)))
+
+    def test_size_mismatch(self):
+        with self.assertRaises(TypeError):
+            self.m.total_pair(array("d", (1.0, 2.0, 3.0)))
+
+    def test_read_only(self):
+        """Read-only memory is accepted unless function writes into it."""
+        self.assertEqual(self.m.total(buffer(array("d", (1.0, 2.0)))), 3.0)
+
+        with self.assertRaises(BufferError):
+            self.m.fill("abcd", 1)
+
+    def test_pointer(self):
+        """Pointers accept buffers."""
+
+        @function(x=Pointer(Long), v=Long)
+        def store(x, v):
+            x[0] = v
+
+        m = module([store])
+        x = array("l", (0,))
+        m.store(x, 5)
+        self.assertEqual(x[0], 5)
@@ -0,0 +1,24 @@
+import unittest
+
+from nitrous.module import module, dump
+from nitrous.function import function
+from nitrous.types import Double, Long, Byte
+from nitrous.types.array import Slice
+
+
+class TBAATests(unittest.TestCase):
+
+    def test_tags(self):
+        """Item and descriptor field accesses are tagged with their types."""
+
+        @function(x=Slice(Double), y=Slice(Long), b=Slice(Byte))
+        def fill(x, y, b):
+            for i in range(x.shape[0]):
+                x[i] = 1.0
+                y[i] = Long(b[i])
+
+        ir = dump(module([fill]))
+
+        self.assertIn("!tbaa", ir)
+        for name in ("nitrous TBAA", "omnipotent char", "any pointer", "f8", "i8"):
+            self.assertIn('!"{0}"'.format(name), ir)
@@ -2,12 +2,15 @@ import unittest
 
 from nitrous.module import module
 from nitrous.function import function
-from nitrous.types import Float
+from nitrous.lib import cast
+from nitrous.types import Float, Int
 from nitrous.types.array import Slice
 from nitrous.exp.vector import Vector, load, store, get_element, set_element, fill
+from nitrous.exp.vector import select, shuffle, permute, reduce_add, reduce_min, reduce_max
 
 FloatP = Slice(Float, (4,))
 Float4 = Vector(Float, 4)
+Int4 = Vector(Int, 4)
 
 load4f = load(Float4)
 store4f = store(Float4)
@@ -17,6 +20,10 @@ set4f = set_element(Float4)
 
 fill4f = fill(Float4)
 
+select4f = select(Float4)
+interleave4f = shuffle(Float4, (0, 4, 1, 5))
+reverse4f = permute(Float4, (3, 2, 1, 0))
+
 
 @function(Float, a=Float, b=Float, c=Float, d=Float)
 def hadd4(a, b, c, d):
@@ -40,6 +47,46 @@ def fill(v, e):
     store4f(fill4f(e), v)
 
 
+@function(a=FloatP, z=FloatP)
+def scale(a, z):
+    store4f(Float(2) * load4f(a) + Float(1), z)
+
+
+@function(a=FloatP, b=FloatP, z=FloatP)
+def minimum(a, b, z):
+    x = load4f(a)
+    y = load4f(b)
+    store4f(select4f(x < y, x, y), z)
+
+
+@function(a=FloatP, z=FloatP)
+def relu(a, z):
+    x = load4f(a)
+    store4f(select4f(x > Float(0), x, Float(0)), z)
+
+
+@function(a=FloatP, b=FloatP, z=FloatP, w=FloatP)
+def shuffles(a, b, z, w):
+    store4f(interleave4f(load4f(a), load4f(b)), z)
+    store4f(reverse4f(load4f(a)), w)
+
+
+@function(Float, a=FloatP)
+def spread(a):
+    x = load4f(a)
+    return reduce_max(Float4)(x) - reduce_min(Float4)(x)
+
+
+@function(Float, a=FloatP)
+def total(a):
+    return reduce_add(Float4)(load4f(a))
+
+
+@function(Int, a=FloatP)
+def total_truncated(a):
+    return reduce_add(Int4)(cast(load4f(a), Int4))
+
+
 class VectorTests(unittest.TestCase):
 
     def test_repr(self):
@@ -70,3 +117,57 @@ class VectorTests(unittest.TestCase):
         m.fill(v, 100.0)
 
         self.assertEqual(list(v), [100.0] * 4)
+
+    def test_mixed(self):
+
+        m = module([scale])
+
+        a = (Float.c_type * 4)(1, 2, 3, 4)
+        z = (Float.c_type * 4)()
+
+        m.scale(a, z)
+        self.assertEqual(list(z), [3, 5, 7, 9])
+
+    def test_select(self):
+
+        m = module([minimum, relu])
+
+        a = (Float.c_type * 4)(1, -2, 3, -4)
+        b = (Float.c_type * 4)(0, 0, 5, -5)
+        z = (Float.c_type * 4)()
+
+        m.minimum(a, b, z)
+        self.assertEqual(list(z), [0, -2, 3, -5])
+
+        m.relu(a, z)
+        self.assertEqual(list(z), [1, 0, 3, 0])
+
+    def test_shuffle(self):
+
+        m = module([shuffles])
+
+        a = (Float.c_type * 4)(1, 2, 3, 4)
+        b = (Float.c_type * 4)(5, 6, 7, 8)
+        z = (Float.c_type * 4)()
+        w = (Float.c_type * 4)()
+
+        m.shuffles(a, b, z, w)
+        self.assertEqual(list(z), [1, 5, 2, 6])
+        self.assertEqual(list(w), [4, 3, 2, 1])
+
+    def test_invalid_indices(self):
+
+        with self.assertRaises(ValueError):
+            shuffle(Float4, (0, 8))
+
+        with self.assertRaises(ValueError):
+            permute(Float4, (4,))
+
+    def test_reduce(self):
+
+        m = module([spread, total, total_truncated])
+
+        a = (Float.c_type * 4)(1.5, -2, 3, 4.5)
+        self.assertEqual(m.spread(a), 6.5)
+        self.assertEqual(m.total(a), 7)
+        self.assertEqual(m.total_truncated(a), 6)
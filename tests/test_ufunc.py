@@ -0,0 +1,96 @@
+import unittest
+
+from nitrous.types import Double, Float, Long, Int
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def scale(x):
+    return x * 2
+
+
+@unittest.skipIf(not np, "NumPy integration feature")
+class VectorizeTests(unittest.TestCase):
+
+    def setUp(self):
+        from nitrous.exp.ufunc import vectorize
+
+        @vectorize([Double, Float, Long, Int], identity=0)
+        def add(a, b):
+            """Adds two numbers."""
+            return a + b
+
+        self.add = add
+        self.addCleanup(delattr, self, "add")
+
+    def test_ufunc(self):
+        """Result is a NumPy ufunc with a loop for each type."""
+        self.assertIsInstance(self.add, np.ufunc)
+        self.assertEqual(self.add.__name__, "add")
+        self.assertEqual(self.add.nin, 2)
+        self.assertEqual(self.add.ntypes, 4)
+        self.assertEqual(self.add.identity, 0)
+
+    def test_dtypes(self):
+        """Loop is selected by argument types."""
+        for dtype in (np.float64, np.float32, np.int64, np.int32):
+            x = np.arange(5, dtype=dtype)
+            y = self.add(x, x)
+            self.assertEqual(y.dtype, dtype)
+            self.assertEqual(list(y), [0, 2, 4, 6, 8])
+
+    def test_broadcast(self):
+        """Arguments are broadcast against each other."""
+        x = np.arange(6.0).reshape(2, 3)
+        y = np.array([10.0, 20.0, 30.0])
+        self.assertEqual(self.add(x, y).tolist(), [[10.0, 21.0, 32.0], [13.0, 24.0, 35.0]])
+        self.assertEqual(self.add(x, 1.0).tolist(), [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+
+    def test_strided(self):
+        """Non-contiguous arguments and out= are supported."""
+        x = np.arange(10.0)
+        out = np.zeros(10)
+        self.add(x[::2], x[1::2], out=out[::2])
+        self.assertEqual(out.tolist(), [1.0, 0, 5.0, 0, 9.0, 0, 13.0, 0, 17.0, 0])
+
+    def test_reduce(self):
+        """Reductions and accumulations are available."""
+        x = np.arange(5.0)
+        self.assertEqual(self.add.reduce(x), 10.0)
+        self.assertEqual(self.add.accumulate(x).tolist(), [0.0, 1.0, 3.0, 6.0, 10.0])
+        self.assertEqual(self.add.reduce(np.zeros(0)), 0.0)
+
+    def test_globals(self):
+        """Kernels can call other functions."""
+        from nitrous.exp.ufunc import vectorize
+        from nitrous.function import function
+
+        double = function(Double, x=Double)(scale)
+
+        @vectorize([(Double, Double)])
+        def twice(x):
+            return double(x)
+
+        self.assertEqual(twice(np.arange(3.0)).tolist(), [0.0, 2.0, 4.0])
+
+    def test_scope(self):
+        """Kernel names aren't resolved from the scope of vectorize itself."""
+        from nitrous.exp.ufunc import vectorize
+
+        with self.assertRaises(NameError):
+            @vectorize([Long], identity=1)
+            def f(x):
+                return x * identity
+
+    def test_invalid_types(self):
+        """Only scalar loops are supported."""
+        from nitrous.exp.ufunc import vectorize
+        from nitrous.types.array import Slice
+
+        with self.assertRaises(TypeError):
+            @vectorize([Slice(Double)])
+            def f(x):
+                return x